@@ -5,12 +5,62 @@ import pandas as pd
 import json
 import os
 import pickle
+import logging
+import multiprocessing
+import traceback
+from functools import partial
+from collections import defaultdict
 from datetime import date, datetime
-from pathlib import Path
 
-from gaussian_job_generator import JobGenerator
+from gaussian_job_generator import JobGenerator, BatchJobGenerator
 from gaussian_log_extractor import GaussianLogExtractor
-from helper_functions import str_chop
+from gaussian_log_parser import find_log_files, log_base_name
+from extraction_cache import ExtractionCache
+from feature_store import write_feature_store
+from helper_functions import limit_blas_threads, single_threaded_blas_environment
+
+
+logger = logging.getLogger(__name__)
+
+
+def _extract_log_features(path, options=None) -> tuple:
+    """Extract the descriptors of one log file, failures are returned as an error record instead of raised.
+
+    :param path: path of the log file
+    :param options: keyword arguments of GaussianLogExtractor, and as_frames of get_descriptors
+    :return: tuple (path, descriptors dictionary or None, error record dictionary or None)
+    """
+
+    options = dict(options or {})
+    as_frames = options.pop('as_frames', False)
+    try:
+        return path, GaussianLogExtractor(path, **options).get_descriptors(as_frames=as_frames), None
+    except Exception as e:
+        return path, None, {'conf_name': log_base_name(path), 'path': str(path), 'error': type(e).__name__,
+                            'message': str(e), 'traceback': traceback.format_exc()}
+
+
+def _conformer_name_errors(paths) -> tuple:
+    """Split log files that share a conformer name, e.g. water_conf_0.out and water_conf_0.out.gz, from the \
+    others, their descriptors would overwrite each other. None of the files of a shared name are extracted.
+
+    :param paths: paths of the log files
+    :return: tuple (paths with a unique conformer name, list of error records, one per shared conformer name)
+    """
+
+    names = defaultdict(list)
+    for path in paths:
+        names[log_base_name(path)].append(path)
+    unique_paths, errors = [], []
+    for name, name_paths in names.items():
+        if len(name_paths) == 1:
+            unique_paths.append(name_paths[0])
+            continue
+        message = (f"Not supported log files with the same conformer name {[str(p) for p in name_paths]}. "
+                   f"Allowed is one log file per conformer, remove or rename the others.")
+        errors.append({'conf_name': name, 'path': ', '.join(str(p) for p in name_paths), 'error': 'ValueError',
+                       'message': message, 'traceback': None})
+    return unique_paths, errors
 
 
 class AutoBot(object):
@@ -51,7 +101,16 @@ class AutoBot(object):
                              heavy_basis_set="LANL2DZ",
                              generic_basis_set="genecp",
                              max_light_atomic_number=36,
-                             wall_time='23:59:00') -> None:
+                             wall_time='23:59:00',
+                             screen=None) -> None:
+        """Create the Gaussian jobs of the conformers of a molecule.
+
+        :param screen: keyword arguments of Molecule.screen_conformers, e.g. {'energy_window': 5.}, to create jobs \
+        only for the conformers that pass the force field screen, an empty dict for the default screen, None for no \
+        screen. The report of the screen is saved in the molecule directory.
+        """
+
+        screen_report = molecule.screen_conformers(**screen) if screen is not None else None
 
         if not molecule.name:
             mol_workdir = os.path.join(self.workdir, molecule.inchikey)
@@ -80,26 +139,149 @@ class AutoBot(object):
         with open(str(mol_workdir + '/gaussian_config.json'), 'w') as f:
             json.dump(gaussian_config, f)
 
-    def extract_features(self):
+        if screen_report is not None:
+            with open(str(mol_workdir + '/conformer_screen.json'), 'w') as f:
+                json.dump(screen_report, f)
 
-        features = {}
-        for path in Path(self.workdir).rglob('*.out'):
-            gle = GaussianLogExtractor(path)
-            f = gle.get_descriptors()
-            conf_name = str_chop(path.name, '.out')
-            features[conf_name] = f
+    def create_gaussian_jobs_batch(self,
+                                   molecules,
+                                   workflow_type="equilibrium",
+                                   theory="APFD",
+                                   light_basis_set="6-31G(d,p)",
+                                   heavy_basis_set="LANL2DZ",
+                                   generic_basis_set="genecp",
+                                   max_light_atomic_number=36,
+                                   wall_time='23:59:00',
+                                   archive=None,
+                                   screen=None) -> None:
+        """Create the Gaussian jobs of the conformers of many molecules in one pass, see BatchJobGenerator.
 
-        # make pandas dataframe
+        :param molecules: iterable of Molecule objects, e.g. the molecules of generate_molecules
+        :param archive: archive format of the files of each molecule, 'tar', 'tar.gz' or 'tar.xz', None to write \
+        plain files
+        :param screen: keyword arguments of Molecule.screen_conformers, see create_gaussian_jobs
+        """
 
+        generator = BatchJobGenerator(self.workdir, workflow_type, theory, light_basis_set, heavy_basis_set,
+                                      generic_basis_set, max_light_atomic_number, wall_time, archive)
+
+        # save a copy of gaussian configs with each molecule
+        gaussian_config = {'workflow_type': workflow_type,
+                           'theory': theory,
+                           'light_basis_set': light_basis_set,
+                           'heavy_basis_set': heavy_basis_set,
+                           'generic_basis_set': generic_basis_set,
+                           'max_light_atomic_number': max_light_atomic_number,
+                           'wall_time': wall_time}
+
+        self.mol_list += generator.create_gaussian_files(molecules,
+                                                         {'gaussian_config.json': json.dumps(gaussian_config)},
+                                                         screen)
+
+    def extract_features(self, n_workers=1, chunksize=4, single_threaded_blas=True, extraction_cache=None,
+                         occupied_volume_radius=3, store_path=None, as_frames=False):
+        """Extract the descriptors of all log files in the workdir. Files that fail are skipped and their error \
+        records are kept in extraction_errors.
+
+        :param n_workers: number of worker processes, all cores if None, 1 extracts in this process
+        :param chunksize: number of files sent to a worker at once
+        :param single_threaded_blas: keep the BLAS of each worker single-threaded to avoid oversubscription
+        :param extraction_cache: path of an extraction cache database (see ExtractionCache), the descriptors of \
+        unchanged log files are taken from it and the new ones are stored in it, no cache if None
+        :param occupied_volume_radius: radius (Angstroms) of the sphere of the buried volumes
+        :param store_path: root directory of a parquet feature store to write the descriptors to, see feature_store
+        :param as_frames: keep the descriptors as dataframes instead of dicts of lists
+        :return: dictionary conformer name -> descriptors
+        """
+
+        features = {}
+        self.extraction_errors = []
+        for conf_name, f, error in self.iter_features(n_workers, chunksize, single_threaded_blas, extraction_cache,
+                                                      occupied_volume_radius, as_frames):
+            if error is not None:
+                self.extraction_errors.append(error)
+            else:
+                features[conf_name] = f
+
+        if store_path is not None and features:
+            write_feature_store(features, store_path)
 
         return features
 
+    def iter_features(self, n_workers=1, chunksize=4, single_threaded_blas=True, extraction_cache=None,
+                      occupied_volume_radius=3, as_frames=False):
+        """Extract the descriptors of all log files in the workdir, yielding the results as they complete. \
+        Cached descriptors come first. Log files with the same conformer name, e.g. x.out and x.out.gz, are not \
+        extracted, one error record is yielded per shared name.
+
+        :param n_workers: number of worker processes, all cores if None, 1 extracts in this process
+        :param chunksize: number of files sent to a worker at once
+        :param single_threaded_blas: keep the BLAS of each worker single-threaded to avoid oversubscription
+        :param extraction_cache: path of an extraction cache database (see ExtractionCache), the descriptors of \
+        unchanged log files are taken from it and the new ones are stored in it, no cache if None
+        :param occupied_volume_radius: radius (Angstroms) of the sphere of the buried volumes
+        :param as_frames: keep the descriptors as dataframes instead of dicts of lists
+        :return: generator of tuples (conformer name, descriptors or None, error record or None)
+        """
+
+        # plain and compressed logs, e.g. .out, .out.gz, .out.xz
+        paths, errors = _conformer_name_errors(find_log_files(self.workdir))
+        for error in errors:
+            logger.warning(f"Cannot extract descriptors from {error['path']}: {error['message']}")
+            yield error['conf_name'], None, error
+        options = {'occupied_volume_radius': occupied_volume_radius, 'as_frames': as_frames}
+        cache = ExtractionCache(extraction_cache) if extraction_cache is not None else None
+        keys = {}
+        if cache is not None:
+            missing = []
+            for path in paths:
+                keys[path] = cache.key(path, options)
+                f = cache.get(keys[path])
+                if f is None:
+                    missing.append(path)
+                else:
+                    yield log_base_name(path), f, None
+            logger.info(f"{len(paths) - len(missing)} of {len(paths)} log files found in the cache.")
+            paths = missing
+
+        extract = partial(_extract_log_features, options=options)
+        n_workers = n_workers or os.cpu_count()
+        if n_workers == 1 or len(paths) <= 1:
+            results = map(extract, paths)
+        else:
+            logger.info(f"Extracting {len(paths)} log files with {n_workers} workers.")
+            if single_threaded_blas:
+                with single_threaded_blas_environment():
+                    pool = multiprocessing.Pool(n_workers, initializer=limit_blas_threads)
+            else:
+                pool = multiprocessing.Pool(n_workers)
+            results = self._pool_results(pool, extract, paths, chunksize)
+
+        try:
+            for path, f, error in results:
+                if error is not None:
+                    logger.warning(f"Cannot extract descriptors from {error['path']}: {error['error']} "
+                                   f"{error['message']}")
+                elif cache is not None:
+                    cache.put(keys[path], f)
+                yield log_base_name(path), f, error
+        finally:
+            if cache is not None:
+                cache.close()
+
+    @staticmethod
+    def _pool_results(pool, extract, paths, chunksize):
+        """Yield the results of the pool as they complete, the pool is closed when all of them are consumed."""
+
+        with pool:
+            yield from pool.imap_unordered(extract, paths, chunksize=chunksize)
+
     def save(self, name):
         # save autobot
         pass
 
     def _find_out_files(self):
-        for path in Path(self.workdir).rglob('*.out'):
+        for path in find_log_files(self.workdir):
             print(path)
 
 
@@ -3,22 +3,18 @@
 # aka functions that need to be modified to be used on other computer clusters
 
 
-def generate_h2_job(job_generator, mol_name, conf_name):
+def h2_job_script(job_generator, mol_name):
     """
-    function to generate submission scripts for gaussian jobs on hoffman2 computer cluster at UCLA
+    content of the submission script of a gaussian job on hoffman2 computer cluster at UCLA, the script is the same
+    for all the conformers of a molecule (the input file is found from the job name)
 
     :param job_generator: JobGenerator object
     :type job_generator: gaussian_job_generator.JobGenerator
     :param mol_name: name of the molecule, or inchikey when name is not available
     :type mol_name: str
-    :param conf_name: name of the conformer with index
-    :type conf_name: str
+    :return: str
     """
 
-    file_name = str(conf_name + '.sh')
-    file_path = job_generator.directory + '/' + file_name
-
-    # write submission scripts
     to_write = '#!/bin/bash\n' \
                '#$ -cwd\n' \
                '#$ -o logs/$JOB_ID.$JOB_NAME.joblog\n' \
@@ -50,8 +46,42 @@ def generate_h2_job(job_generator, mol_name, conf_name):
                 'echo "END of input file"\n' \
                 'echo " "\n\n'
 
+    return to_write
+
+
+def generate_h2_job(job_generator, mol_name, conf_name):
+    """
+    function to generate submission scripts for gaussian jobs on hoffman2 computer cluster at UCLA
+
+    :param job_generator: JobGenerator object
+    :type job_generator: gaussian_job_generator.JobGenerator
+    :param mol_name: name of the molecule, or inchikey when name is not available
+    :type mol_name: str
+    :param conf_name: name of the conformer with index
+    :type conf_name: str
+    """
+
+    file_name = str(conf_name + '.sh')
+    file_path = job_generator.directory + '/' + file_name
+
+    # write submission scripts
     with open(file_path, 'w') as f:
-        f.write(to_write)
+        f.write(h2_job_script(job_generator, mol_name))
+
+
+def submission_line(mol_name, conf_name):
+    """
+    submit command of a conformer
+    example: qsub water/water_conf_1.sh
+
+    :param mol_name: name of the molecule, or inchikey when name is not available
+    :type mol_name: str
+    :param conf_name: name of the conformer with index
+    :type conf_name: str
+    :return: str
+    """
+
+    return 'qsub ' + mol_name + '/' + conf_name + '.sh\n'
 
 
 def write_submission_script(job_generator, mol_name, conf_name):
@@ -69,7 +99,5 @@ def write_submission_script(job_generator, mol_name, conf_name):
     file_name = 'submit.sh'
     file_path = job_generator.directory + '/../' + file_name
 
-    to_write = 'qsub ' + mol_name + '/' + conf_name + '.sh\n'
-
     with open(file_path, 'a') as f:
-        f.write(to_write)
+        f.write(submission_line(mol_name, conf_name))
@@ -0,0 +1,110 @@
+import io
+import json
+import logging
+
+import numpy as np
+import rdkit
+from rdkit import Chem
+
+try:
+    from openbabel import pybel  # openbabel 3.0.0
+except ImportError:
+    import pybel  # openbabel 2.4
+
+import sqlite_cache
+from sqlite_cache import SQLiteCache
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_smiles(smiles) -> str:
+    """Canonical smiles of RDKit, the smiles itself if RDKit cannot parse it."""
+
+    mol = Chem.MolFromSmiles(smiles)
+    return smiles if mol is None else Chem.MolToSmiles(mol)
+
+
+class ConformerCache(SQLiteCache):
+    """Persistent cache of conformational ensembles (elements, conformer coordinates, connectivity matrix, charges)
+    in a SQLite database, keyed by the canonical smiles and the generation parameters, including the versions of
+    RDKit and Open Babel, see SQLiteCache. Ensembles are stored as compressed numpy arrays."""
+
+    table = 'ensembles'
+    group_column = 'smiles'
+
+    def __init__(self, db_path, max_size=1 << 30):
+        """Open or create the cache.
+
+        :param db_path: path of the SQLite database
+        :param max_size: maximum total size (bytes) of the stored ensembles
+        """
+
+        # several processes may generate molecules with the same cache
+        super().__init__(db_path, max_size, timeout=60)
+
+    @staticmethod
+    def key(smiles, parameters) -> str:
+        """Cache key of an ensemble: canonical smiles, generation parameters and library versions.
+
+        :param smiles: smiles string
+        :param parameters: dictionary of the parameters that change the ensemble, e.g. num_conf, engine, random_seed
+        :return: str
+        """
+
+        parameters = dict(parameters, rdkit=rdkit.__version__, openbabel=getattr(pybel.ob, 'OBReleaseVersion',
+                                                                                 lambda: None)())
+        return f"{canonical_smiles(smiles)}:{json.dumps(parameters, sort_keys=True)}"
+
+    def get(self, key):
+        """Get the cached ensemble of a key.
+
+        :param key: cache key, see key
+        :return: tuple (elements, conformer_coordinates, connectivity_matrix, charges), None if not cached
+        """
+
+        blob = self._get(key)
+        if blob is None:
+            return None
+        with np.load(io.BytesIO(blob), allow_pickle=False) as arrays:
+            return (arrays['elements'].tolist(), arrays['conformer_coordinates'], arrays['connectivity_matrix'],
+                    arrays['charges'])
+
+    def put(self, key, smiles, elements, conformer_coordinates, connectivity_matrix, charges) -> None:
+        """Store the ensemble of a key and evict the least recently used entries beyond max_size.
+
+        :param key: cache key, see key
+        :param smiles: smiles string of the molecule, see invalidate
+        """
+
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, elements=np.array(elements, dtype=str),
+                            conformer_coordinates=np.asarray(conformer_coordinates, dtype=float),
+                            connectivity_matrix=np.asarray(connectivity_matrix),
+                            charges=np.asarray(charges))
+        self._put(key, canonical_smiles(smiles), buffer.getvalue())
+
+    def invalidate(self, smiles_list) -> int:
+        """Drop the cached ensembles of molecules, for all parameters.
+
+        :param smiles_list: smiles strings of the molecules
+        :return: number of entries dropped
+        """
+
+        with self.connection:
+            return sum(self._drop_group(canonical_smiles(smiles)) for smiles in smiles_list)
+
+    def stats(self) -> dict:
+        """Number of entries and molecules, and total size of the stored ensembles."""
+
+        stats = super().stats()
+        stats['molecules'] = stats.pop('groups')
+        return stats
+
+
+def main():
+    sqlite_cache.main(ConformerCache, "Inspect or invalidate a conformer cache.", "SMILES",
+                      "drop the cached ensembles of molecules")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+import gzip
+
+import numpy as np
+import pytest
+
+
+def _route(route) -> str:
+    return (" ----------------------------------------------------------------------\n"
+            f" # {route}\n"
+            " ----------------------------------------------------------------------\n")
+
+
+def _orientation(coords, atomic_numbers) -> str:
+    text = "                         Standard orientation:                         \n"
+    text += " ---------------------------------------------------------------------\n"
+    text += " Center     Atomic      Atomic             Coordinates (Angstroms)\n"
+    text += " Number     Number       Type             X           Y           Z\n"
+    text += " ---------------------------------------------------------------------\n"
+    for i, (an, c) in enumerate(zip(atomic_numbers, coords)):
+        text += f" {i + 1:6d} {an:10d} {0:11d} {c[0]:15.6f} {c[1]:11.6f} {c[2]:11.6f}\n"
+    text += " ---------------------------------------------------------------------\n"
+    text += " Rotational constants (GHZ):    825.7326252    434.8186082    285.1402011\n"
+    return text
+
+
+def _convergence(value, converged=True) -> str:
+    flag = "YES" if converged else "NO"
+    return ("         Item               Value     Threshold  Converged?\n"
+            f" Maximum Force            {value:.6f}     0.000450     {flag}\n"
+            f" RMS     Force            {value / 2:.6f}     0.000300     YES\n"
+            f" Maximum Displacement     {value * 3:.6f}     0.001800     {flag}\n"
+            f" RMS     Displacement     {value * 2:.6f}     0.001200     YES\n"
+            " Predicted change in Energy=-1.234567D-06\n")
+
+
+def _population(labels, charges) -> str:
+    text = " **********************************************************************\n\n"
+    text += "            Population analysis using the SCF density.\n\n"
+    text += " **********************************************************************\n\n"
+    text += " Alpha  occ. eigenvalues --  -19.13620  -1.00781  -0.52574  -0.37102  -0.29346\n"
+    text += " Alpha virt. eigenvalues --    0.06543   0.15012   0.80123   0.85012\n"
+    text += "          Condensed to atoms (all electrons):\n"
+    text += "              1          2          3\n"
+    text += "     1  O    8.1  0.2  0.2\n"
+    text += " Mulliken charges:\n               1\n"
+    for i, (label, q) in enumerate(zip(labels, charges)):
+        text += f" {i + 1:5d}  {label:2s} {q:11.6f}\n"
+    text += " Sum of Mulliken charges =   0.00000\n"
+    text += " Mulliken charges with hydrogens summed into heavy atoms:\n               1\n     1  O    0.000000\n"
+    return text
+
+
+def _natural_population(labels, charges) -> str:
+    text = "\n Summary of Natural Population Analysis:\n\n"
+    text += "                                       Natural Population\n"
+    text += "                Natural  -----------------------------------------------\n"
+    text += "    Atom  No    Charge         Core      Valence    Rydberg      Total\n"
+    text += " -----------------------------------------------------------------------\n"
+    for i, (label, q) in enumerate(zip(labels, charges)):
+        text += f"    {label:2s} {i + 1:4d} {q:10.5f} {1.99982:12.5f} {6.90812:11.5f} {0.00986:10.5f} {8.91780:11.5f}\n"
+    text += " =======================================================================\n"
+    text += "   * Total *    0.00000      1.99982     7.98620    0.01398    10.00000\n"
+    return text
+
+
+def _properties(extent, dipole) -> str:
+    return (f" Electronic spatial extent (au):  <R**2>=             {extent:.4f}\n"
+            " Charge=              0.0000 electrons\n"
+            " Dipole moment (field-independent basis, Debye):\n"
+            f"    X=              0.0000    Y=              0.0000    Z=             -{dipole:.4f}  "
+            f"Tot=              {dipole:.4f}\n")
+
+
+def gaussian_log_text(n_waters=1, n_steps=3, seed=0) -> str:
+    """Synthetic Gaussian 16 log of an opt, freq and TD job of n_waters water molecules in a row."""
+
+    rng = np.random.default_rng(seed)
+    water = np.array([[0, 0, 0.11779], [0, 0.75545, -0.47116], [0, -0.75545, -0.47116]])
+    atomic_numbers, labels = [8, 1, 1] * n_waters, ['O', 'H', 'H'] * n_waters
+    coords = np.concatenate([water + [3. * k, 0, 0] for k in range(n_waters)])
+    n = len(atomic_numbers)
+
+    text = " Entering Gaussian System, Link 0=g16\n Initial command:\n /opt/g16/l1.exe\n"
+    text += _route("opt=CalcFc APFD/6-31G(d,p) scf=xqc")
+    text += " 1/10=4,18=20,19=15,26=3,38=1/1,3;\n ----------\n water_conf_0\n ----------\n"
+    text += " Symbolic Z-matrix:\n Charge =  0 Multiplicity = 1\n"
+    for label, c in zip(labels, coords):
+        text += f" {label:20s}{c[0]:10.5f}{c[1]:10.5f}{c[2]:10.5f} \n"
+    text += " \n GradGradGradGradGradGradGradGradGradGradGradGradGradGradGradGradGradGrad\n"
+    energy = None
+    for step in range(n_steps):
+        text += "                          Input orientation:                          \n"
+        text += _orientation(coords + rng.normal(scale=0.01 / (step + 1), size=coords.shape), atomic_numbers)
+        text += f" NAtoms=    {n} NActive=    {n} NUniq=    2 SFac= 2.25D+00 NAtFMM=   60 NAOKFM=F Big=F\n"
+        energy = -76.38 * n_waters - 0.001 * step
+        text += f" SCF Done:  E(RAPFD) =  {energy:.10f}     A.U. after   10 cycles\n"
+        text += _convergence(0.001 / (step + 1), step == n_steps - 1)
+    text += " Optimization completed.\n    -- Stationary point found.\n"
+    charges = rng.normal(size=n) * 0.3
+    text += _population(labels, charges)
+    text += _properties(19.0, 2.0967)
+    text += " Stoichiometry    H2O\n"
+    text += " 1\\1\\GINC-N1\\FOpt\\RAPFD\\6-31G(d,p)\\H2O1\\USER\\01-Jan-2024\\0\\\\#opt\n\n"
+    text += " Normal termination of Gaussian 16 at Mon Jan  1 00:00:00 2024.\n"
+
+    text += _route("freq APFD/6-31G(d,p) volume NMR pop=NPA density=current Geom=AllCheck Guess=Read")
+    text += " Charge =  0 Multiplicity = 1\n Redundant internal coordinates taken from checkpoint file:\n"
+    text += _orientation(coords, atomic_numbers)
+    text += f" NAtoms=    {n} NActive=    {n} NUniq=    2 SFac= 2.25D+00 NAtFMM=   60 NAOKFM=F Big=F\n"
+    text += f" SCF Done:  E(RAPFD) =  {energy:.10f}     A.U. after    1 cycles\n"
+    text += " Molar volume =   123.4560 bohr**3/mol ( 11.0120 cm**3/mol)\n"
+    text += " SCF GIAO Magnetic shielding tensor (ppm):\n"
+    for i, label in enumerate(labels):
+        text += f" {i + 1:6d}  {label}    Isotropic =   {325.1 - i:.4f}   Anisotropy =    {45.1 + i:.4f}\n"
+        text += "   XX=   300.0000   YX=     0.0000   ZX=     0.0000\n"
+    text += _population(labels, charges + 0.01)
+    text += " APT charges:\n               1\n"
+    for i, (label, q) in enumerate(zip(labels, charges)):
+        text += f" {i + 1:5d}  {label:2s} {q * 0.9:11.6f}\n"
+    text += " Sum of APT charges =   0.00000\n"
+    text += _properties(19.1, 2.1)
+    text += _natural_population(labels, charges * 1.1)
+    n_modes = 3 * n - 6
+    frequencies = np.sort(rng.uniform(200, 3900, n_modes))
+    text += " Harmonic frequencies (cm**-1), IR intensities (KM/Mole), Raman scattering\n"
+    text += " activities (A**4/AMU), depolarization ratios for plane and unpolarized\n"
+    text += " incident light, reduced masses (AMU), force constants (mDyne/A),\n"
+    text += " and normal coordinates:\n"
+    for start in range(0, n_modes, 3):
+        modes = range(start, min(start + 3, n_modes))
+        text += "   " + "".join(f"{i + 1:23d}" for i in modes) + "\n"
+        text += "   " + "".join(f"{'A1':>23s}" for i in modes) + "\n"
+        text += " Frequencies --" + "".join(f"{frequencies[i]:13.4f}          " for i in modes).rstrip() + "\n"
+        text += " Red. masses --" + "".join(f"{1.08 + i * 0.01:13.4f}          " for i in modes).rstrip() + "\n"
+        text += " Frc consts  --" + "".join(f"{1.6 + i:13.4f}          " for i in modes).rstrip() + "\n"
+        text += " IR Inten    --" + "".join(f"{70.1 + i:13.4f}          " for i in modes).rstrip() + "\n"
+        text += "  Atom  AN" + "      X      Y      Z  " * len(modes) + "\n"
+        for a in range(n):
+            text += f" {a + 1:5d} {atomic_numbers[a]:3d}  " + "".join(
+                "".join(f"{v:7.2f}" for v in rng.uniform(-0.7, 0.7, 3)) + "  " for _ in modes) + "\n"
+    text += "\n -------------------\n - Thermochemistry -\n -------------------\n"
+    text += " Temperature   298.150 Kelvin.  Pressure   1.00000 Atm.\n"
+    text += " Molar Mass =    18.01056 amu.\n"
+    text += " Zero-point correction=                           0.021121 (Hartree/Particle)\n"
+    text += " Thermal correction to Energy=                    0.023956\n"
+    text += " Thermal correction to Enthalpy=                  0.024900\n"
+    text += " Thermal correction to Gibbs Free Energy=         0.003472\n"
+    text += " Sum of electronic and zero-point Energies=            -76.367600\n"
+    text += " Sum of electronic and thermal Energies=               -76.364765\n"
+    text += " Sum of electronic and thermal Enthalpies=             -76.363821\n"
+    text += " Sum of electronic and thermal Free Energies=          -76.385249\n"
+    text += _convergence(0.000011)
+    text += " Stoichiometry    H2O\n"
+    text += " Normal termination of Gaussian 16 at Mon Jan  1 00:01:00 2024.\n"
+
+    text += _route("TD(NStates=10, Root=1) APFD/6-31G(d,p) volume pop=NPA density=current Geom=AllCheck "
+                   "Guess=Read")
+    text += " Charge =  0 Multiplicity = 1\n"
+    text += _orientation(coords, atomic_numbers)
+    text += f" SCF Done:  E(RAPFD) =  {energy:.10f}     A.U. after    1 cycles\n"
+    for k in range(10):
+        text += (f" Excited State  {k + 1:2d}:      Singlet-B1     {7.1 + k:.4f} eV  {174.05 - k:.2f} nm  "
+                 f"f={0.0123 * k:.4f}  <S**2>=0.000\n")
+        text += "       5 ->  6         0.70000\n"
+    text += " Molar volume =   125.4560 bohr**3/mol ( 11.0120 cm**3/mol)\n"
+    text += _population(labels, charges - 0.01)
+    text += _properties(19.3, 2.3)
+    text += _natural_population(labels, charges * 1.2)
+    text += " Normal termination of Gaussian 16 at Mon Jan  1 00:02:00 2024.\n"
+    return text
+
+
+@pytest.fixture
+def write_gaussian_log():
+    """Function writing a synthetic Gaussian log, see gaussian_log_text. Logs ending with .gz are compressed."""
+
+    def write(path, n_waters=1, n_steps=3, seed=0, newline="\n") -> str:
+        data = gaussian_log_text(n_waters, n_steps, seed).replace("\n", newline).encode()
+        if str(path).endswith('.gz'):
+            data = gzip.compress(data)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        return str(path)
+
+    return write
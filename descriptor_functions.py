@@ -1,7 +1,10 @@
 import logging
+from functools import lru_cache
 
 import numpy as np
 import pandas as pd
+from scipy.spatial import cKDTree
+from scipy.stats import qmc
 from scipy.spatial.distance import cdist
 
 try:
@@ -19,53 +22,372 @@ except ImportError:
 logger = logging.getLogger(__name__)
 
 
-def occupied_volume(geometry_df, atom_idx, r, mesh_density=30) -> float:
-    """Compute occupied volume fraction within a sphere of radius 'r' for an atom at position 'atom_idx'. Each atom \
-    radius is taken to be its Van der Waals radius.
+# maximum density of the integration mesh of the occupied volumes
+max_mesh_density = 100
+
+
+@lru_cache(maxsize=None)
+def vdw_radius(atomic_number) -> float:
+    """Van der Waals radius (Angstroms) of an element, cached."""
+
+    return GetVdwRad(int(atomic_number))
+
+
+@lru_cache(maxsize=16)
+def sphere_mesh(r, mesh_density) -> np.ndarray:
+    """Points of a cubic mesh of mesh_density ticks per axis that lie inside a sphere of radius 'r' centered at \
+    the origin, cached. The returned array is read-only.
+
+    :param r: sphere radius in Angstroms
+    :param mesh_density: number of mesh ticks per axis
+    :return: np.ndarray of shape (n_points, 3)
+    """
+
+    ticks = np.linspace(-r, r, mesh_density)
+    x, y, z = np.meshgrid(ticks, ticks, ticks)
+    mesh = np.vstack((x.ravel(), y.ravel(), z.ravel())).T
+    mesh = mesh[cdist(mesh, np.array([[0., 0., 0.]]), metric='sqeuclidean').ravel() < r ** 2]
+    mesh.flags.writeable = False
+    return mesh
+
+
+class _OccupancyKernel(object):
+    """Counts the points of spheres centered at atoms of a geometry that lie within the Van der Waals radius of at \
+    least one atom. The atoms overlapping a sphere are found with a k-d tree.
+
+    Points are processed in blocks that fit in memory_budget bytes of buffers reused across blocks and spheres. \
+    Within a block, the overlapping atoms are tested in groups from the closest to the center and a point is no \
+    longer tested once an atom covers it."""
+
+    # number of atoms tested against the points at once
+    group_size = 8
+
+    def __init__(self, atomic_numbers, memory_budget=1 << 26, dtype=np.float64, max_points=None):
+        """Allocate the buffers of the distance computation for the atoms of a geometry.
+
+        :param atomic_numbers: atomic numbers of the atoms
+        :param memory_budget: approximate size (bytes) of the buffers of the distance computation
+        :param dtype: float type of the distance computation
+        :param max_points: maximum number of points counted at once, the buffers are not larger than needed for them
+        """
+
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.float32, np.float64):
+            raise ValueError(f"Not supported dtype {self.dtype}. Allowed dtypes are: float32, float64.")
+
+        # fetch Van der Waals radii for atoms, r
+        self.atom_r = np.array([vdw_radius(an) for an in atomic_numbers], dtype=float)
+        self.max_atom_r = self.atom_r.max(initial=0.)
+        self.coords = None
+        self.tree = None
+
+        # buffers per point: point coordinates, squared distances and differences to each atom of a group,
+        # coverage by each atom of a group, index of the point
+        point_size = 3 * self.dtype.itemsize + self.group_size * (2 * self.dtype.itemsize + 1) + \
+            np.dtype(np.intp).itemsize
+        self.block_size = int(max(1024, memory_budget // point_size))
+        if max_points is not None:
+            # an empty mesh still gets a block, range() does not take a step of 0
+            self.block_size = max(1, min(self.block_size, max_points))
+        self._points = np.empty((3, self.block_size), dtype=self.dtype)
+        self._dist_sq = np.empty((self.group_size, self.block_size), dtype=self.dtype)
+        self._diff = np.empty((self.group_size, self.block_size), dtype=self.dtype)
+        self._covered = np.empty((self.group_size, self.block_size), dtype=bool)
+
+        self._overlap_coords = None
+        self._overlap_r_sq = None
+        self.center = None
+
+    def set_geometry(self, coords) -> None:
+        """Set the coordinates of the atoms, np.ndarray of shape (n_atoms, 3)."""
+
+        self.coords = np.asarray(coords, dtype=float)
+        self.tree = cKDTree(self.coords)
+
+    def set_sphere(self, atom_idx, r) -> None:
+        """Select the atoms overlapping the sphere of radius 'r' centered at the atom at position 'atom_idx'."""
+
+        center = self.coords[atom_idx]
+
+        # candidates from the tree, then filter atoms that are certainly not in the mesh, d > R + r
+        candidates = np.array(self.tree.query_ball_point(center, r + self.max_atom_r), dtype=int)
+        atom_distances = cdist(center[np.newaxis], self.coords[candidates])[0]
+        overlap = (atom_distances - self.atom_r[candidates]) < r
+        # the closest atoms cover most of the sphere, test them first
+        overlap = candidates[overlap][np.argsort(atom_distances[overlap], kind='stable')]
+
+        self.center = center
+        self._overlap_coords = self.coords[overlap].T.astype(self.dtype)
+        self._overlap_r_sq = (self.atom_r[overlap] ** 2).astype(self.dtype)
+
+    def count_occupied(self, offsets, bounds=None):
+        """Number of occupied points of the current sphere.
+
+        :param offsets: np.ndarray of shape (n_points, 3), positions of the points relative to the center
+        :param bounds: sorted numbers of points, if given the occupied points among the first bounds[k] points are \
+        counted for each k
+        :return: int, np.ndarray of ints if bounds are given
+        """
+
+        free = []
+        n_atoms = len(self._overlap_r_sq)
+        for start in range(0, len(offsets), self.block_size):
+            m = min(self.block_size, len(offsets) - start)
+            block = self._points[:, :m]
+            np.add(offsets[start:start + m].T, self.center[:, np.newaxis], out=block, casting='same_kind')
+            indices = np.arange(start, start + m)
+            for group in range(0, n_atoms, self.group_size):
+                g, k = min(self.group_size, n_atoms - group), block.shape[1]
+                d, t, c = self._dist_sq[:g, :k], self._diff[:g, :k], self._covered[:g, :k]
+                # squared distances of each atom of the group to each remaining point, accumulated axis by axis
+                d[...] = 0
+                for axis in range(3):
+                    np.subtract(block[axis, np.newaxis], self._overlap_coords[axis, group:group + g, np.newaxis],
+                                out=t)
+                    np.square(t, out=t)
+                    np.add(d, t, out=d)
+                # mesh cells are occupied if their distances are less then Van der Waals radius of any atom
+                np.less(d, self._overlap_r_sq[group:group + g, np.newaxis], out=c)
+                # points covered by an atom are not tested against the next groups
+                remaining = ~c.any(axis=0)
+                block, indices = block[:, remaining], indices[remaining]
+                if not block.shape[1]:
+                    break
+            free.append(indices)
+
+        # indices of the free points remain sorted
+        free = np.concatenate(free) if free else np.empty(0, dtype=int)
+        if bounds is None:
+            return len(offsets) - len(free)
+        bounds = np.asarray(bounds)
+        return bounds - np.searchsorted(free, bounds)
+
+
+def occupied_volumes(geometry_df, r, mesh_density=30, atom_indices=None, memory_budget=1 << 26,
+                     dtype=np.float64) -> np.ndarray:
+    """Compute occupied volume fractions within spheres of radius 'r' centered at each atom, see occupied_volume. \
+    The sphere mesh is built once and translated to each center, and the atoms overlapping each sphere are found \
+    with a k-d tree.
+
+    Mesh points are processed in blocks that fit in memory_budget bytes of buffers reused across blocks and \
+    centers. Within a block, the overlapping atoms are visited from the closest to the center and a point is no \
+    longer tested once an atom covers it.
 
     :param geometry_df: geometry dataframe, must contain 'X', 'Y', 'Z' and 'AN' (atomic number) columns
     :type geometry_df: pd.DataFrame
-    :param atom_idx: index of the atom to use as 'central' atom
-    :type atom_idx: int
     :param r: occupied volume radius in Angstroms
     :type r: float
     :param mesh_density: density of the mesh for numerical integration (MAX=100)
     :type mesh_density: int
-    :return: float, occupied volume fraction
+    :param atom_indices: positions of the 'central' atoms, all atoms if None
+    :type atom_indices: list
+    :param memory_budget: approximate size (bytes) of the buffers of the distance computation
+    :type memory_budget: int
+    :param dtype: float type of the distance computation, np.float32 halves the memory at a small loss of precision
+    :type dtype: np.dtype
+    :return: np.ndarray of occupied volume fractions, one per central atom
     """
 
     # make sure mesh_density is not outrageous
-    max_mesh_density = 100
     if mesh_density > max_mesh_density:
-        mesh_density = max_mesh_density
         logger.warning(f"Mesh density {mesh_density} is larger than allowed "
                        f"max of {max_mesh_density}. Using {max_mesh_density} instead.")
+        mesh_density = max_mesh_density
 
-    # fetch Van der Waals radii for atoms, r
-    atom_r = geometry_df['AN'].map(GetVdwRad)
+    mesh = sphere_mesh(float(r), int(mesh_density))
+    kernel = _OccupancyKernel(geometry_df['AN'], memory_budget, dtype, max_points=len(mesh))
+    kernel.set_geometry(geometry_df[list('XYZ')].to_numpy(dtype=float))
+    if atom_indices is None:
+        atom_indices = range(len(kernel.coords))
 
-    # isolate coordinates
-    coords = geometry_df[list('XYZ')]
+    volumes = np.empty(len(atom_indices))
+    for n, atom_idx in enumerate(atom_indices):
+        kernel.set_sphere(atom_idx, r)
+        # an empty mesh (e.g. mesh_density=1) gives NaN
+        volumes[n] = np.divide(kernel.count_occupied(mesh), mesh.shape[0])
 
-    # create cubic mesh, then make it spherical, then move it into central atom
-    ticks = np.linspace(-r, r, mesh_density)
+    return volumes
+
+
+@lru_cache(maxsize=16)
+def nested_sphere_mesh(radii, mesh_density) -> tuple:
+    """Points of the mesh of the largest of nested spheres centered at the origin (see sphere_mesh), sorted by \
+    distance to the origin, cached. The smaller spheres share the points and the spacing of the largest one, a \
+    sphere of radius r then has about mesh_density * r / max(radii) ticks per axis. The returned arrays are read-only.
+
+    :param radii: sorted tuple of sphere radii in Angstroms
+    :param mesh_density: number of mesh ticks per axis over the largest sphere
+    :return: tuple (np.ndarray of shape (n_points, 3), np.ndarray of the number of points inside each sphere)
+    """
+
+    r_max = radii[-1]
+    ticks = np.linspace(-r_max, r_max, mesh_density)
     x, y, z = np.meshgrid(ticks, ticks, ticks)
     mesh = np.vstack((x.ravel(), y.ravel(), z.ravel())).T
-    mesh = mesh[cdist(mesh, np.array([[0., 0., 0.]]), metric='sqeuclidean').ravel() < r ** 2]
-    mesh = mesh + coords.iloc[atom_idx].values
+    dist_sq = cdist(mesh, np.array([[0., 0., 0.]]), metric='sqeuclidean').ravel()
+    inside = dist_sq < r_max ** 2
+    order = np.argsort(dist_sq[inside], kind='stable')
+    mesh, dist_sq = mesh[inside][order], dist_sq[inside][order]
+    bounds = np.searchsorted(dist_sq, np.square(radii), side='left')
+    mesh.flags.writeable = False
+    bounds.flags.writeable = False
+    return mesh, bounds
+
+
+def ensemble_occupied_volumes(coordinates, atomic_numbers, radii=(3,), mesh_density=30, memory_budget=1 << 26,
+                              dtype=np.float64) -> np.ndarray:
+    """Compute occupied volume fractions of every atom of every conformer of a molecule at several radii in one \
+    batch, see occupied_volumes. The Van der Waals radii, the mesh and the buffers are shared across the batch, \
+    and the spheres of all radii around an atom are evaluated in one pass over a single mesh of nested spheres, \
+    see nested_sphere_mesh.
+
+    The largest radius gives the same values as occupied_volumes. A smaller radius r is sampled with about \
+    mesh_density * r / max(radii) ticks per axis instead of mesh_density, its values differ from occupied_volumes \
+    by the resolution of this coarser mesh: up to about 0.015 at mesh_density=30 for radii down to half the largest \
+    one, and about 0.006 at mesh_density=50. Raise mesh_density for a closer agreement.
+
+    :param coordinates: np.ndarray of shape (n_conformers, n_atoms, 3), e.g. trajectory.coordinates
+    :type coordinates: np.ndarray
+    :param atomic_numbers: atomic numbers of the atoms, shared by all conformers
+    :type atomic_numbers: np.ndarray
+    :param radii: occupied volume radii in Angstroms
+    :type radii: list
+    :param mesh_density: density of the mesh for numerical integration over the largest sphere (MAX=100)
+    :type mesh_density: int
+    :param memory_budget: approximate size (bytes) of the buffers of the distance computation
+    :type memory_budget: int
+    :param dtype: float type of the distance computation
+    :type dtype: np.dtype
+    :return: np.ndarray of shape (n_conformers, n_atoms, n_radii) of occupied volume fractions, radii in the \
+    given order
+    """
+
+    # make sure mesh_density is not outrageous
+    if mesh_density > max_mesh_density:
+        logger.warning(f"Mesh density {mesh_density} is larger than allowed "
+                       f"max of {max_mesh_density}. Using {max_mesh_density} instead.")
+        mesh_density = max_mesh_density
+
+    coordinates = np.asarray(coordinates, dtype=float)
+    if coordinates.ndim != 3 or coordinates.shape[1:] != (len(atomic_numbers), 3):
+        raise ValueError(f"Not supported coordinates shape {coordinates.shape}. Allowed shape is: "
+                         f"(n_conformers, {len(atomic_numbers)}, 3).")
+
+    radii = np.asarray(radii, dtype=float)
+    order = np.argsort(radii, kind='stable')
+    sorted_radii = tuple(radii[order])
+    mesh, bounds = nested_sphere_mesh(sorted_radii, int(mesh_density))
+    kernel = _OccupancyKernel(atomic_numbers, memory_budget, dtype, max_points=len(mesh))
+
+    volumes = np.empty(coordinates.shape[:2] + (len(radii),))
+    for conformer, coords in enumerate(coordinates):
+        kernel.set_geometry(coords)
+        for atom_idx in range(len(coords)):
+            kernel.set_sphere(atom_idx, sorted_radii[-1])
+            volumes[conformer, atom_idx, order] = kernel.count_occupied(mesh, bounds) / bounds
+
+    return volumes
+
+
+@lru_cache(maxsize=4)
+def _unit_ball_sequence(n_randomizations, n_points, seed) -> np.ndarray:
+    """Scrambled Sobol points mapped uniformly into the unit ball, cached. The returned array is read-only.
+
+    :return: np.ndarray of shape (n_randomizations, n_points, 3)
+    """
+
+    sequences = []
+    for engine_seed in np.random.SeedSequence(seed).spawn(n_randomizations):
+        u = qmc.Sobol(d=3, scramble=True, seed=np.random.default_rng(engine_seed)).random(n_points)
+        # volume preserving map of the unit cube into the unit ball: radius, cosine of polar angle, azimuth
+        radius = np.cbrt(u[:, 0])
+        cos_theta = 1. - 2. * u[:, 1]
+        sin_theta = np.sqrt(1. - cos_theta ** 2)
+        phi = 2. * np.pi * u[:, 2]
+        sequences.append(radius[:, np.newaxis] * np.stack([sin_theta * np.cos(phi), sin_theta * np.sin(phi),
+                                                           cos_theta], axis=1))
+    points = np.stack(sequences)
+    points.flags.writeable = False
+    return points
+
+
+def occupied_volumes_qmc(geometry_df, r, tolerance=1e-3, atom_indices=None, n_randomizations=8,
+                         min_points=1 << 9, max_points=1 << 16, seed=0, memory_budget=1 << 26) -> tuple:
+    """Compute occupied volume fractions within spheres of radius 'r' centered at each atom by randomized \
+    quasi-Monte Carlo integration with error control, an alternative to the grid of occupied_volumes.
 
-    # filter atoms that are certainly not in the mesh, d > R + r
-    atom_distances = cdist(coords.iloc[[atom_idx]], coords)[0]
-    mesh_overlap_indices = (atom_distances - atom_r) < r
+    The fraction is averaged over n_randomizations independently scrambled Sobol sequences mapped into the sphere. \
+    The number of points per sequence starts at min_points and doubles until the standard error of the mean over \
+    the randomizations is below tolerance or max_points is reached, so atoms inside the molecule (fraction close to \
+    1) stop early while surface atoms get more points.
 
-    # compute distance of every atom to every point in the mesh (this is the longest operation)
-    distances_sq = pd.DataFrame(cdist(coords[mesh_overlap_indices], mesh, metric='sqeuclidean'),
-                                index=atom_r[mesh_overlap_indices].index)
-    # mesh cells are occupied if their distances are less then Van der Waals radius
-    # the below comparison requires matching indexes in the distances_sq matrix and atom_r series
-    occupancy = distances_sq.lt(atom_r[mesh_overlap_indices] ** 2, axis=0)
+    :param geometry_df: geometry dataframe, must contain 'X', 'Y', 'Z' and 'AN' (atomic number) columns
+    :type geometry_df: pd.DataFrame
+    :param r: occupied volume radius in Angstroms
+    :type r: float
+    :param tolerance: target absolute standard error of the occupied volume fractions
+    :type tolerance: float
+    :param atom_indices: positions of the 'central' atoms, all atoms if None
+    :type atom_indices: list
+    :param n_randomizations: number of scrambled sequences of the error estimate
+    :type n_randomizations: int
+    :param min_points: initial number of points per sequence, a power of 2
+    :type min_points: int
+    :param max_points: maximum number of points per sequence, a power of 2
+    :type max_points: int
+    :param seed: seed of the scrambling, the results are reproducible for a given seed
+    :type seed: int
+    :param memory_budget: approximate size (bytes) of the buffers of the distance computation
+    :type memory_budget: int
+    :return: tuple of np.ndarray (occupied volume fractions, standard errors), one value per central atom
+    """
+
+    for name, value in (('min_points', min_points), ('max_points', max_points)):
+        if value < 1 or value & (value - 1):
+            raise ValueError(f"Not supported {name} {value}. Allowed values are powers of 2, 1 or more.")
+    if n_randomizations < 2:
+        raise ValueError(f"Not supported n_randomizations {n_randomizations}. Allowed values are 2 or more.")
+
+    # the sequences are mostly extended by max_points / 2 points, larger extensions are counted in blocks
+    kernel = _OccupancyKernel(geometry_df['AN'], memory_budget, max_points=max(1, max_points // 2))
+    kernel.set_geometry(geometry_df[list('XYZ')].to_numpy(dtype=float))
+    if atom_indices is None:
+        atom_indices = range(len(kernel.coords))
+    unit_points = _unit_ball_sequence(n_randomizations, max(min_points, max_points), seed)
+
+    volumes, errors = np.empty(len(atom_indices)), np.empty(len(atom_indices))
+    for n, atom_idx in enumerate(atom_indices):
+        kernel.set_sphere(atom_idx, r)
+        counts = np.zeros(n_randomizations)
+        n_done, n_points = 0, min_points
+        while True:
+            # extend each sequence from n_done to n_points, the previous points are kept
+            for i in range(n_randomizations):
+                counts[i] += kernel.count_occupied(r * unit_points[i, n_done:n_points])
+            n_done = n_points
+            fractions = counts / n_done
+            error = fractions.std(ddof=1) / np.sqrt(n_randomizations)
+            if error <= tolerance or n_done >= max_points:
+                break
+            n_points *= 2
+        volumes[n], errors[n] = fractions.mean(), error
+
+    return volumes, errors
+
+
+def occupied_volume(geometry_df, atom_idx, r, mesh_density=30) -> float:
+    """Compute occupied volume fraction within a sphere of radius 'r' for an atom at position 'atom_idx'. Each atom \
+    radius is taken to be its Van der Waals radius.
 
-    # mesh cells are occupied if they are occupied by at least 1 atom
-    occupied = occupancy.any()
+    :param geometry_df: geometry dataframe, must contain 'X', 'Y', 'Z' and 'AN' (atomic number) columns
+    :type geometry_df: pd.DataFrame
+    :param atom_idx: index of the atom to use as 'central' atom
+    :type atom_idx: int
+    :param r: occupied volume radius in Angstroms
+    :type r: float
+    :param mesh_density: density of the mesh for numerical integration (MAX=100)
+    :type mesh_density: int
+    :return: float, occupied volume fraction
+    """
 
-    return occupied.sum() / mesh.shape[0]
+    return float(occupied_volumes(geometry_df, r, mesh_density, atom_indices=[atom_idx])[0])
@@ -0,0 +1,125 @@
+import os
+import json
+import pickle
+import hashlib
+import logging
+
+import sqlite_cache
+from sqlite_cache import SQLiteCache
+from gaussian_log_extractor import extractor_version
+
+
+logger = logging.getLogger(__name__)
+
+
+def file_sha256(file_path, chunk_size=1 << 20) -> str:
+    """Hash the content of a file.
+
+    :param file_path: path of the file
+    :param chunk_size: number of bytes read at once
+    :return: hex digest
+    """
+
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class ExtractionCache(SQLiteCache):
+    """Persistent cache of extracted descriptors in a SQLite database, keyed by the content hash of the log file,
+    the extractor version and the extraction options, see SQLiteCache.
+
+    The hash of a file is looked up by path, size and modification time before the file is hashed again."""
+
+    group_column = 'sha256'
+
+    def _create_tables(self) -> None:
+        super()._create_tables()
+        self.connection.execute("CREATE TABLE IF NOT EXISTS files "
+                                "(path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha256 TEXT)")
+
+    def key(self, log_file_path, options=None) -> str:
+        """Cache key of a log file: content hash, extractor version and extraction options.
+
+        :param log_file_path: path of the log file
+        :param options: dictionary of extraction options that change the descriptors
+        :return: str
+        """
+
+        return f"{self.file_hash(log_file_path)}:{extractor_version}:{json.dumps(options or {}, sort_keys=True)}"
+
+    def file_hash(self, log_file_path) -> str:
+        """Content hash of a log file, looked up by path, size and modification time before hashing the file."""
+
+        path = os.path.abspath(log_file_path)
+        stat = os.stat(path)
+        row = self.connection.execute("SELECT sha256 FROM files WHERE path = ? AND size = ? AND mtime_ns = ?",
+                                      (path, stat.st_size, stat.st_mtime_ns)).fetchone()
+        if row is not None:
+            return row[0]
+        sha = file_sha256(path)
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                                    (path, stat.st_size, stat.st_mtime_ns, sha))
+        return sha
+
+    def get(self, key):
+        """Get the cached descriptors of a key.
+
+        :param key: cache key, see key
+        :return: descriptors, None if not cached
+        """
+
+        blob = self._get(key)
+        return pickle.loads(blob) if blob is not None else None
+
+    def put(self, key, value) -> None:
+        """Store the descriptors of a key and evict the least recently used entries beyond max_size.
+
+        :param key: cache key, see key
+        :param value: descriptors
+        """
+
+        # the key starts with the hex content hash of the log file
+        self._put(key, key.split(":", 1)[0], pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def invalidate(self, log_file_paths) -> int:
+        """Drop the cached descriptors of log files, for all versions and options.
+
+        :param log_file_paths: paths of the log files
+        :return: number of entries dropped
+        """
+
+        n_dropped = 0
+        with self.connection:
+            for path in map(os.path.abspath, log_file_paths):
+                for (sha,) in self.connection.execute("SELECT sha256 FROM files WHERE path = ?", (path,)).fetchall():
+                    n_dropped += self._drop_group(sha)
+                self.connection.execute("DELETE FROM files WHERE path = ?", (path,))
+        return n_dropped
+
+    def clear(self) -> None:
+        """Drop all cached descriptors."""
+
+        with self.connection:
+            self.connection.execute("DELETE FROM files")
+        super().clear()
+
+    def stats(self) -> dict:
+        """Number of entries and files, and total size of the stored descriptors."""
+
+        stats = super().stats()
+        stats.pop('groups')
+        stats['files'] = self.connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        return stats
+
+
+def main():
+    sqlite_cache.main(ExtractionCache, "Inspect or invalidate an extraction cache.", "LOG",
+                      "drop the cached descriptors of log files")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import os
+import re
+import logging
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None  # the feature store cannot be written or read
+
+logger = logging.getLogger(__name__)
+
+# tables of the feature store, each table is a parquet dataset partitioned by molecule
+feature_tables = ['molecules', 'atoms', 'transitions', 'modes']
+
+# columns of the tables that hold text, the other columns are numbers
+text_columns = ['molecule', 'conformer', 'stoichiometry', 'label']
+
+# regex logic: conformer names are "<molecule>_conf_<number>", see JobGenerator.gaussian_files
+conformer_name_regex = re.compile(r"^(.*)_conf_\d+$")
+
+
+def molecule_name(conf_name) -> str:
+    """Name of the molecule of a conformer, the conformer name itself if it does not end with _conf_<number>."""
+
+    match = conformer_name_regex.match(conf_name)
+    return match.group(1) if match else conf_name
+
+
+def _numeric(df, table) -> pd.DataFrame:
+    """Convert the columns of a dataframe to float64, except the text columns. Charges are stored as strings in the \
+    extracted descriptors. Values that are not numbers become nan and are logged.
+
+    :param df: dataframe of descriptors
+    :param table: name of the table, for the log
+    :return: pd.DataFrame
+    """
+
+    df.columns = df.columns.map(str)
+    for column in df.columns:
+        if column in text_columns:
+            continue
+        values = pd.to_numeric(df[column], errors='coerce').astype(np.float64)
+        invalid = values.isna() & df[column].notna()
+        if invalid.any():
+            logger.warning(f"{invalid.sum()} values of column {column} of the {table} table are not numbers and are "
+                           f"stored as nan, e.g. {df[column][invalid].iloc[0]!r}.")
+        df[column] = values
+    return df
+
+
+def _keyed(df, conf_name, index_name, start=1) -> pd.DataFrame:
+    """Prepend the molecule, conformer and row index columns to a dataframe of one conformer."""
+
+    df.insert(0, index_name, np.arange(start, start + len(df), dtype=np.int32))
+    df.insert(0, 'conformer', conf_name)
+    df.insert(0, 'molecule', molecule_name(conf_name))
+    return df
+
+
+def features_to_tables(features) -> dict:
+    """Convert extracted descriptors to the four tables of the feature store.
+
+    molecules: one row per conformer with the single value descriptors
+    atoms: one row per conformer and atom_index with the atom descriptors and the atom label
+    transitions: one row per conformer and excited state with the transitions
+    modes: one row per conformer and mode_number with the mode properties, and the displacements of the mode as a
+    float32 list of n_atoms * 3 values (atom major, X Y Z)
+
+    :param features: dictionary conformer name -> descriptors, as returned by AutoBot.extract_features, \
+    entries may be dicts of lists or dataframes
+    :return: dictionary table name -> pyarrow.Table
+    """
+
+    if pa is None:
+        raise ImportError("The feature store requires the pyarrow package.")
+
+    molecules, atoms, transitions, modes = [], [], [], []
+    for conf_name, f in features.items():
+        molecules.append({'molecule': molecule_name(conf_name), 'conformer': conf_name, **f['descriptors']})
+
+        if f.get('atom_descriptors') is not None:
+            df = _numeric(pd.DataFrame(f['atom_descriptors']), 'atoms')
+            if f.get('labels') is not None and len(f['labels']) == len(df):
+                df.insert(0, 'label', list(f['labels']))
+            atoms.append(_keyed(df, conf_name, 'atom_index', start=0))
+
+        if f.get('transitions') is not None:
+            transitions.append(_keyed(_numeric(pd.DataFrame(f['transitions']), 'transitions'), conf_name, 'state'))
+
+        if f.get('modes') is not None and f.get('mode_vectors') is not None:
+            df = _numeric(pd.DataFrame(f['modes']), 'modes')
+            # long-form vectors are ordered by mode, axis and atom
+            values = np.asarray(pd.DataFrame(f['mode_vectors'])['value'], dtype=np.float32)
+            df['displacements'] = list(values.reshape(len(df), 3, -1).transpose(0, 2, 1).reshape(len(df), -1))
+            modes.append(_keyed(df, conf_name, 'mode_number'))
+
+    tables = {'molecules': pd.DataFrame(molecules),
+              'atoms': pd.concat(atoms, ignore_index=True) if atoms else pd.DataFrame(),
+              'transitions': pd.concat(transitions, ignore_index=True) if transitions else pd.DataFrame(),
+              'modes': pd.concat(modes, ignore_index=True) if modes else pd.DataFrame()}
+    tables['molecules'] = _numeric(tables['molecules'], 'molecules')
+
+    tables = {name: pa.Table.from_pandas(df, preserve_index=False) for name, df in tables.items()}
+    if tables['modes'].num_rows:
+        i = tables['modes'].schema.get_field_index('displacements')
+        tables['modes'] = tables['modes'].set_column(i, 'displacements',
+                                                     tables['modes'].column(i).cast(pa.list_(pa.float32())))
+    return tables
+
+
+def write_feature_store(features, root) -> None:
+    """Write extracted descriptors to a parquet feature store, one dataset per table partitioned by molecule. \
+    The partitions of the molecules written are replaced.
+
+    :param features: dictionary conformer name -> descriptors, see features_to_tables
+    :param root: root directory of the feature store
+    """
+
+    for name, table in features_to_tables(features).items():
+        if table.num_rows == 0:
+            continue
+        pq.write_to_dataset(table, os.path.join(root, name), partition_cols=['molecule'],
+                            existing_data_behavior='delete_matching')
+        logger.info(f"Wrote {table.num_rows} rows to the {name} table of {root}.")
+
+
+def read_feature_table(root, name, columns=None, molecules=None):
+    """Read a table of the feature store, memory-mapping the parquet files and reading only the requested columns.
+
+    :param root: root directory of the feature store
+    :param name: name of the table, see feature_tables
+    :param columns: list of columns to read, all columns if None
+    :param molecules: list of molecules to read, all molecules if None
+    :return: pyarrow.Table
+    """
+
+    if pq is None:
+        raise ImportError("The feature store requires the pyarrow package.")
+    if name not in feature_tables:
+        raise ValueError(f"Not supported table {name}. Allowed tables are: {', '.join(feature_tables)}.")
+
+    filters = [('molecule', 'in', list(molecules))] if molecules is not None else None
+    return pq.read_table(os.path.join(root, name), columns=columns, filters=filters, memory_map=True)
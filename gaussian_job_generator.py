@@ -1,15 +1,121 @@
+import io
 import os
+import json
+import time
+import tarfile
 import logging
-import yaml
+from functools import lru_cache
 
 import numpy as np
 
+import helper_classes
 import helper_functions
-import rdkit_utils
 import cluster_functions
 
+try:
+    from openbabel import pybel  # openbabel 3.0.0
+    GetSymbol = pybel.ob.GetSymbol
+except ImportError:
+    import pybel  # openbabel 2.4
+    GetSymbol = pybel.ob.OBElementTable().GetSymbol
+
 logger = logging.getLogger(__name__)
 
+# archive formats of the batch generator, format -> tarfile mode
+archive_modes = {'tar': 'w', 'tar.gz': 'w:gz', 'tar.xz': 'w:xz'}
+
+
+@lru_cache(maxsize=None)
+def route_templates(workflow_type, theory, atomic_numbers, light_basis_set, heavy_basis_set, generic_basis_set,
+                    max_light_atomic_number) -> tuple:
+    """Gaussian tasks and basis set block of a workflow for a set of elements, cached so that molecules with the \
+    same elements share them.
+
+    :param workflow_type: Gaussian workflow type, allowed types are: 'equilibrium' or 'transition_state'
+    :param atomic_numbers: sorted tuple of the atomic numbers of the elements of the molecule
+    :return: tuple (tuple of Gaussian tasks, basis set block), the basis set block is an empty string if no heavy \
+    elements are in the molecule
+    """
+
+    # group elements into light and heavy
+    light_elements = [GetSymbol(n) for n in atomic_numbers if n <= max_light_atomic_number]
+    heavy_elements = [GetSymbol(n) for n in atomic_numbers if n > max_light_atomic_number]
+    heavy_block = ""
+
+    if heavy_elements:
+        basis_set = generic_basis_set
+        heavy_block += f"{' '.join(light_elements + ['0'])}\n"
+        heavy_block += f"{light_basis_set}\n****\n"
+        heavy_block += f"{' '.join(heavy_elements + ['0'])}\n"
+        heavy_block += f"{heavy_basis_set}\n****\n"
+        heavy_block += f"\n"
+        heavy_block += f"{' '.join(heavy_elements + ['0'])}\n"
+        heavy_block += f"{heavy_basis_set}\n"
+    else:
+        basis_set = light_basis_set
+
+    if workflow_type == "equilibrium":
+        tasks = (
+            f"opt=CalcFc {theory}/{basis_set} scf=xqc", #TODO solvent
+            f"freq {theory}/{basis_set} volume NMR pop=NPA density=current Geom=AllCheck Guess=Read",
+            f'TD(NStates=10, Root=1) {theory}/{basis_set} volume pop=NPA density=current Geom=AllCheck Guess=Read'
+        )
+    elif workflow_type == "transition_state":
+        tasks = (
+            f"opt=(calcfc,ts,noeigentest) scf=xqc {theory}/{basis_set}",
+            f"freq {theory}/{basis_set} volume NMR pop=NPA density=current Geom=AllCheck Guess=Read"
+        )
+    elif workflow_type == "test":
+        tasks = (
+            f"{theory}/{basis_set}",
+        )
+    else:
+        raise ValueError(f"Not supported gaussian job type {workflow_type}. "
+                         f"Allowed types are: equilibrium, transition_state.")
+
+    return tasks, heavy_block
+
+
+def gaussian_input(tasks, heavy_block, mol_name, conf_name, resource_block, coords_block, charge,
+                   multiplicity) -> str:
+    """Content of a Gaussian input file.
+
+    :param tasks: tuple of Gaussian tasks
+    :param heavy_block: basis set block of the heavy elements, see route_templates
+    :param mol_name: molecule name
+    :param conf_name: conformation name
+    :param resource_block: resource block for the Gaussian input file
+    :param coords_block: coordinates block for the Gaussian input file
+    :param charge: molecule charge
+    :param multiplicity: molecule multiplicity
+    :return: str
+    """
+
+    output = ""
+
+    # loop through the tasks in the workflow and create input file
+    for i, task in enumerate(tasks):
+        if i == 0:  # first task is special, coordinates follow
+            output += resource_block
+            output += f"%Chk={mol_name}/{conf_name}_{i}.chk\n"
+            output += f"# {task}\n\n"
+            output += f"{conf_name}\n\n"
+            output += f"{charge} {multiplicity}\n"
+            output += f"{coords_block.strip()}\n"
+            output += f"\n"
+        else:
+            output += "\n--Link1--\n"
+            output += resource_block
+            output += f"%Oldchk={mol_name}/{conf_name}_{i - 1}.chk\n"
+            output += f"%Chk={mol_name}/{conf_name}_{i}.chk\n"
+            output += f"# {task}\n"
+            output += f"\n"
+
+        output += heavy_block  # this is an empty string if no heavy elements are in the molecule
+
+    output += f"\n\n"
+    return output
+
 
 class JobGenerator(object):
     """Generator of gaussian input files class"""
@@ -28,50 +134,53 @@ class JobGenerator(object):
 
         self.directory = directory
         self.molecule = molecule
-        # group elements into light and heavy
-        light_elements, heavy_elements = rdkit_utils.get_light_and_heavy_elements(molecule.mol, max_light_atomic_number)
-        self.heavy_block = ""
-
-        if heavy_elements:
-            basis_set = generic_basis_set
-            self.heavy_block += f"{' '.join(light_elements + ['0'])}\n"
-            self.heavy_block += f"{light_basis_set}\n****\n"
-            self.heavy_block += f"{' '.join(heavy_elements + ['0'])}\n"
-            self.heavy_block += f"{heavy_basis_set}\n****\n"
-            self.heavy_block += f"\n"
-            self.heavy_block += f"{' '.join(heavy_elements + ['0'])}\n"
-            self.heavy_block += f"{heavy_basis_set}\n"
-        else:
-            basis_set = light_basis_set
-
-        if workflow_type == "equilibrium":
-            self.tasks = (
-                f"opt=CalcFc {theory}/{basis_set} scf=xqc", #TODO solvent
-                f"freq {theory}/{basis_set} volume NMR pop=NPA density=current Geom=AllCheck Guess=Read",
-                f'TD(NStates=10, Root=1) {theory}/{basis_set} volume pop=NPA density=current Geom=AllCheck Guess=Read'
-            )
-        elif workflow_type == "transition_state":
-            self.tasks = (
-                f"opt=(calcfc,ts,noeigentest) scf=xqc {theory}/{basis_set}",
-                f"freq {theory}/{basis_set} volume NMR pop=NPA density=current Geom=AllCheck Guess=Read"
-            )
-        elif workflow_type == "test":
-            self.tasks = (
-                f"{theory}/{basis_set}",
-            )
-        else:
-            raise ValueError(f"Not supported gaussian job type {workflow_type}. "
-                             f"Allowed types are: equilibrium, transition_state.")
+        self.tasks, self.heavy_block = route_templates(workflow_type, theory,
+                                                       tuple(np.unique(molecule.atomic_numbers).tolist()),
+                                                       light_basis_set, heavy_basis_set, generic_basis_set,
+                                                       max_light_atomic_number)
 
         # resource configuration
-        with open('config.yml', 'r') as config_file:
-            config = yaml.load(config_file, Loader=yaml.FullLoader)
+        config = helper_classes.config
         self.n_processors = max(1, min(config['slurm']['max_processors'],
-                                  self.molecule.mol.GetNumAtoms() // config['slurm']['atoms_per_processor']))
+                                  self.molecule.n_atoms // config['slurm']['atoms_per_processor']))
         self.ram = self.n_processors * config['slurm']['ram_per_processor']
         self.resource_block = f"%nprocshared={self.n_processors}\n%Mem={self.ram}GB\n"
         self.wall_time = wall_time
 
+    @property
+    def mol_name(self) -> str:
+        """Name of the molecule, its InChIKey if it has no name."""
+
+        return str(self.molecule.name) if self.molecule.name else str(self.molecule.inchikey)
+
+    def gaussian_files(self) -> tuple:
+        """Build the Gaussian input files and the submission scripts of the conformers in memory.
+
+        :return: tuple (dictionary file name -> content, list of submit.sh lines)
+        """
+
+        mol_name = self.mol_name
+        job_script = cluster_functions.h2_job_script(self, mol_name)
+        charge, multiplicity = self.molecule.charge, self.molecule.spin
+
+        # coordinates of all the conformers as strings at once
+        elements = np.array(self.molecule.elements)
+        coordinates = self.molecule.conformer_coordinates.astype(str)
+
+        files, submit_lines = {}, []
+        for conf_id, conf_coord in enumerate(coordinates):
+            conf_name = f"{mol_name}_conf_{conf_id}"
+
+            # coordinates block
+            coords_block = "\n".join(f"{e} {x} {y} {z}" for e, (x, y, z) in zip(elements, conf_coord))
+
+            files[f"{conf_name}.gjf"] = gaussian_input(self.tasks, self.heavy_block, mol_name, conf_name,
+                                                       self.resource_block, coords_block, charge, multiplicity)
+            files[f"{conf_name}.sh"] = job_script
+            submit_lines.append(cluster_functions.submission_line(mol_name, conf_name))
+
+        return files, submit_lines
+
     def create_gaussian_files(self) -> None:
         """Create the actual gaussian files for each conformer of the molecule."""
 
@@ -79,75 +188,115 @@ class JobGenerator(object):
         helper_functions.cleanup_directory_files(self.directory, types=["gjf"])
         os.makedirs(self.directory, exist_ok=True)
 
-        logger.info(f"Generating Gaussian input files for {self.molecule.mol.GetNumConformers()} conformations.")
+        logger.info(f"Generating Gaussian input files for {len(self.molecule.conformer_coordinates)} conformations.")
 
-        for conf_id, conf_coord in enumerate(self.molecule.conformer_coordinates):
+        files, submit_lines = self.gaussian_files()
+        _write_files(self.directory, files)
+        with open(os.path.join(self.directory, '..', 'submit.sh'), 'a') as f:
+            f.write("".join(submit_lines))
 
-            # conformer name
-            if not self.molecule.name:
-                mol_name = str(self.molecule.inchikey)
-                conf_name = f"{self.molecule.inchikey}_conf_{conf_id}"
-            else:
-                mol_name = str(self.molecule.name)
-                conf_name = f"{self.molecule.name}_conf_{conf_id}"
 
-            # coordinates block
-            geom_np_array = np.concatenate((np.array([self.molecule.elements]).T, conf_coord), axis=1)
-            coords_block = "\n".join(map(" ".join, geom_np_array))
-
-            # create the gaussian input file
-            self._generate_gaussian_job(self.tasks,
-                                        mol_name,
-                                        conf_name,
-                                        self.resource_block,
-                                        coords_block,
-                                        self.molecule.charge,
-                                        self.molecule.spin)
-
-            # write h2 submission scripts
-            cluster_functions.generate_h2_job(self, mol_name=mol_name, conf_name=conf_name)
-            cluster_functions.write_submission_script(self, mol_name, conf_name)
-
-    def _generate_gaussian_job(self, tasks, mol_name, conf_name, resource_block, coords_block, charge, multiplicity) -> None:
+class BatchJobGenerator(object):
+    """Generator of the gaussian input files of many molecules with the same workflow and theory.
+
+    The inputs of each molecule are built in memory and written in one pass, either as files in the directory of the
+    molecule or as a single archive per molecule, and submit.sh is appended once for all the molecules."""
+
+    def __init__(self, directory, workflow_type="equilibrium", theory="APFD", light_basis_set="6-31G(d,p)",
+                 heavy_basis_set="LANL2DZ", generic_basis_set="genecp", max_light_atomic_number=36,
+                 wall_time='23:59:00', archive=None):
+        """Initialize the batch generator.
+
+        :param directory: local directory of the campaign, each molecule gets a subdirectory (or an archive) named \
+        after it
+        :param workflow_type: Gaussian workflow type, allowed types are: 'equilibrium' or 'transition_state'
+        :param archive: archive format of the files of each molecule, 'tar', 'tar.gz' or 'tar.xz', None to write \
+        plain files. Archives <directory>/<molecule>.<format> hold the files under <molecule>/, extract them in \
+        directory before submitting
         """
 
-        :param tasks: tuple of Gaussian tasks
-        :param mol_name: molecule name
-        :param conf_name: conformation name
-        :param resource_block: resource block for the Gaussian input file
-        :param coords_block: coordinates block for the Gaussian input file
-        :param light_elements: list of light elements of the molecule
-        :param heavy_elements: list of heavy elements of the molecule
-        :param charge: molecule charge
-        :param multiplicity: molecule multiplicity
+        if archive is not None and archive not in archive_modes:
+            raise ValueError(f"Not supported archive format {archive}. "
+                             f"Allowed formats are: {', '.join(archive_modes)}.")
+
+        self.directory = directory
+        self.workflow_type = workflow_type
+        self.theory = theory
+        self.light_basis_set = light_basis_set
+        self.heavy_basis_set = heavy_basis_set
+        self.generic_basis_set = generic_basis_set
+        self.max_light_atomic_number = max_light_atomic_number
+        self.wall_time = wall_time
+        self.archive = archive
+
+    def create_gaussian_files(self, molecules, extra_files=None, screen=None) -> list:
+        """Create the gaussian files of the conformers of the molecules.
+
+        :param molecules: iterable of Molecule objects
+        :param extra_files: dictionary file name -> content of files to write with the inputs of each molecule, \
+        e.g. a copy of the configuration
+        :param screen: keyword arguments of Molecule.screen_conformers, to create jobs only for the conformers that \
+        pass the force field screen, None for no screen. The report of the screen of each molecule is written with \
+        its inputs as conformer_screen.json
+        :return: list of the molecule names
         """
 
-        output = ""
-
-        # loop through the tasks in the workflow and create input file
-        for i, task in enumerate(tasks):
-            if i == 0:  # first task is special, coordinates follow
-                output += resource_block
-                output += f"%Chk={mol_name}/{conf_name}_{i}.chk\n"
-                output += f"# {task}\n\n"
-                output += f"{conf_name}\n\n"
-                output += f"{charge} {multiplicity}\n"
-                output += f"{coords_block.strip()}\n"
-                output += f"\n"
+        os.makedirs(self.directory, exist_ok=True)
+        mol_names, submit_lines = [], []
+        n_conformers = 0
+        start_time = time.perf_counter()
+        for molecule in molecules:
+            screen_report = molecule.screen_conformers(**screen) if screen is not None else None
+            generator = JobGenerator(molecule, self.workflow_type, None, self.theory, self.light_basis_set,
+                                     self.heavy_basis_set, self.generic_basis_set, self.max_light_atomic_number,
+                                     self.wall_time)
+            mol_name = generator.mol_name
+            files, lines = generator.gaussian_files()
+            files.update(extra_files or {})
+            if screen_report is not None:
+                files['conformer_screen.json'] = json.dumps(screen_report)
+
+            if self.archive is None:
+                mol_workdir = os.path.join(self.directory, mol_name)
+                helper_functions.cleanup_directory_files(mol_workdir, types=["gjf"])
+                os.makedirs(mol_workdir, exist_ok=True)
+                _write_files(mol_workdir, files)
             else:
-                output += "\n--Link1--\n"
-                output += resource_block
-                output += f"%Oldchk={mol_name}/{conf_name}_{i - 1}.chk\n"
-                output += f"%Chk={mol_name}/{conf_name}_{i}.chk\n"
-                output += f"# {task}\n"
-                output += f"\n"
+                _write_archive(os.path.join(self.directory, f"{mol_name}.{self.archive}"),
+                               archive_modes[self.archive], mol_name, files)
+
+            mol_names.append(mol_name)
+            submit_lines += lines
+            n_conformers += len(lines)
+
+        with open(os.path.join(self.directory, 'submit.sh'), 'a') as f:
+            f.write("".join(submit_lines))
+
+        logger.info(f"Generated Gaussian input files for {n_conformers} conformations of {len(mol_names)} molecules "
+                    f"in {time.perf_counter() - start_time:.1f} s.")
+        return mol_names
+
+
+def _write_files(directory, files) -> None:
+    """Write files in a directory, each with a single buffered write."""
 
-            output += self.heavy_block  # this is an empty string if no heavy elements are in the molecule
+    for file_name, content in files.items():
+        with open(os.path.join(directory, file_name), 'w') as f:
+            f.write(content)
+    logger.debug(f"Wrote {len(files)} files in {directory}")
 
-        output += f"\n\n"
 
-        file_path = f"{self.directory}/{conf_name}.gjf"
-        with open(file_path, "w") as file:
-            file.write(output)
+def _write_archive(path, mode, mol_name, files) -> None:
+    """Write files in a tar archive under the directory mol_name."""
 
-        logger.debug(f"Generated a Gaussian input file in {file_path}")
+    mtime = time.time()
+    with tarfile.open(path, mode) as archive:
+        for file_name, content in files.items():
+            data = content.encode()
+            info = tarfile.TarInfo(f"{mol_name}/{file_name}")
+            info.size = len(data)
+            info.mtime = mtime
+            # submission scripts are executable
+            info.mode = 0o755 if file_name.endswith('.sh') else 0o644
+            archive.addfile(info, io.BytesIO(data))
+    logger.debug(f"Wrote {len(files)} files in {path}")
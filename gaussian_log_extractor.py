@@ -1,15 +1,116 @@
+import os
 import re
+import mmap
+import time
 import logging
+from functools import cached_property
 
 import pandas as pd
 import numpy as np
 
 import descriptor_functions
+import helper_classes
+from gaussian_log_parser import BlockSpec, GaussianLogScanner, LogIndex, ScalarDescriptorScanner, \
+    log_compression, open_log
 
 
 logger = logging.getLogger(__name__)
+# version of the extracted descriptors, bump when the output of get_descriptors changes (see extraction_cache)
+extractor_version = 1
 float_or_int_regex = "[-+]?[0-9]*\.[0-9]+|[0-9]+"
 
+# single value descriptors of the freq and opt parts
+freq_single_value_desc_list = [
+    {"name": "number_of_atoms", "prefix": "NAtoms=\s*", "type": int},
+    {"name": "charge", "prefix": "Charge\s=\s*", "type": int},
+    {"name": "multiplicity", "prefix": "Multiplicity\s=\s*", "type": int},
+    {"name": "dipole", "prefix": "Dipole moment \(field-independent basis, Debye\):.*?Tot=\s*", "type": float},
+    {"name": "molar_mass", "prefix": "Molar Mass =\s*", "type": float},
+    {"name": "molar_volume", "prefix": "Molar volume =\s*", "type": float},
+    {"name": "electronic_spatial_extent", "prefix": "Electronic spatial extent\s+\(au\):\s+<R\*\*2>=\s*",
+     "type": float},
+    {"name": "E_scf", "prefix": "SCF Done:\s+E.*?=\s*", "type": float},
+    {"name": "zero_point_correction", "prefix": "Zero-point correction=\s*", "type": float},
+    {"name": "E_thermal_correction", "prefix": "Thermal correction to Energy=\s*", "type": float},
+    {"name": "H_thermal_correction", "prefix": "Thermal correction to Enthalpy=\s*", "type": float},
+    {"name": "G_thermal_correction", "prefix": "Thermal correction to Gibbs Free Energy=\s*", "type": float},
+    {"name": "E_zpe", "prefix": "Sum of electronic and zero-point Energies=\s*", "type": float},
+    {"name": "E", "prefix": "Sum of electronic and thermal Energies=\s*", "type": float},
+    {"name": "H", "prefix": "Sum of electronic and thermal Enthalpies=\s*", "type": float},
+    {"name": "G", "prefix": "Sum of electronic and thermal Free Energies=\s*", "type": float},
+]
+
+# single value descriptors of the TD part
+td_single_value_desc_list = [
+    {"name": "ES_root_dipole", "prefix": "Dipole moment \(field-.*?, Debye\):.*?Tot=\s*", "type": float},
+    {"name": "ES_root_molar_volume", "prefix": "Molar volume =\s*", "type": float},
+    {"name": "ES_root_electronic_spatial_extent",
+     "prefix": "Electronic spatial extent\s+\(au\):\s+<R\*\*2>=\s*", "type": float},
+]
+
+# one-pass scanners of the single value descriptors, compiled once, see register_scalar_descriptor
+freq_scalar_scanner = ScalarDescriptorScanner(freq_single_value_desc_list, float_or_int_regex)
+td_scalar_scanner = ScalarDescriptorScanner(td_single_value_desc_list, float_or_int_regex)
+
+
+def _single_value_block_spec(desc) -> BlockSpec:
+    """Block spec of a single value descriptor: the value line, or the lines from the first to the last
+    segment of a multi-line prefix (segments are separated by '.*?')."""
+
+    segments = desc['prefix'].split(".*?")
+    if len(segments) == 1:
+        return BlockSpec(desc['name'], f"{desc['prefix']}({float_or_int_regex})")
+    return BlockSpec(desc['name'], segments[0], f"{segments[-1]}({float_or_int_regex})", end_on_start_line=True)
+
+
+# line anchors of the blocks searched by the regexes below, the streaming engine keeps only these windows of the log
+block_specs = [
+    BlockSpec('z_matrix', "Multiplicity = \d$", "^\s*$", scope='log'),
+    BlockSpec('orientation', "Standard orientation:", "Rotational constants", scope='log', occurrence='last'),
+    BlockSpec('harmonic', "Harmonic frequencies", "Thermochemistry"),
+    BlockSpec('stoichiometry', "Stoichiometry\s*\w"),
+    BlockSpec('convergence', "Maximum Force", "\sPredicted change"),
+    BlockSpec('population', "Population", "Condensed"),
+    BlockSpec('mulliken', "Mulliken charges", "Sum of Mulliken"),
+    BlockSpec('mulliken_atomic', "Mulliken atomic charges", "Sum of Mulliken"),
+    BlockSpec('apt', "APT charges", "Sum of APT"),
+    BlockSpec('apt_atomic', "APT atomic charges", "Sum of APT"),
+    BlockSpec('npa', "Summary of Natural Population Analysis:", "^\s=+$"),
+    BlockSpec('nmr', "Isotropic\s=", occurrence='all'),
+    BlockSpec('excited_states', "Excited State", occurrence='all'),
+] + [_single_value_block_spec(desc) for desc in freq_single_value_desc_list + td_single_value_desc_list]
+
+
+def register_scalar_descriptor(name, prefix, type=float, section='freq') -> None:
+    """Add a single value descriptor to the descriptors extracted from the log. The value is the number following \
+    the first match of the prefix in the section, it is found in the same pass as the built-in descriptors.
+
+    :param name: name of the descriptor
+    :param prefix: regex preceding the value, it must begin with a literal character, segments separated by '.*?' \
+    may span several lines
+    :param type: type of the value, int or float
+    :param section: 'freq' for descriptors of the freq and opt parts, 'TD' for descriptors of the TD part
+    :return: None
+    """
+
+    scanners = {'freq': freq_scalar_scanner, 'TD': td_scalar_scanner}
+    if section not in scanners:
+        raise ValueError(f"Not supported section {section}. Allowed sections are: freq, TD.")
+    if name in freq_scalar_scanner.patterns or name in td_scalar_scanner.patterns:
+        raise ValueError(f"Descriptor {name} is already registered.")
+
+    desc = {"name": name, "prefix": prefix, "type": type}
+    scanners[section].add(desc)
+    block_specs.append(_single_value_block_spec(desc))
+
+
+# blocks followed by GaussianLogFollower, every occurrence is notified to the OptimizationTracker
+follower_block_specs = [
+    BlockSpec('orientation', "Standard orientation:", "Rotational constants", scope='log', occurrence='last'),
+    BlockSpec('scf', "SCF Done:", scope='log', occurrence='last'),
+    BlockSpec('convergence', "Maximum Force", "\sPredicted change", scope='log', occurrence='last'),
+]
+
 
 class NegativeFrequencyException(Exception):
     """Raised when a negative frequency is found in the Gaussian log file. The geometry did not converge,
@@ -31,27 +132,61 @@ class OptimizationIncompleteException(Exception):
 class GaussianLogExtractor(object):
     """"""
 
-    def __init__(self, log_file_path):
+    # lazy attributes -> cached values they are computed from, or computed from them
+    lazy_attributes = {
+        'labels': ('labels', '_freq_part'),
+        'geom': ('geom', 'vbur'),
+        'vbur': ('vbur',),
+        'vibrations': ('vibrations',),
+        'modes': ('vibrations',),
+        'mode_vectors': ('vibrations',),
+        'freq_descriptors': ('_freq_part',),
+        'atom_freq_descriptors': ('_freq_part',),
+        'td_descriptors': ('_td_part',),
+        'atom_td_descriptors': ('_td_part',),
+        'transitions': ('_td_part',),
+        'trajectory': ('trajectory',),
+    }
+
+    def __init__(self, log_file_path, engine='regex', persist_index=False, occupied_volume_radius=3):
         """Initialize the log extractor. Extract molecule geometry and atom labels.
 
-        :param log_file_path: local path of the log file
+        :param log_file_path: local path of the log file, plain text or compressed with gzip, bz2, xz or zstd
+        :param engine: 'regex' reads the whole log and searches it with regexes, 'stream' scans the log in a \
+        single pass and keeps only the blocks of text the descriptors are extracted from, 'mmap' memory-maps the \
+        log and keeps only the byte offsets of the blocks, which are decoded when a descriptor needs them
+        :param persist_index: 'mmap' engine only, save the byte-offset index beside the log file and reuse it \
+        when the log is opened again. Compressed logs cannot be memory-mapped, they use the 'stream' engine
+        :param occupied_volume_radius: radius (Angstroms) of the sphere of the buried volumes
         """
 
-        with open(log_file_path) as f:
-            self.log = f.read()
-
-        # initialize descriptors
-        self.descriptors = {}
-        self.atom_freq_descriptors = None
-        self.atom_td_descriptors = None
-        self.atom_descriptors = None
-        self.vbur = None
-        self.modes = None
-        self.mode_vectors = None
-        self.transitions = None
-        self.n_tasks = len(re.findall("Normal termination", self.log))
-
-        self._split_parts()  # split parts
+        self.log_file_path = log_file_path
+        self.occupied_volume_radius = occupied_volume_radius
+        self._mmap = None
+        if engine == 'mmap' and log_compression(log_file_path) is not None:
+            logger.info(f"Log file {log_file_path} is compressed, using the stream engine instead of mmap.")
+            engine = 'stream'
+        if engine not in ('regex', 'stream', 'mmap'):
+            raise ValueError(f"Not supported engine {engine}. Allowed engines are: regex, stream, mmap.")
+        self.engine = engine
+        self.persist_index = persist_index
+        self._read()
+
+    def _read(self) -> None:
+        """Read the log file with the engine: the whole text, the blocks of text or the byte-offset index."""
+
+        if self.engine == 'regex':
+            with open_log(self.log_file_path) as f:
+                self.log = f.read()
+            self.n_tasks = len(re.findall("Normal termination", self.log))
+            self._split_parts()  # split parts
+        elif self.engine == 'stream':
+            self.log = None
+            self._scan(self.log_file_path)
+        else:
+            self.log = None
+            self.close()
+            self._map(self.log_file_path, self.persist_index)
 
     def check_for_exceptions(self):
         """Go through the log file and look for known exceptions, truncated file, negative frequencies,
@@ -60,34 +195,38 @@ class GaussianLogExtractor(object):
         :return: None
         """
         try:
-            self.get_atom_labels()  # fetch atom labels
-            self.get_geometry()  # fetch geometries for each log section
+            self.labels  # fetch atom labels
+            self.geom  # fetch geometries for each log section
         except IndexError:
             raise NoGeometryException()
 
-        try:
-            self._get_frequencies_and_moment_vectors()  # fetch vibration table and vectors
-            freqs = [*map(float, self.modes['Frequencies'])]  # extract frequencies
-            if [*filter(lambda x: x < 0., freqs)]:  # check for negative frequencies
-                raise NegativeFrequencyException()
-        except TypeError:  # no frequencies
+        if self.vibrations is None:  # no frequencies
             raise OptimizationIncompleteException()
+        if (self.vibrations.frequencies < 0.).any():  # check for negative frequencies
+            raise NegativeFrequencyException()
 
-    def get_descriptors(self) -> dict:
-        """Extract and retrieve all descriptors as a dictionary.
+    def get_descriptors(self, only=None, as_frames=False) -> dict:
+        """Extract and retrieve descriptors as a dictionary. Only the pieces needed for the requested entries \
+        are parsed, e.g. buried volumes are not computed unless 'atom_descriptors' is requested.
 
-        :return: Dictionary of all extracted descriptors
+        :param only: list of entries to retrieve among 'descriptors', 'atom_descriptors', 'modes', \
+        'mode_vectors', 'transitions' and 'labels', all entries if None
+        :param as_frames: keep the dataframes instead of converting them to dicts of lists
+        :return: Dictionary of the extracted descriptors
         """
 
-        self._extract_descriptors()
-        # concatenate atom_desciptors from various sources
-        self.atom_descriptors = pd.concat([self.geom[list('XYZ')],
-                                           self.vbur,
-                                           self.atom_freq_descriptors,
-                                           self.atom_td_descriptors], axis=1)
+        keys_to_save = ['descriptors', 'atom_descriptors', 'modes', 'mode_vectors', 'transitions', 'labels']
+        if only is not None:
+            unknown = set(only) - set(keys_to_save)
+            if unknown:
+                raise ValueError(f"Not supported entries {sorted(unknown)}. Allowed entries are: "
+                                 f"{', '.join(keys_to_save)}.")
+            keys_to_save = [key for key in keys_to_save if key in only]
+
+        dictionary = {key: getattr(self, key) for key in keys_to_save}
+        if as_frames:
+            return dictionary
 
-        keys_to_save = ['labels', 'descriptors', 'atom_descriptors', 'transitions', 'modes', 'mode_vectors', ]
-        dictionary = {key: value for key, value in self.__dict__.items() if key in keys_to_save}
         # convert dataframes to dicts
         for key, value in dictionary.items():
             if isinstance(value, pd.DataFrame):
@@ -95,24 +234,126 @@ class GaussianLogExtractor(object):
 
         return dictionary
 
+    def invalidate(self, *names) -> None:
+        """Drop cached values so that they are parsed again on next access. Values computed together with or \
+        from an invalidated value are dropped as well.
+
+        :param names: names of the lazy attributes to invalidate, see lazy_attributes, all of them if empty, the \
+        log file is then read again, e.g. after it was appended to
+        """
+
+        unknown = set(names) - set(self.lazy_attributes)
+        if unknown:
+            raise ValueError(f"Not supported attributes {sorted(unknown)}. Allowed attributes are: "
+                             f"{', '.join(self.lazy_attributes)}.")
+        for name in names or self.lazy_attributes:
+            for cached in self.lazy_attributes[name]:
+                self.__dict__.pop(cached, None)
+        if not names:
+            self._read()
+
     def _extract_descriptors(self) -> None:
         """Extract all descriptor presets: buried volumes, vibrational modes, freq part descriptors and \
         and td part descriptors"""
 
         logger.debug(f"Extracting descriptors.")
-        self.get_atom_labels()  # atom labels
-        self.get_geometry()  # geometry
-        self._compute_occupied_volumes()  # compute buried volumes
-        self._get_frequencies_and_moment_vectors()
-        self._get_freq_part_descriptors()  # fetch descriptors from frequency section
-        self._get_td_part_descriptors()  # fetch descriptors from TD section
-
-    def get_atom_labels(self) -> None:
+        self.labels  # atom labels
+        self.geom  # geometry
+        self.vbur  # compute buried volumes
+        self.vibrations
+        self._freq_part  # fetch descriptors from frequency section
+        self._td_part  # fetch descriptors from TD section
+
+    @property
+    def descriptors(self) -> dict:
+        """Single value descriptors of the freq and TD parts."""
+
+        return {**self.freq_descriptors, **self.td_descriptors}
+
+    @property
+    def atom_descriptors(self) -> pd.DataFrame:
+        """Atom descriptors concatenated from the geometry, buried volumes, freq and TD parts."""
+
+        return pd.concat([self.geom[list('XYZ')],
+                          self.vbur,
+                          self.atom_freq_descriptors,
+                          self.atom_td_descriptors], axis=1)
+
+    @property
+    def modes(self) -> pd.DataFrame:
+        """Vibrational modes dataframe, a view of the vibrations arrays, None if the log has no frequencies."""
+
+        return None if self.vibrations is None else self.vibrations.modes_frame()
+
+    @property
+    def mode_vectors(self) -> pd.DataFrame:
+        """Moment vectors of the vibrational modes as a long-form dataframe, a view of the vibrations arrays, \
+        None if the log has no frequencies."""
+
+        return None if self.vibrations is None else self.vibrations.mode_vectors_frame()
+
+    @property
+    def freq_descriptors(self) -> dict:
+        """Single value descriptors of the freq part."""
+
+        return self._freq_part[0]
+
+    @property
+    def atom_freq_descriptors(self) -> pd.DataFrame:
+        """Atom descriptors of the freq part, None if the log has no freq part."""
+
+        return self._freq_part[1]
+
+    @property
+    def td_descriptors(self) -> dict:
+        """Single value descriptors of the TD part."""
+
+        return self._td_part[0]
+
+    @property
+    def transitions(self) -> pd.DataFrame:
+        """Excited state transitions of the TD part, None if the log has no TD part."""
+
+        return self._td_part[1]
+
+    @property
+    def atom_td_descriptors(self) -> pd.DataFrame:
+        """Atom descriptors of the TD part, None if the log has no TD part."""
+
+        return self._td_part[2]
+
+    def get_atom_labels(self) -> list:
+        """Find the the z-matrix and collect atom labels, same as the labels attribute."""
+
+        return self.labels
+
+    def get_geometry(self) -> pd.DataFrame:
+        """Extract geometry dataframe from the log, same as the geom attribute."""
+
+        return self.geom
+
+    def _get_frequencies_and_moment_vectors(self) -> None:
+        """Extract the vibrational modes and their moment vectors, see the vibrations attribute."""
+
+        self.vibrations
+
+    def _get_freq_part_descriptors(self) -> None:
+        """Extract descriptors from frequency part, see the freq_descriptors and atom_freq_descriptors attributes."""
+
+        self._freq_part
+
+    def _get_td_part_descriptors(self) -> None:
+        """Extract descriptors from TD part, see the td_descriptors, transitions and atom_td_descriptors attributes."""
+
+        self._td_part
+
+    @cached_property
+    def labels(self) -> list:
         """Find the the z-matrix and collect atom labels."""
 
         # regex logic, fetch part between "Multiplicity =\d\n" and a double line
         # break (empty line may contain spaces)
-        z_matrix = re.findall("Multiplicity = \d\n(.*?)\n\s*\n", self.log, re.DOTALL)[0]
+        z_matrix = re.findall("Multiplicity = \d\n(.*?)\n\s*\n", self._get_text('z_matrix'), re.DOTALL)[0]
         z_matrix = list(map(str.strip, z_matrix.split("\n")))
         # clean up extra lines if present
         if z_matrix[0].lower().startswith(('redundant', 'symbolic')):
@@ -121,23 +362,25 @@ class GaussianLogExtractor(object):
             z_matrix = z_matrix[:-1]
 
         # fetch labels checking either space or comma split
-        self.labels = []
+        labels = []
         for line in z_matrix:
             space_split = line.split()
             comma_split = line.split(",")
             if len(space_split) > 1:
-                self.labels.append(space_split[0])
+                labels.append(space_split[0])
             elif len(comma_split) > 1:
-                self.labels.append(comma_split[0])
+                labels.append(comma_split[0])
             else:
                 raise Exception("Cannot fetch labels from geometry block")
+        return labels
 
-    def get_geometry(self) -> None:
+    @cached_property
+    def geom(self) -> pd.DataFrame:
         """Extract geometry dataframe from the log."""
 
         # regex logic: find parts between "Standard orientation.*X Y Z" and "Rotational constants"
         geoms = re.findall("Standard orientation:.*?X\s+Y\s+Z\n(.*?)\n\s*Rotational constants",
-                           self.log, re.DOTALL)
+                           self._get_text('orientation'), re.DOTALL)
 
         # use the last available geometry block
         geom = geoms[-1]
@@ -153,14 +396,169 @@ class GaussianLogExtractor(object):
             pd.DataFrame(geom_arr[:, 3:].astype(float), columns=list('XYZ'))
         ], axis=1)
 
-        self.geom = geom_df
+        return geom_df
+
+    @cached_property
+    def trajectory(self) -> helper_classes.trajectory:
+        """Extract every step of the optimization: geometries, SCF energies and convergence criteria.
 
-    def _compute_occupied_volumes(self, radius=3) -> None:
+        :return: helper_classes.trajectory, None if the log has no 'opt' part
+        """
+
+        logger.debug("Extracting optimization trajectory.")
+        if 'opt' not in self.parts:
+            logger.info("Output file does not have an 'opt' part. Cannot extract trajectory.")
+            return None
+
+        # collect the blocks of every step of the opt part in one more pass over the log
+        blocks = {spec.kind: [] for spec in follower_block_specs}
+
+        def collect(kind, text, part_name):
+            if part_name == 'opt':
+                blocks[kind].append(text)
+
+        self._rescan(GaussianLogScanner(follower_block_specs, on_block=collect))
+
+        # geometries, all steps are converted to floats at once, rows: center, atomic number, type, X, Y, Z
+        geoms = re.findall("Standard orientation:.*?X\s+Y\s+Z\n(.*?)\n\s*Rotational constants",
+                           "".join(blocks['orientation']), re.DOTALL)
+        if not geoms:
+            logger.warning("Log file does not contain optimization geometries.")
+            return None
+        rows = [line for geom in geoms for line in geom.splitlines() if "--" not in line]  # drop lines of "---"
+        geoms = np.array(" ".join(rows).split(), dtype=float).reshape(len(geoms), -1, 6)
+        n_steps = len(geoms)
+
+        # SCF energies and convergence tables of each step, missing values are nan
+        energies = np.full(n_steps, np.nan)
+        values = re.findall(f"SCF Done:\s+E.*?=\s*({float_or_int_regex})", "".join(blocks['scf']))[:n_steps]
+        energies[:len(values)] = np.array(values, dtype=float)
+
+        criteria = helper_classes.trajectory.criteria
+        convergence = np.full((n_steps, len(criteria)), np.nan)
+        thresholds = np.full(len(criteria), np.nan)
+        converged = np.zeros((n_steps, len(criteria)), dtype=bool)
+        for step, table in enumerate(blocks['convergence'][:n_steps]):
+            for name, value, threshold, flag in re.findall(f"^\s(\w+\s+\w+)\s+({float_or_int_regex})"
+                                                           f"\s+({float_or_int_regex})\s+(YES|NO)\s*$",
+                                                           table, re.MULTILINE):
+                name = " ".join(name.split())
+                if name in criteria:
+                    i = criteria.index(name)
+                    convergence[step, i], thresholds[i] = float(value), float(threshold)
+                    converged[step, i] = flag == 'YES'
+
+        return helper_classes.trajectory(atomic_numbers=geoms[0, :, 1].astype(int),
+                                         coordinates=np.ascontiguousarray(geoms[:, :, 3:]), energies=energies,
+                                         convergence=convergence, thresholds=thresholds, converged=converged)
+
+    @cached_property
+    def vbur(self) -> pd.Series:
+        """Buried volumes of each atom in the molecule."""
+
+        return self._compute_occupied_volumes(self.occupied_volume_radius)
+
+    def _compute_occupied_volumes(self, radius=3) -> pd.Series:
         """Calculate occupied volumes for each atom in the molecule."""
 
         logger.debug(f"Computing buried volumes within radius: {radius} Angstroms.")
-        self.vbur = pd.Series(self.geom.index.map(lambda i: descriptor_functions.occupied_volume(self.geom, i, radius)),
-                              name='VBur')
+        return pd.Series(descriptor_functions.occupied_volumes(self.geom, radius), index=self.geom.index, name='VBur')
+
+    def _rescan(self, scanner) -> None:
+        """Scan the whole log again from the source of the engine: the log text, the memory map or the file."""
+
+        if self.engine == 'regex':
+            scanner.feed(self.log)
+            scanner.close()
+        elif self.engine == 'mmap':
+            if self._mmap is not None:
+                scanner.scan_buffer(self._mmap)
+        else:
+            with open_log(self.log_file_path) as f:
+                scanner.scan(f)
+
+    def _scan(self, log_file_path) -> None:
+        """Read the log file in a single pass and keep the blocks of text of each gaussian task."""
+
+        scanner = GaussianLogScanner(block_specs)
+        with open_log(log_file_path) as f:
+            scanner.scan(f)
+
+        self.n_tasks = scanner.n_tasks
+        self.parts = scanner.parts
+        self._log_blocks = scanner.log_blocks
+
+    def _map(self, log_file_path, persist_index) -> None:
+        """Memory-map the log file and load or build its byte-offset index."""
+
+        with open(log_file_path, "rb") as f:
+            # an empty file cannot be mapped, it has no tasks and no blocks
+            if os.fstat(f.fileno()).st_size > 0:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        index = LogIndex.load(log_file_path, block_specs) if persist_index else None
+        if index is None:
+            scanner = GaussianLogScanner(block_specs, keep_text=False)
+            if self._mmap is not None:
+                scanner.scan_buffer(self._mmap)
+            index = LogIndex.from_scanner(scanner)
+            if persist_index:
+                try:
+                    index.save(log_file_path, block_specs)
+                except OSError as e:
+                    logger.warning(f"Cannot save the index of {log_file_path}: {e}")
+
+        self.index = index
+        self.n_tasks = index.n_tasks
+        self.parts = index.parts
+        self._log_blocks = index.log_blocks
+
+    def close(self) -> None:
+        """Release the memory map of the log file, 'mmap' engine only."""
+
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _get_text(self, kind, part_name=None) -> str:
+        """Get the text to search for a block of a given kind. The regex engine searches the whole log or \
+        part, the stream engine only the block window kept by the scanner, the mmap engine decodes the byte \
+        ranges of the block from the memory map.
+
+        :param kind: kind of the block, see block_specs
+        :param part_name: name of the gaussian task, None for blocks searched in the whole log
+        :return: str
+        """
+
+        if self.engine == 'regex':
+            return self.log if part_name is None else self.parts[part_name]
+        blocks = self._log_blocks if part_name is None else self.parts[part_name]
+        if self.engine == 'stream':
+            return blocks.get(kind, "")
+        return "".join(self._mmap[start:end].decode('utf-8', errors='replace').replace("\r\n", "\n")
+                       for start, end in blocks.get(kind, []))
+
+    def _scalar_values(self, scanner, part_name) -> dict:
+        """Find the values of the single value descriptors of a scanner in a part. The regex engine scans the \
+        whole part once, the other engines search the block window kept for each descriptor.
+
+        :param scanner: ScalarDescriptorScanner
+        :param part_name: name of the gaussian task
+        :return: dict name -> value string, descriptors that are not found are missing
+        """
+
+        if self.engine == 'regex':
+            return scanner.search(self.parts[part_name])
+        values = {}
+        for name in scanner.patterns:
+            values.update(scanner.search(self._get_text(name, part_name), [name]))
+        return values
 
     def _split_parts(self) -> None:
         """Split the log file into parts that correspond to gaussian tasks."""
@@ -173,117 +571,107 @@ class GaussianLogExtractor(object):
             name = re.search("^\w+", p).group(0)
             self.parts[name] = p
 
-    def _get_frequencies_and_moment_vectors(self) -> None:
-        """Extract the vibrational modes and their moment vectors."""
+    @cached_property
+    def vibrations(self) -> helper_classes.vibrations:
+        """Extract the vibrational modes and their moment vectors into arrays.
+
+        :return: helper_classes.vibrations, None if the log has no frequencies
+        """
 
         logger.debug("Extracting vibrational frequencies and moment vectors.")
         if 'freq' not in self.parts:
             logger.info("Output file does not have a 'freq' part. Cannot extract frequencies.")
-            return
+            return None
 
         try:
-            # regex logic: text between "Harmonic... normal coordinates and Thermochemistry, preceeded by a line of "---"
+            # regex logic: text between "Harmonic... normal coordinates and Thermochemistry, preceeded by a line
+            # of "---"
             freq_part = re.findall("Harmonic frequencies.*normal coordinates:\s*(\n.*?)\n\n\s-+\n.*Thermochemistry",
-                                   self.parts['freq'], re.DOTALL)[0]
+                                   self._get_text('harmonic', 'freq'), re.DOTALL)[0]
 
             # split each section of text with frequencies
             # regex logic, each frequency part ends with a \s\d+\n, note: we do not use DOTALL here!
             freq_sections = re.split("\n.*?\s\d+\n", freq_part)[1:]
 
-            freq_dfs, vector_dfs = [], []
+            # property rows and normal coordinates of each section
+            sections = []
             for freq_section in freq_sections:
-                # frequencies
-                freqs = re.findall("\n(\s\w+.*?)\n\s+Atom", freq_section, re.DOTALL)[0]
-                freqs = [text.split("--") for text in freqs.splitlines()]
-                freqs = [[item[0].strip()] + item[1].split() for item in freqs]
-                freqs = np.array(freqs).T.tolist()
-                freq_dfs.append(pd.DataFrame(freqs[1:], columns=[name.replace(".", "") for name in freqs[0]]))
-
-                # vectors
-                vectors = re.findall("\n(\s+Atom.*)", freq_section, re.DOTALL)[0]
-                vectors = [text.split() for text in vectors.splitlines()]
-                vector_df = pd.DataFrame(vectors[1:], columns=vectors[0])
-                vector_df.drop(["Atom", "AN"], axis=1, inplace=True)
-                vector_dfs.append(vector_df)
-
-            # combine into one frame
-            frequencies = pd.concat(freq_dfs)
-            frequencies['mode_number'] = range(1, len(frequencies) + 1)
-            self.modes = frequencies.set_index('mode_number').astype(float)
-
-            vectors = pd.concat(vector_dfs, axis=1).astype(float)
-            vectors.columns = pd.MultiIndex.from_product([list(range(1, len(frequencies) + 1)), ['X', 'Y', 'Z'], ])
-            vectors.columns.names = ['mode_number', 'axis']
-            vectors = vectors.unstack().reset_index(level=2, drop=True).to_frame('value').reset_index()
-            self.mode_vectors = vectors
+                properties, vectors = re.split("\n\s+Atom.*\n", freq_section, maxsplit=1)
+                rows = [line.split("--") for line in properties.splitlines()[1:]]
+                sections.append(({name.strip().replace(".", ""): values.split() for name, values in rows}, vectors))
+
+            # fill preallocated arrays section by section, each section holds a few modes
+            n_modes = sum(len(rows['Frequencies']) for rows, vectors in sections)
+            properties, displacements, start = {}, None, 0
+            for rows, vectors in sections:
+                k = len(rows['Frequencies'])
+                for name, values in rows.items():
+                    if name not in properties:
+                        properties[name] = np.full(n_modes, np.nan)
+                    properties[name][start:start + k] = np.array(values, dtype=float)
+
+                # vector lines: atom number, atomic number, then X Y Z of each mode
+                coordinates = np.array(vectors.split(), dtype=float).reshape(-1, 2 + 3 * k)[:, 2:]
+                if displacements is None:
+                    displacements = np.empty((n_modes, len(coordinates), 3))
+                displacements[start:start + k] = coordinates.reshape(-1, k, 3).transpose(1, 0, 2)
+                start += k
+
+            return helper_classes.vibrations(
+                **{attribute: properties.pop(name, np.full(n_modes, np.nan))
+                   for name, attribute in helper_classes.vibrations.property_names.items()},
+                displacements=displacements, other=properties)
         except Exception:
-            self.modes = None
-            self.mode_vectors = None
             logger.warning("Log file does not contain vibrational frequencies")
+            return None
 
-    def _get_freq_part_descriptors(self) -> None:
-        """Extract descriptors from frequency part."""
+    @cached_property
+    def _freq_part(self) -> tuple:
+        """Extract descriptors from frequency part.
+
+        :return: tuple (descriptors, atom_freq_descriptors), ({}, None) if the log has no freq part
+        """
 
         logger.debug("Extracting frequency section descriptors")
         if 'freq' not in self.parts:
             logger.info("Output file does not have a 'freq' section. Cannot extract descriptors.")
-            return
-
-        text = self.parts['freq']
-
-        # single value descriptors
-        single_value_desc_list = [
-            {"name": "number_of_atoms", "prefix": "NAtoms=\s*", "type": int},
-            {"name": "charge", "prefix": "Charge\s=\s*", "type": int},
-            {"name": "multiplicity", "prefix": "Multiplicity\s=\s*", "type": int},
-            {"name": "dipole", "prefix": "Dipole moment \(field-independent basis, Debye\):.*?Tot=\s*", "type": float},
-            {"name": "molar_mass", "prefix": "Molar Mass =\s*", "type": float},
-            {"name": "molar_volume", "prefix": "Molar volume =\s*", "type": float},
-            {"name": "electronic_spatial_extent", "prefix": "Electronic spatial extent\s+\(au\):\s+<R\*\*2>=\s*",
-             "type": float},
-            {"name": "E_scf", "prefix": "SCF Done:\s+E.*?=\s*", "type": float},
-            {"name": "zero_point_correction", "prefix": "Zero-point correction=\s*", "type": float},
-            {"name": "E_thermal_correction", "prefix": "Thermal correction to Energy=\s*", "type": float},
-            {"name": "H_thermal_correction", "prefix": "Thermal correction to Enthalpy=\s*", "type": float},
-            {"name": "G_thermal_correction", "prefix": "Thermal correction to Gibbs Free Energy=\s*", "type": float},
-            {"name": "E_zpe", "prefix": "Sum of electronic and zero-point Energies=\s*", "type": float},
-            {"name": "E", "prefix": "Sum of electronic and thermal Energies=\s*", "type": float},
-            {"name": "H", "prefix": "Sum of electronic and thermal Enthalpies=\s*", "type": float},
-            {"name": "G", "prefix": "Sum of electronic and thermal Free Energies=\s*", "type": float},
-        ]
-
-        for desc in single_value_desc_list:
-            for part_name in ['freq', 'opt']:
-                try:
-                    value = re.search(f"{desc['prefix']}({float_or_int_regex})",
-                                      self.parts[part_name],
-                                      re.DOTALL).group(1)
-                    self.descriptors[desc["name"]] = desc['type'](value)
-                except (AttributeError, KeyError):
-                    pass
-            if desc["name"] not in self.descriptors:
-                self.descriptors[desc["name"]] = None
+            return {}, None
+
+        descriptors = {}
+
+        # values of the opt part override values of the freq part
+        values = self._scalar_values(freq_scalar_scanner, 'freq')
+        if 'opt' in self.parts:
+            values.update(self._scalar_values(freq_scalar_scanner, 'opt'))
+        for desc in freq_scalar_scanner.desc_list:
+            if desc["name"] in values:
+                descriptors[desc["name"]] = desc['type'](values[desc["name"]])
+            else:
+                descriptors[desc["name"]] = None
                 logger.warning(f'''Descriptor {desc["name"]} not present in the log file.''')
 
         # stoichiometry
-        self.descriptors['stoichiometry'] = re.search("Stoichiometry\s*(\w+)", text).group(1)
+        descriptors['stoichiometry'] = re.search("Stoichiometry\s*(\w+)",
+                                                 self._get_text('stoichiometry', 'freq')).group(1)
 
         # convergence, regex-logic: last word in each line should be "YES"
         try:
-            string = re.search("(Maximum Force.*?)\sPredicted change", text, re.DOTALL).group(1)
+            string = re.search("(Maximum Force.*?)\sPredicted change", self._get_text('convergence', 'freq'),
+                               re.DOTALL).group(1)
             # compute the fraction of YES/NO answers
-            self.descriptors['converged'] = (np.array(re.findall("(\w+)\n", string)) == 'YES').mean()
+            descriptors['converged'] = (np.array(re.findall("(\w+)\n", string)) == 'YES').mean()
         except Exception:
-            self.descriptors['converged'] = None
+            descriptors['converged'] = None
             logger.warning("Log file does not have optimization convergence information")
 
         # energies, regex-logic: find all floats in energy block, split by occupied, virtual orbitals
-        string = re.search("Population.*?SCF density.*?(\sAlph.*?)\n\s*Condensed", text, re.DOTALL).group(1)
-        if self.descriptors['multiplicity'] == 1:
+        string = re.search("Population.*?SCF density.*?(\sAlph.*?)\n\s*Condensed",
+                           self._get_text('population', 'freq'), re.DOTALL).group(1)
+        if descriptors['multiplicity'] == 1:
             energies = [re.findall(f"({float_or_int_regex})", s_part) for s_part in string.split("Alpha virt.", 1)]
             occupied_energies, unoccupied_energies = [map(float, e) for e in energies]
             homo, lumo = max(occupied_energies), min(unoccupied_energies)
-        elif self.descriptors['multiplicity'] == 3:
+        elif descriptors['multiplicity'] == 3:
             alpha, beta = re.search("(\s+Alpha\s+occ. .*?)(\s+Beta\s+occ. .*)", string, re.DOTALL).groups()
             energies_alpha = [re.findall(f"({float_or_int_regex})", s_part) for s_part in alpha.split("Alpha virt.", 1)]
             energies_beta = [re.findall(f"({float_or_int_regex})", s_part) for s_part in beta.split("Beta virt.", 1)]
@@ -293,31 +681,35 @@ class GaussianLogExtractor(object):
             homo_beta, lumo_beta = max(occupied_energies_beta), min(unoccupied_energies_beta)
             homo, lumo = homo_alpha, lumo_beta
         else:
-            logger.warning(f"Unsupported multiplicity {self.descriptors['multiplicity']}, cannot compute homo/lumo. "
+            logger.warning(f"Unsupported multiplicity {descriptors['multiplicity']}, cannot compute homo/lumo. "
                            f"Setting both to 0.")
             homo, lumo = 0, 0
-        self.descriptors['homo_energy'] = homo
-        self.descriptors['lumo_energy'] = lumo
-        self.descriptors['electronegativity'] = -0.5 * (lumo + homo)
-        self.descriptors['hardness'] = 0.5 * (lumo - homo)
+        descriptors['homo_energy'] = homo
+        descriptors['lumo_energy'] = lumo
+        descriptors['electronegativity'] = -0.5 * (lumo + homo)
+        descriptors['hardness'] = 0.5 * (lumo - homo)
 
         # atom_dependent section
         # Mulliken population
-        string = re.search("Mulliken charges.*?\n(.*?)\n\s*Sum of Mulliken", text, re.DOTALL).group(1)
+        string = re.search("Mulliken charges.*?\n(.*?)\n\s*Sum of Mulliken", self._get_text('mulliken', 'freq'),
+                           re.DOTALL).group(1)
         charges = np.array(list(map(str.split, string.splitlines()))[1:])[:, 2]
         if len(charges) < len(self.labels):
-            string = re.search("Mulliken atomic charges.*?\n(.*?)\n\s*Sum of Mulliken", text, re.DOTALL).group(1)
+            string = re.search("Mulliken atomic charges.*?\n(.*?)\n\s*Sum of Mulliken",
+                               self._get_text('mulliken_atomic', 'freq'), re.DOTALL).group(1)
             charges = np.array(list(map(str.split, string.splitlines()))[1:])[:, 2]
         mulliken = pd.Series(charges, name='Mulliken_charge')
 
         # APT charges
         try:
-            string = re.search("APT charges.*?\n(.*?)\n\s*Sum of APT", text, re.DOTALL).group(1)
+            string = re.search("APT charges.*?\n(.*?)\n\s*Sum of APT", self._get_text('apt', 'freq'),
+                               re.DOTALL).group(1)
             charges = np.array(list(map(str.split, string.splitlines()))[1:])[:, 2]
             apt = pd.Series(charges, name='APT_charge')
         except (IndexError, AttributeError):
             try:
-                string = re.search("APT atomic charges.*?\n(.*?)\n\s*Sum of APT", text, re.DOTALL).group(1)
+                string = re.search("APT atomic charges.*?\n(.*?)\n\s*Sum of APT", self._get_text('apt_atomic', 'freq'),
+                                   re.DOTALL).group(1)
                 charges = np.array(list(map(str.split, string.splitlines()))[1:])[:, 2]
                 apt = pd.Series(charges, name='APT_charge')
             except Exception:
@@ -326,8 +718,8 @@ class GaussianLogExtractor(object):
 
         # NPA charges
         try:
-            string = re.search("Summary of Natural Population Analysis:.*?\n\s-+\n(.*?)\n\s=+\n", text,
-                               re.DOTALL).group(1)
+            string = re.search("Summary of Natural Population Analysis:.*?\n\s-+\n(.*?)\n\s=+\n",
+                               self._get_text('npa', 'freq'), re.DOTALL).group(1)
             population = np.array(list(map(str.split, string.splitlines())))[:, 2:]
             npa = pd.DataFrame(population,
                                columns=['NPA_charge', 'NPA_core', 'NPA_valence', 'NPA_Rydberg', 'NPA_total'])
@@ -337,52 +729,178 @@ class GaussianLogExtractor(object):
 
         # NMR
         try:
-            string = re.findall(f"Isotropic\s=\s*({float_or_int_regex})\s*Anisotropy\s=\s*({float_or_int_regex})", text)
+            string = re.findall(f"Isotropic\s=\s*({float_or_int_regex})\s*Anisotropy\s=\s*({float_or_int_regex})",
+                                self._get_text('nmr', 'freq'))
             nmr = pd.DataFrame(np.array(string).astype(float), columns=['NMR_shift', 'NMR_anisotropy'])
         except Exception:
             nmr = pd.DataFrame(columns=['NMR_shift', 'NMR_anisotropy'])
             logger.warning(f"Log file does not contain NMR shifts.")
 
-        self.atom_freq_descriptors = pd.concat([mulliken, apt, npa, nmr], axis=1)
+        return descriptors, pd.concat([mulliken, apt, npa, nmr], axis=1)
 
-    def _get_td_part_descriptors(self) -> None:
-        """Extract descriptors from TD part."""
+    @cached_property
+    def _td_part(self) -> tuple:
+        """Extract descriptors from TD part.
+
+        :return: tuple (descriptors, transitions, atom_td_descriptors), ({}, None, None) if the log has no TD part
+        """
 
         logger.debug("Extracting TD section descriptors")
         if 'TD' not in self.parts:
             logger.info("Output file does not have a 'TD' section. Cannot extract descriptors.")
-            return
-
-        text = self.parts['TD']
+            return {}, None, None
 
-        single_value_desc_list = [
-            {"name": "ES_root_dipole", "prefix": "Dipole moment \(field-.*?, Debye\):.*?Tot=\s*", "type": float},
-            {"name": "ES_root_molar_volume", "prefix": "Molar volume =\s*", "type": float},
-            {"name": "ES_root_electronic_spatial_extent",
-             "prefix": "Electronic spatial extent\s+\(au\):\s+<R\*\*2>=\s*", "type": float},
-        ]
+        descriptors = {}
 
-        for desc in single_value_desc_list:
-            value = re.search(f"{desc['prefix']}({float_or_int_regex})", text, re.DOTALL).group(1)
-            self.descriptors[desc["name"]] = desc['type'](value)
+        values = self._scalar_values(td_scalar_scanner, 'TD')
+        for desc in td_scalar_scanner.desc_list:
+            if desc["name"] in values:
+                descriptors[desc["name"]] = desc['type'](values[desc["name"]])
+            else:
+                descriptors[desc["name"]] = None
+                logger.warning(f'''Descriptor {desc["name"]} not present in the log file.''')
 
         # excited states
         string = re.findall(f"Excited State.*?({float_or_int_regex})\snm"
                             f".*f=({float_or_int_regex})"
-                            f".*<S\*\*2>=({float_or_int_regex})", text)
-        self.transitions = pd.DataFrame(np.array(string).astype(float),
-                                        columns=['ES_transition', 'ES_osc_strength', 'ES_<S**2>'])
+                            f".*<S\*\*2>=({float_or_int_regex})", self._get_text('excited_states', 'TD'))
+        transitions = pd.DataFrame(np.array(string).astype(float),
+                                   columns=['ES_transition', 'ES_osc_strength', 'ES_<S**2>'])
 
         # atom_dependent section
         # Mulliken population
-        string = re.search("Mulliken charges.*?\n(.*?)\n\s*Sum of Mulliken", text, re.DOTALL).group(1)
+        string = re.search("Mulliken charges.*?\n(.*?)\n\s*Sum of Mulliken", self._get_text('mulliken', 'TD'),
+                           re.DOTALL).group(1)
         charges = np.array(list(map(str.split, string.splitlines()))[1:])[:, 2]
         mulliken = pd.Series(charges, name='ES_root_Mulliken_charge')
 
         # NPA charges
-        string = re.search("Summary of Natural Population Analysis:.*?\n\s-+\n(.*?)\n\s=+\n", text, re.DOTALL).group(1)
+        string = re.search("Summary of Natural Population Analysis:.*?\n\s-+\n(.*?)\n\s=+\n",
+                           self._get_text('npa', 'TD'), re.DOTALL).group(1)
         population = np.array(list(map(str.split, string.splitlines())))[:, 2:]
         npa = pd.DataFrame(population, columns=['ES_root_NPA_charge', 'ES_root_NPA_core', 'ES_root_NPA_valence',
                                                 'ES_root_NPA_Rydberg', 'ES_root_NPA_total'])
 
-        self.atom_td_descriptors = pd.concat([mulliken, npa], axis=1)
+        return descriptors, transitions, pd.concat([mulliken, npa], axis=1)
+
+
+class OptimizationTracker(object):
+    """Collects the optimization trajectory of a log, block by block, as a GaussianLogScanner notifies them."""
+
+    def __init__(self):
+        self.atomic_numbers = None
+        self.geometries = []  # (n_atoms, 3) coordinates of each Standard orientation block
+        self.energies = []  # SCF energy of each SCF cycle
+        self.convergence = []  # YES/NO flags of each convergence table, True for YES
+        self.tasks = []  # (task name, index of its first geometry) in the order of appearance
+
+    def on_block(self, kind, text, part_name) -> None:
+        """Parse a block of the log, see GaussianLogScanner.on_block."""
+
+        if kind == 'orientation':
+            if not self.tasks or self.tasks[-1][0] != part_name:
+                self.tasks.append((part_name, len(self.geometries)))
+            # same regex as GaussianLogExtractor.geom
+            geom = re.search("Standard orientation:.*?X\s+Y\s+Z\n(.*?)\n\s*Rotational constants", text, re.DOTALL)
+            rows = [line for line in geom.group(1).splitlines() if "--" not in line]  # drop lines of "---"
+            geom = np.array(" ".join(rows).split(), dtype=float).reshape(len(rows), -1)
+            self.atomic_numbers = geom[:, 1].astype(int)
+            self.geometries.append(geom[:, 3:])
+        elif kind == 'scf':
+            self.energies.append(float(re.search(f"SCF Done:\s+E.*?=\s*({float_or_int_regex})", text).group(1)))
+        elif kind == 'convergence':
+            # same regex as the 'converged' descriptor
+            string = re.search("(Maximum Force.*?)\sPredicted change", text, re.DOTALL).group(1)
+            self.convergence.append(np.array(re.findall("(\w+)\n", string)) == 'YES')
+
+    @property
+    def n_steps(self) -> int:
+        """Number of geometries found so far."""
+
+        return len(self.geometries)
+
+    @property
+    def converged(self) -> float:
+        """Fraction of the criteria of the last convergence table that are met, None before the first table."""
+
+        return self.convergence[-1].mean() if self.convergence else None
+
+
+class GaussianLogFollower(object):
+    """Follows a Gaussian log that is still being written. Each poll parses only the complete lines appended since
+    the previous poll, and updates the trajectory, SCF energies, convergence flags and task count."""
+
+    def __init__(self, log_file_path):
+        """Initialize the follower, nothing is read until the first poll.
+
+        :param log_file_path: local path of the log file
+        """
+
+        self.log_file_path = log_file_path
+        self.last_growth = time.time()  # time of the last poll that found new lines
+        self._reset()
+
+    def _reset(self) -> None:
+        """Start following the log from its beginning."""
+
+        self.offset = 0  # number of bytes of the log parsed so far
+        self.tracker = OptimizationTracker()
+        self._scanner = GaussianLogScanner(follower_block_specs, on_block=self.tracker.on_block)
+
+    def poll(self) -> int:
+        """Parse the lines appended to the log since the last poll, a partial last line is left for the next poll.
+
+        :return: number of bytes parsed
+        """
+
+        try:
+            size = os.path.getsize(self.log_file_path)
+        except FileNotFoundError:  # the job has not started writing yet
+            return 0
+        if size < self.offset:
+            logger.warning(f"Log file {self.log_file_path} was truncated, following it from the beginning.")
+            self._reset()
+        if size == self.offset:
+            return 0
+
+        with open(self.log_file_path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            return 0
+
+        self._scanner.feed(data[:end].decode('utf-8', errors='replace').replace("\r\n", "\n"))
+        self.offset += end
+        self.last_growth = time.time()
+        return end
+
+    def stalled(self, timeout) -> bool:
+        """Check if the log has not grown for a while.
+
+        :param timeout: number of seconds without new lines
+        :return: bool
+        """
+
+        return time.time() - self.last_growth > timeout
+
+    @property
+    def n_tasks(self) -> int:
+        """Number of tasks that terminated normally so far."""
+
+        return self._scanner.n_tasks
+
+    @property
+    def task(self) -> str:
+        """Name of the task being written, None before the first task."""
+
+        return self._scanner.task
+
+    def extractor(self, engine='mmap') -> GaussianLogExtractor:
+        """Create an extractor of the log, once the job has finished.
+
+        :param engine: engine of the extractor, see GaussianLogExtractor
+        :return: GaussianLogExtractor
+        """
+
+        return GaussianLogExtractor(self.log_file_path, engine=engine)
@@ -0,0 +1,537 @@
+import io
+import os
+import re
+import bz2
+import gzip
+import json
+import lzma
+import hashlib
+import logging
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # zstd compressed logs cannot be read
+
+
+logger = logging.getLogger(__name__)
+
+# regex logic: a gaussian task starts with a " # route" line directly preceded by a line of "---"
+route_separator_regex = re.compile(r"\s-+")
+route_line_regex = re.compile(r"\s#\s")
+part_name_regex = re.compile(r"\w+")
+# end of line anchor of a block spec regex, not escaped
+end_of_line_regex = re.compile(r"(?<!\\)\$")
+
+# compression codecs of log files, detected by magic bytes, or by extension
+compression_magic = {b"\x1f\x8b": 'gzip', b"BZh": 'bz2', b"\xfd7zXZ\x00": 'xz', b"\x28\xb5\x2f\xfd": 'zstd'}
+compression_suffixes = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz', '.zst': 'zstd'}
+log_file_suffixes = ('.out', '.log')
+
+# version of the index file format, bump when the layout of LogIndex changes
+index_format_version = 2
+
+
+def log_compression(log_file_path):
+    """Detect the compression of a log file from its first bytes, or from its extension.
+
+    :param log_file_path: path of the log file
+    :return: 'gzip', 'bz2', 'xz', 'zstd', or None for a plain text file
+    """
+
+    with open(log_file_path, "rb") as f:
+        head = f.read(6)
+    for magic, codec in compression_magic.items():
+        if head.startswith(magic):
+            return codec
+    return compression_suffixes.get(Path(log_file_path).suffix) if head else None
+
+
+def open_log(log_file_path):
+    """Open a log file in text mode, compressed files are decoded as a stream.
+
+    :param log_file_path: path of the log file, plain text or compressed with gzip, bz2, xz or zstd
+    :return: text file object
+    """
+
+    codec = log_compression(log_file_path)
+    if codec is None:
+        return open(log_file_path)
+    if codec == 'gzip':
+        return gzip.open(log_file_path, "rt")
+    if codec == 'bz2':
+        return bz2.open(log_file_path, "rt")
+    if codec == 'xz':
+        return lzma.open(log_file_path, "rt")
+    if zstandard is None:
+        raise ImportError(f"Reading zstd compressed log {log_file_path} requires the zstandard package.")
+    return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(log_file_path, "rb"), closefd=True))
+
+
+def find_log_files(directory, suffixes=('.out',)) -> list:
+    """Find log files in a directory tree, plain or compressed, e.g. .out, .out.gz, .out.xz.
+
+    :param directory: root directory
+    :param suffixes: extensions of the log files, before the compression extension, .out as written by the \
+    generated jobs by default, see log_file_suffixes for the other Gaussian extensions
+    :return: sorted list of paths
+    """
+
+    return sorted(path for path in Path(directory).rglob('*') if path.is_file() and log_base_name(path, suffixes))
+
+
+def log_base_name(log_file_path, suffixes=log_file_suffixes) -> str:
+    """Name of a log file without its log and compression extensions, e.g. water_conf_0 for water_conf_0.out.gz.
+
+    :param log_file_path: path of the log file
+    :param suffixes: extensions of the log files, before the compression extension
+    :return: str, empty if the file is not a log file
+    """
+
+    name = Path(log_file_path).name
+    for suffix in compression_suffixes:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    for suffix in suffixes:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return ""
+
+
+def _crlf_anchors(pattern) -> str:
+    """Make the end of line anchors of a regex also match before a carriage return, for the multiline regexes that \
+    search the chunks of logs with CRLF line endings (scan_buffer does not translate them)."""
+
+    return end_of_line_regex.sub(r"(?=\\r?$)", pattern)
+
+
+@dataclass
+class BlockSpec:
+    """Line anchors of a block of text in the Gaussian log file. Anchors are regexes matched within a single line.
+
+    :param kind: name of the block
+    :type kind: str
+    :param start: regex matching the first line of the block
+    :type start: str
+    :param end: regex matching the last line of the block, None for single line blocks
+    :type end: str
+    :param scope: 'part' for blocks searched within each gaussian task, 'log' for blocks searched in the whole log
+    :type scope: str
+    :param occurrence: which occurrences of the block to keep, 'first', 'last' or 'all' (single line blocks only)
+    :type occurrence: str
+    :param end_on_start_line: if True, the block may end on its first line
+    :type end_on_start_line: bool
+    """
+
+    kind: str
+    start: str
+    end: str = None
+    scope: str = 'part'
+    occurrence: str = 'first'
+    end_on_start_line: bool = False
+
+
+class _OpenBlock(object):
+    """Block that has started but has not reached its end line yet."""
+
+    def __init__(self, spec, end, blocks, start, search_from, absolute_start):
+        self.spec = spec
+        self.end = end  # (line regex, multiline regex)
+        self.blocks = blocks  # dictionary the block is stored into once complete
+        self.start = start  # offset of the block start in the current chunk
+        self.absolute_start = absolute_start  # offset of the block start in the log
+        self.search_from = search_from  # offset from which the end line is searched
+        self.pieces = []  # text of the block from previous chunks
+        self.next_end = None  # cached candidate offset of the end line
+
+
+class GaussianLogScanner(object):
+    """Single-pass scanner of a Gaussian log file. The scanner keeps only the windows of text described by the block
+    specs, split into gaussian tasks the same way as GaussianLogExtractor._split_parts.
+
+    The log is processed in large chunks of complete lines. A single regex finds the candidate lines that may start
+    a block or contain a termination message. Only these lines, the route lines and the end lines of open blocks
+    are looked at individually.
+
+    With keep_text=False the scanner keeps the offsets of the blocks instead of their text, a block is then stored
+    as a list of [start, end) ranges of offsets in the log, and part_spans holds the range of each gaussian task.
+
+    The log may also be fed incrementally while it is written, an on_block callback is then notified of each block
+    as soon as it is complete."""
+
+    def __init__(self, block_specs, chunk_size=1 << 22, keep_text=True, on_block=None):
+        """Initialize the scanner.
+
+        :param block_specs: list of BlockSpec describing the blocks to keep
+        :param chunk_size: number of characters read at once by the scan method
+        :param keep_text: keep the text of the blocks if True, their offsets in the log otherwise
+        :param on_block: callable (kind, value, part_name) called for each block as soon as it is complete, \
+        blocks with occurrence 'last' or 'all' are notified for every occurrence
+        """
+
+        self.specs = [(spec, re.compile(spec.start), self._compile(spec.end) if spec.end else None)
+                      for spec in block_specs]
+        self.chunk_size = chunk_size
+        # pre-filter of the lines that need a closer look, route lines are found separately with str.find("#")
+        # since a line-start anchor in the alternation disables the fast search of the regex engine
+        self.events = re.compile("|".join([f"(?:{_crlf_anchors(spec.start)})" for spec in block_specs] +
+                                          ["Normal termination"]), re.MULTILINE)
+        # specs grouped by the first character of their start regex, the only ones tried at an event position
+        self._specs_by_char = {}
+        for spec, start, end in self.specs:
+            first = spec.start[0]
+            if not (first.isalnum() or first in " =:<>"):
+                raise ValueError(f"Start regex of block {spec.kind} must begin with a literal character.")
+            self._specs_by_char.setdefault(first, []).append((spec, start, end))
+
+        self.keep_text = keep_text
+        self.on_block = on_block
+        self.n_tasks = 0
+        self.parts = {}  # part name -> {kind: text or ranges}
+        self.part_spans = {}  # part name -> [start, end) offsets of the part in the log
+        self.log_blocks = {}  # kind -> text or ranges
+        self.offset = 0  # offset of the current chunk in the log
+        self._part_blocks = None
+        self._part_name = None
+        self._open = {}  # (scope, kind) -> _OpenBlock
+        self._last_line = ""  # last line of the previous chunk
+
+    @property
+    def task(self) -> str:
+        """Name of the gaussian task being scanned, None before the first task."""
+
+        return self._part_name
+
+    @staticmethod
+    def _compile(pattern) -> tuple:
+        """Compile a line regex, and its multiline version used to find candidate lines in a chunk."""
+
+        return re.compile(pattern), re.compile(_crlf_anchors(pattern), re.MULTILINE)
+
+    def scan(self, f) -> None:
+        """Scan an open text file from its current position to the end.
+
+        :param f: file object opened in text mode
+        """
+
+        while True:
+            chunk = f.read(self.chunk_size)
+            if not chunk:
+                break
+            if not chunk.endswith("\n"):
+                chunk += f.readline()
+            self.feed(chunk)
+        self.close()
+
+    def scan_buffer(self, buffer) -> None:
+        """Scan a bytes-like buffer of the log, e.g. a memory map. The chunks are decoded as latin-1 so that the \
+        offsets kept by the scanner are byte offsets in the buffer.
+
+        :param buffer: bytes-like object supporting find and slicing
+        """
+
+        pos, size = 0, len(buffer)
+        while pos < size:
+            end = buffer.find(b"\n", min(pos + self.chunk_size, size) - 1)
+            end = size if end == -1 else end + 1
+            self.feed(buffer[pos:end].decode('latin-1'))
+            pos = end
+        self.close()
+
+    def feed(self, text) -> None:
+        """Process the next chunk of the log.
+
+        :param text: text of the log made of complete lines
+        """
+
+        pos, n = 0, len(text)
+        event = self.events.search(text)
+        route = text.find("#")
+        while pos < n:
+            # find the next line that starts or ends something, candidates are confirmed line by line
+            if event is not None and event.start() < pos:
+                event = self.events.search(text, pos)
+            if route != -1 and route < pos:
+                route = text.find("#", pos)
+            candidates = [event.start()] if event is not None else []
+            if route != -1:
+                candidates.append(route)
+            for block in self._open.values():
+                if block.next_end is None or block.next_end < pos:
+                    match = block.end[1].search(text, max(pos, block.search_from))
+                    block.next_end = match.start() if match else n
+                if block.next_end < n:
+                    candidates.append(block.next_end)
+            if not candidates:
+                break
+
+            p = min(candidates)
+            line_start = text.rfind("\n", 0, p) + 1
+            line_end = text.find("\n", p)
+            line_end = n if line_end == -1 else line_end + 1
+            self._process_line(text, line_start, line_end)
+            pos = line_end
+
+        # carry the open blocks over to the next chunk
+        for block in self._open.values():
+            if self.keep_text:
+                block.pieces.append(text[block.start:])
+            block.start = block.search_from = 0
+            block.next_end = None
+        self._last_line = text[text.rfind("\n", 0, n - 1) + 1:].rstrip("\r\n")
+        self.offset += n
+
+    def close(self) -> None:
+        """Finish scanning, blocks that never reached their end line are dropped."""
+
+        self._open = {}
+        if self._part_name is not None:
+            self.part_spans[self._part_name][1] = self.offset
+
+    def _process_line(self, text, line_start, line_end) -> None:
+        """Look at a candidate line of the chunk, line_start and line_end are its offsets in the chunk."""
+
+        line = text[line_start:line_end].rstrip("\r\n")
+
+        if "Normal termination" in line:
+            self.n_tasks += line.count("Normal termination")
+
+        # start of a new gaussian task, the part text starts after the "# " prefix
+        if line[1:2] == "#" and route_line_regex.match(line) and \
+                route_separator_regex.fullmatch(self._previous_line(text, line_start)):
+            separator_start = text.rfind("\n", 0, line_start - 1) + 1 if line_start else -len(self._last_line) - 1
+            self._start_part(part_name_regex.match(line[3:]).group(0),
+                             self.offset + line_start + 3, self.offset + separator_start - 1)
+            line, line_start = line[3:], line_start + 3
+
+        # close the open blocks ending on this line
+        for key, block in list(self._open.items()):
+            if block.search_from <= line_start and block.end[0].search(line):
+                self._close(key, text, line_end)
+
+        # open new blocks at the event positions of the line
+        started = set()
+        event = self.events.search(text, line_start, line_start + len(line))
+        while event is not None:
+            p = event.start()
+            for spec, start, end in self._specs_by_char.get(text[p], ()):
+                if spec.kind not in started and start.match(text, p, line_start + len(line)):
+                    started.add(spec.kind)
+                    self._start_block(spec, end, text, line, line_start, line_end)
+            event = self.events.search(text, p + 1, line_start + len(line))
+
+    def _previous_line(self, text, line_start) -> str:
+        """Get the line preceding a line of the chunk."""
+
+        if line_start == 0:
+            return self._last_line
+        return text[text.rfind("\n", 0, line_start - 1) + 1:line_start].rstrip("\r\n")
+
+    def _start_part(self, name, start, previous_end) -> None:
+        """Start collecting blocks for a new gaussian task, a task with the same name overrides the previous one.
+
+        :param name: name of the task
+        :param start: offset of the task text in the log
+        :param previous_end: offset of the end of the previous task text in the log
+        """
+
+        if self._part_name is not None:
+            self.part_spans[self._part_name][1] = previous_end
+        self._part_name = name
+        self._part_blocks = {}
+        self.parts[name] = self._part_blocks
+        self.part_spans[name] = [start, None]
+        # blocks searched within a part do not continue into the next part
+        self._open = {key: block for key, block in self._open.items() if block.spec.scope != 'part'}
+
+    def _start_block(self, spec, end, text, line, line_start, line_end) -> None:
+        """Open a block of a given spec on its first line."""
+
+        if spec.scope == 'part':
+            if self._part_blocks is None:  # text before the first task is not part of any task
+                return
+            blocks = self._part_blocks
+        else:
+            blocks = self.log_blocks
+
+        key = (spec.scope, spec.kind)
+        if spec.occurrence == 'first' and (spec.kind in blocks or key in self._open):
+            return
+
+        if end is None:
+            if self.keep_text:
+                value = text[line_start:line_end]
+            else:
+                value = [[self.offset + line_start, self.offset + line_end]]
+            if self.on_block is not None:
+                self.on_block(spec.kind, value, self._part_name)
+            blocks[spec.kind] = blocks[spec.kind] + value if spec.occurrence == 'all' and spec.kind in blocks else value
+            return
+
+        # an open 'last' block is restarted
+        search_from = line_start if spec.end_on_start_line else line_end
+        self._open[key] = _OpenBlock(spec, end, blocks, line_start, search_from, self.offset + line_start)
+        if spec.end_on_start_line and end[0].search(line):
+            self._close(key, text, line_end)
+
+    def _close(self, key, text, line_end) -> None:
+        """Store a complete block ending at a given offset of the chunk."""
+
+        block = self._open.pop(key)
+        if self.keep_text:
+            block.blocks[block.spec.kind] = "".join(block.pieces) + text[block.start:line_end]
+        else:
+            block.blocks[block.spec.kind] = [[block.absolute_start, self.offset + line_end]]
+        if self.on_block is not None:
+            self.on_block(block.spec.kind, block.blocks[block.spec.kind], self._part_name)
+
+
+@dataclass
+class LogIndex:
+    """Byte offsets of the gaussian tasks and of the blocks of a log file, as found by a GaussianLogScanner
+    with keep_text=False. Ranges are [start, end) pairs of offsets.
+
+    :param n_tasks: number of tasks that terminated normally
+    :type n_tasks: int
+    :param part_spans: task name -> range of the task text
+    :type part_spans: dict
+    :param parts: task name -> {block kind: list of ranges}
+    :type parts: dict
+    :param log_blocks: block kind -> list of ranges, for blocks searched in the whole log
+    :type log_blocks: dict
+    """
+
+    n_tasks: int = 0
+    part_spans: dict = field(default_factory=dict)
+    parts: dict = field(default_factory=dict)
+    log_blocks: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_scanner(cls, scanner) -> "LogIndex":
+        """Create the index from a scanner that has finished scanning."""
+
+        return cls(scanner.n_tasks, scanner.part_spans, scanner.parts, scanner.log_blocks)
+
+    @staticmethod
+    def path(log_file_path) -> str:
+        """Path of the index file persisted beside a log file."""
+
+        return f"{log_file_path}.index.json"
+
+    @staticmethod
+    def specs_hash(block_specs) -> str:
+        """Hash of the block specs the index was built with, an index built with other specs is stale."""
+
+        return hashlib.sha1(repr([asdict(spec) for spec in block_specs]).encode()).hexdigest()
+
+    def save(self, log_file_path, block_specs) -> None:
+        """Write the index beside the log file, together with the size and modification time of the log.
+
+        :param log_file_path: path of the log file
+        :param block_specs: list of BlockSpec the index was built with
+        """
+
+        stat = os.stat(log_file_path)
+        data = {'version': index_format_version, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                'specs': self.specs_hash(block_specs), **asdict(self)}
+        index_path = self.path(log_file_path)
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, index_path)
+
+    @classmethod
+    def load(cls, log_file_path, block_specs):
+        """Read the index persisted beside a log file.
+
+        :param log_file_path: path of the log file
+        :param block_specs: list of BlockSpec the index must have been built with
+        :return: LogIndex, or None if there is no index or it does not match the log file
+        """
+
+        try:
+            with open(cls.path(log_file_path)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        stat = os.stat(log_file_path)
+        if (data.get('version'), data.get('size'), data.get('mtime_ns'), data.get('specs')) != \
+                (index_format_version, stat.st_size, stat.st_mtime_ns, cls.specs_hash(block_specs)):
+            logger.debug(f"Index of {log_file_path} is stale.")
+            return None
+        return cls(data['n_tasks'], data['part_spans'], data['parts'], data['log_blocks'])
+
+
+class ScalarDescriptorScanner(object):
+    """Finds the first value of each single value descriptor of a text in one left-to-right pass.
+
+    A single regex made of the alternation of the descriptor anchors (the prefix up to its first '.*?') finds the
+    candidate positions, only the full patterns of the descriptors not found yet are tried at these positions.
+    Found descriptors are dropped from the alternation, so that the rest of the text is searched for the missing
+    descriptors only.
+    Descriptors are dictionaries with the keys 'name', 'prefix' and 'type', the value follows the prefix."""
+
+    def __init__(self, desc_list, value_regex):
+        """Initialize the scanner.
+
+        :param desc_list: list of descriptors, descriptors added later with the add method are appended to it
+        :param value_regex: regex matching the value of a descriptor
+        """
+
+        self.desc_list = desc_list
+        self.value_regex = value_regex
+        self._compile()
+
+    def add(self, desc) -> None:
+        """Add a descriptor to the scanner.
+
+        :param desc: dictionary with the keys 'name', 'prefix' and 'type'
+        """
+
+        self.desc_list.append(desc)
+        self._compile()
+
+    def _compile(self) -> None:
+        """Compile the anchor alternation and the full pattern of each descriptor."""
+
+        self.patterns = {desc['name']: re.compile(f"{desc['prefix']}({self.value_regex})", re.DOTALL)
+                         for desc in self.desc_list}
+        self._heads = {desc['name']: desc['prefix'].split('.*?')[0] for desc in self.desc_list}
+        self._anchors = {}  # frozenset of names -> compiled alternation of their anchors
+
+    def _anchors_of(self, names):
+        """Compiled alternation of the anchors of a set of descriptors."""
+
+        key = frozenset(names)
+        if key not in self._anchors:
+            self._anchors[key] = re.compile("|".join(f"(?:{self._heads[name]})" for name in self.patterns
+                                                     if name in key))
+        return self._anchors[key]
+
+    def search(self, text, names=None) -> dict:
+        """Find the first value of each descriptor in a text, same as re.search with the pattern of each descriptor.
+
+        :param text: text to search
+        :param names: names of the descriptors to search for, all descriptors if None
+        :return: dict name -> value string, descriptors that are not found are missing
+        """
+
+        remaining = dict(self.patterns) if names is None else {name: self.patterns[name] for name in names}
+        values = {}
+        p = -1
+        while remaining:
+            # anchors of other descriptors may start within the previous anchor, search again from the next character
+            anchor = self._anchors_of(remaining).search(text, p + 1)
+            if anchor is None:
+                break
+            p = anchor.start()
+            for name, pattern in list(remaining.items()):
+                match = pattern.match(text, p)
+                if match is not None:
+                    values[name] = match.group(1)
+                    del remaining[name]
+        return values
@@ -0,0 +1,210 @@
+import io
+import os
+import re
+import argparse
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from helper_classes import slurm_status
+from gaussian_log_parser import open_log, log_compression, find_log_files, log_base_name, log_file_suffixes
+
+
+logger = logging.getLogger(__name__)
+
+# regex logic: link of the error termination, e.g. "Error termination via Lnk1e in /g16/l9999.exe"
+# or "Error termination request processed by link 9999."
+error_link_regex = re.compile(rb"Error termination (?:via Lnk1e in \S*?l(\d+)\.exe|request processed by link (\d+))")
+# regex logic: first frequency of a vibration block, frequencies are printed in ascending order
+first_frequency_regex = re.compile(rb"Frequencies --\s+([-+]?[0-9]*\.?[0-9]+)")
+
+# regex logic: a route line " # task" directly follows a line of "---", logs may have CRLF line endings
+route_marker_regex = re.compile(rb"-\r?\n # ")
+# regex logic: header of a frequency block
+frequencies_regex = re.compile(rb"Harmonic frequencies")
+# regex logic: first word of the task following "# " in a route line
+task_name_regex = re.compile(rb"\w+")
+
+# link 9999 ends the job when the optimization did not converge in the allowed number of steps
+optimization_link = 9999
+
+
+def triage_log(log_file_path, last_task=None, tail_size=1 << 16, search_size=1 << 24, chunk_size=1 << 20) -> dict:
+    """Classify a Gaussian output from its tail, its last route line and its last frequency block, without reading
+    the whole file.
+
+    A job terminated normally if its log ends with a normal termination line (a failed task stops the whole job)
+    and, if last_task is given, its last task is last_task. Jobs that terminated normally are done unless their
+    last frequency block has an imaginary frequency. Jobs that stopped without a termination line or between
+    two tasks (wall time, killed) or in link 9999 (optimization steps exhausted) are incomplete, other error
+    terminations are failed.
+
+    The last route line and the last frequency block are searched in the last search_size bytes only, they are
+    'unknown' if they are not found there in a longer log, and the status is then decided without them. Compressed
+    logs are decoded as a stream keeping only their last search_size bytes.
+
+    :param log_file_path: path of the log file, plain text or compressed, see gaussian_log_parser.open_log
+    :param last_task: name of the last task of the job (first word of its route, e.g. 'TD'), see expected_last_task
+    :param tail_size: number of bytes read at the end of the file to find the termination line
+    :param search_size: maximum number of bytes searched backwards for the last route line and frequency block
+    :param chunk_size: number of bytes read at once when searching backwards through the file
+    :return: dictionary with the keys path, status (slurm_status), termination ('normal', 'error' or None), \
+    error_link, last_task and lowest_frequency
+    """
+
+    record = {'path': str(log_file_path), 'status': slurm_status.failed, 'termination': None,
+              'error_link': None, 'last_task': None, 'lowest_frequency': None}
+
+    with open_log(log_file_path) as text:
+        f = text.buffer
+        if log_compression(log_file_path) is not None:
+            f = io.BytesIO(_stream_tail(f, search_size, chunk_size))
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return record
+        f.seek(max(0, size - tail_size))
+        tail = f.read().replace(b"\r\n", b"\n")
+
+        normal_pos = tail.rfind(b"Normal termination")
+        error_pos = tail.rfind(b"Error termination")
+        if error_pos > normal_pos:
+            record['termination'] = 'error'
+            match = error_link_regex.search(tail, error_pos)
+            if match is not None:
+                record['error_link'] = int(match.group(1) or match.group(2))
+            record['status'] = slurm_status.incomplete if record['error_link'] == optimization_link \
+                else slurm_status.failed
+            return record
+
+        # no termination line, or a normal termination followed by more output which ends an earlier task
+        line_end = tail.find(b"\n", normal_pos)
+        if normal_pos == -1 or (line_end != -1 and tail[line_end:].strip()):
+            record['status'] = slurm_status.incomplete
+            return record
+
+        record['termination'] = 'normal'
+
+        pos = _rfind(f, size, route_marker_regex, chunk_size, search_size)
+        if pos is None:
+            record['last_task'] = 'unknown'
+        elif pos != -1:
+            f.seek(pos)
+            record['last_task'] = task_name_regex.match(f.readline()).group(0).decode()
+
+        pos = _rfind(f, size, frequencies_regex, chunk_size, search_size)
+        if pos is None:
+            record['lowest_frequency'] = 'unknown'
+        elif pos != -1:
+            f.seek(pos)
+            match = first_frequency_regex.search(f.read(1 << 14))
+            record['lowest_frequency'] = float(match.group(1)) if match is not None else None
+
+    if last_task is not None and record['last_task'] not in (last_task, 'unknown'):
+        record['status'] = slurm_status.incomplete
+    elif isinstance(record['lowest_frequency'], float) and record['lowest_frequency'] < 0.:
+        record['status'] = slurm_status.incomplete
+    else:
+        record['status'] = slurm_status.done
+    return record
+
+
+def _stream_tail(f, size, chunk_size) -> bytes:
+    """Read a binary stream to its end and return its last size bytes."""
+
+    chunks, length = deque(), 0
+    for chunk in iter(lambda: f.read(chunk_size), b""):
+        chunks.append(chunk)
+        length += len(chunk)
+        while length - len(chunks[0]) >= size:
+            length -= len(chunks.popleft())
+    return b"".join(chunks)[-size:]
+
+
+def _rfind(f, end, regex, chunk_size, search_size, overlap=64) -> int:
+    """Search an open binary file backwards for the last match of a regex before an offset, within search_size bytes.
+
+    :return: offset of the end of the match, -1 if there is no match, None if there is no match in the last \
+    search_size bytes but the file is longer
+    """
+
+    stop = max(0, end - search_size)
+    while end > stop:
+        # overlap the chunks so that a match split across two chunks is found
+        start = max(stop, end - chunk_size)
+        f.seek(start)
+        match = None
+        for match in regex.finditer(f.read(end - start + overlap)):
+            pass
+        if match is not None:
+            return start + match.end()
+        end = start
+    return -1 if stop == 0 else None
+
+
+def expected_last_task(gjf_file_path):
+    """Name of the last task of a Gaussian input, the first word of its last route line.
+
+    :param gjf_file_path: path of the Gaussian input file
+    :return: str, None if the file does not exist or has no route line
+    """
+
+    try:
+        with open(gjf_file_path, "rb") as f:
+            routes = [line for line in f.read().splitlines() if line.startswith(b"# ")]
+    except OSError:
+        return None
+    return task_name_regex.match(routes[-1][2:]).group(0).decode() if routes else None
+
+
+def _triage_with_input(log_file_path) -> dict:
+    """Classify a Gaussian output, checking its last task against the Gaussian input beside it if present."""
+
+    gjf_file_path = Path(log_file_path).with_name(f"{log_base_name(log_file_path)}.gjf")
+    return triage_log(log_file_path, last_task=expected_last_task(gjf_file_path))
+
+
+def triage_directory(directory, suffixes=log_file_suffixes, n_workers=8) -> pd.DataFrame:
+    """Classify all Gaussian outputs of a directory tree, plain or compressed, see triage_log. Outputs with a \
+    Gaussian input beside them (same name, .gjf extension) must have run all the tasks of the input.
+
+    :param directory: root directory
+    :param suffixes: extensions of the log files, before the compression extension
+    :param n_workers: number of files read concurrently, reads are mostly waiting on the filesystem
+    :return: pandas.DataFrame with one row per log file, the status column holds slurm_status names
+    """
+
+    paths = find_log_files(directory, tuple(suffixes))
+    logger.info(f"Triaging {len(paths)} log files in {directory}.")
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        records = list(executor.map(_triage_with_input, paths))
+
+    table = pd.DataFrame(records, columns=['path', 'status', 'termination', 'error_link', 'last_task',
+                                           'lowest_frequency'])
+    table['status'] = [slurm_status(status).name for status in table['status']]
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify Gaussian outputs from their tails: done, incomplete "
+                                                 "(wall time, unconverged optimization, imaginary frequency) "
+                                                 "or failed.")
+    parser.add_argument("directory", help="root directory of the Gaussian outputs")
+    parser.add_argument("--suffixes", nargs="+", default=list(log_file_suffixes),
+                        help="extensions of the log files, before the compression extension")
+    parser.add_argument("--workers", type=int, default=8, help="number of files read concurrently")
+    parser.add_argument("--csv", help="write the status table to this csv file")
+    args = parser.parse_args()
+
+    table = triage_directory(args.directory, args.suffixes, args.workers)
+    if args.csv:
+        table.to_csv(args.csv, index=False)
+    else:
+        print(table.to_string(index=False))
+    print(table['status'].value_counts().to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 import enum
 import os
 import numpy as np
+import pandas as pd
 from dataclasses import dataclass
 
 import yaml
@@ -73,3 +74,94 @@ class slurm_job:
     status: slurm_status
     n_submissions: int
     n_success_tasks: int
+
+
+@dataclass
+class vibrations:
+    """Dataclass for the vibrational modes of a molecule.
+
+    :param frequencies: frequencies (cm**-1), shape (n_modes,)
+    :type frequencies: np.ndarray
+    :param red_masses: reduced masses (AMU), shape (n_modes,)
+    :type red_masses: np.ndarray
+    :param frc_consts: force constants (mDyne/A), shape (n_modes,)
+    :type frc_consts: np.ndarray
+    :param IR_inten: IR intensities (KM/Mole), shape (n_modes,)
+    :type IR_inten: np.ndarray
+    :param displacements: normal coordinates of each atom, shape (n_modes, n_atoms, 3)
+    :type displacements: np.ndarray
+    :param other: other mode properties present in the log, e.g. Raman activities, name -> shape (n_modes,)
+    :type other: dict
+    """
+
+    frequencies: np.ndarray
+    red_masses: np.ndarray
+    frc_consts: np.ndarray
+    IR_inten: np.ndarray
+    displacements: np.ndarray
+    other: dict
+
+    # mode property names as printed in the log (without dots) -> attribute names
+    property_names = {'Frequencies': 'frequencies', 'Red masses': 'red_masses', 'Frc consts': 'frc_consts',
+                      'IR Inten': 'IR_inten'}
+
+    @property
+    def n_modes(self) -> int:
+        return self.displacements.shape[0]
+
+    @property
+    def n_atoms(self) -> int:
+        return self.displacements.shape[1]
+
+    def modes_frame(self) -> pd.DataFrame:
+        """Mode properties as a dataframe indexed by mode_number, one column per property."""
+
+        columns = {name: getattr(self, attribute) for name, attribute in self.property_names.items()}
+        columns.update(self.other)
+        return pd.DataFrame(columns, index=pd.RangeIndex(1, self.n_modes + 1, name='mode_number'))
+
+    def mode_vectors_frame(self) -> pd.DataFrame:
+        """Normal coordinates as a long-form dataframe with columns mode_number, axis and value, ordered by mode, \
+        axis and atom."""
+
+        n_modes, n_atoms = self.n_modes, self.n_atoms
+        return pd.DataFrame({'mode_number': np.repeat(np.arange(1, n_modes + 1), 3 * n_atoms),
+                             'axis': np.tile(np.repeat(np.array(list('XYZ'), dtype=object), n_atoms), n_modes),
+                             'value': self.displacements.transpose(0, 2, 1).ravel()})
+
+
+@dataclass
+class trajectory:
+    """Dataclass for the optimization trajectory of a molecule.
+
+    :param atomic_numbers: atomic numbers, shape (n_atoms,)
+    :type atomic_numbers: np.ndarray
+    :param coordinates: standard orientation coordinates (Angstroms) of each step, shape (n_steps, n_atoms, 3)
+    :type coordinates: np.ndarray
+    :param energies: SCF energy (Hartree) of each step, nan if missing, shape (n_steps,)
+    :type energies: np.ndarray
+    :param convergence: value of each convergence criterion at each step, nan if missing, shape (n_steps, 4)
+    :type convergence: np.ndarray
+    :param thresholds: threshold of each convergence criterion, shape (4,)
+    :type thresholds: np.ndarray
+    :param converged: whether each convergence criterion is met at each step, shape (n_steps, 4)
+    :type converged: np.ndarray
+    """
+
+    atomic_numbers: np.ndarray
+    coordinates: np.ndarray
+    energies: np.ndarray
+    convergence: np.ndarray
+    thresholds: np.ndarray
+    converged: np.ndarray
+
+    # convergence criteria, in the order of the columns of convergence, thresholds and converged
+    criteria = ('Maximum Force', 'RMS Force', 'Maximum Displacement', 'RMS Displacement')
+
+    @property
+    def n_steps(self) -> int:
+        return self.coordinates.shape[0]
+
+    @property
+    def n_atoms(self) -> int:
+        return self.coordinates.shape[1]
@@ -3,12 +3,22 @@ import glob
 import logging
 import os
 from collections import Counter
+from contextlib import contextmanager
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None  # BLAS threads of forked workers are limited by environment variables only
 
 # import fabric
 # import paramiko
 
 logger = logging.getLogger(__name__)
 
+# environment variables read by the BLAS/OpenMP libraries for their number of threads
+blas_thread_variables = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS',
+                         'NUMEXPR_NUM_THREADS']
+
 
 # def ssh_connect(host, user) -> fabric.Connection:
 #     """Create ssh connection using fabric and paramiko, supports DUO authentication.
@@ -137,3 +147,29 @@ def str_chop(s, suffix):
     if suffix and s.endswith(suffix):
         return s[:-len(suffix)]
     return s
+
+
+def limit_blas_threads() -> None:
+    """Pool initializer, keep the BLAS of the worker single-threaded to avoid oversubscription of the cores."""
+
+    for variable in blas_thread_variables:
+        os.environ[variable] = '1'
+    if threadpool_limits is not None:
+        threadpool_limits(1)
+
+
+@contextmanager
+def single_threaded_blas_environment():
+    """Set the BLAS thread variables to 1 while workers are started, workers started with spawn read the \
+    environment before importing numpy. The previous values are restored on exit."""
+
+    environ = {variable: os.environ.get(variable) for variable in blas_thread_variables}
+    os.environ.update({variable: '1' for variable in blas_thread_variables})
+    try:
+        yield
+    finally:
+        for variable, value in environ.items():
+            if value is None:
+                os.environ.pop(variable, None)
+            else:
+                os.environ[variable] = value
@@ -1,6 +1,8 @@
 import hashlib
 import logging
 import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 try:
     from openbabel import pybel  # openbabel 3.0.0
@@ -16,60 +18,363 @@ import pandas as pd
 import numpy as np
 from scipy.spatial import distance
 from rdkit import Chem
-from rdkit.Chem import Descriptors
+from rdkit.Chem import Descriptors, rdMolDescriptors
 
 import openbabel_utils as ob_utils
 import rdkit_utils
+import helper_classes
+from conformer_cache import ConformerCache
+from helper_functions import limit_blas_threads
 
 logger = logging.getLogger(__name__)
 
 
 class Molecule(object):
-    """Wrapper class for molecule"""
+    """Wrapper class for molecule
+
+    The molecule is held as arrays: atomic numbers, formal charges, a sparse bond list and one contiguous float32
+    block of conformer coordinates. The RDKit and Open Babel objects, the dense connectivity matrix, the InChI and the
+    InChIKey are created on first access and cached, they are not pickled."""
+
+    __slots__ = ('name', 'can', 'atomic_numbers', 'formal_charges', 'bonds', 'bond_orders', 'conformer_coordinates',
+                 'max_num_conformers', 'conformer_engine', 'force_field', 'sampling_statistics', '_energies', '_mol',
+                 '_obmol', '_inchi', '_inchikey', '_spin', '_connectivity_matrix')
+
+    # lazily created attributes, dropped when pickling
+    _lazy_slots = ('_mol', '_obmol', '_inchi', '_inchikey', '_spin', '_connectivity_matrix')
 
     def __init__(self, smiles, name=None, num_conf=3, engine='rdkit', rdkit_ff='MMFF94', ob_gen3d_option='best',
-                 n_threads=os.cpu_count() - 1) -> None:
+                 n_threads=os.cpu_count() - 1, random_seed=None, conformer_cache=None, adaptive=None) -> None:
         """
         Initialize the molecule with a conformational ensemble
 
+        :param random_seed: seed of the rdkit embedding, the ensemble is reproducible for a given seed
+        :param conformer_cache: path of a conformer cache database (see ConformerCache), the ensemble is taken from \
+        the cache if it was generated before with the same parameters, and stored in it otherwise. Only reproducible \
+        ensembles are cached, i.e. rdkit ensembles with a random_seed, the open babel conformer search cannot be seeded
+        :param adaptive: keyword arguments of rdkit_utils.generate_conformations_adaptively, e.g. {'round_size': 10}, \
+        to sample the conformers in rounds until the ensemble converges, num_conf is then the maximum number of \
+        embeddings, an empty dict for the default sampling, None to embed num_conf conformers at once. The statistics \
+        of the rounds are kept in sampling_statistics, they are None for ensembles taken from the cache
         """
 
         self.name = name
 
-        # run conformer generation
+        # the parameters that change the ensemble, n_threads does not
         if engine == 'rdkit':
-            self.elements, \
-            self.conformer_coordinates, \
-            self.connectivity_matrix, \
-            self.charges = rdkit_utils.generate_conformations_from_rdkit(smiles=smiles,
+            parameters = {'num_conf': num_conf, 'engine': engine, 'rdkit_ff': rdkit_ff, 'random_seed': random_seed,
+                          'embed_parameters': rdkit_utils.embed_parameters}
+            if adaptive is not None:
+                parameters['adaptive'] = adaptive
+        else:
+            parameters = {'num_conf': num_conf, 'engine': engine, 'ob_gen3d_option': ob_gen3d_option}
+
+        ensemble = None
+        if conformer_cache is not None and (engine != 'rdkit' or random_seed is None):
+            logger.info(f"Conformers of {smiles} are not cached, the {engine} ensemble is not reproducible without "
+                        f"a random_seed.")
+            conformer_cache = None
+        if conformer_cache is not None:
+            cache = ConformerCache(conformer_cache)
+            key = cache.key(smiles, parameters)
+            ensemble = cache.get(key)
+            if ensemble is not None:
+                logger.info(f"Conformers of {smiles} found in the cache.")
+
+        # run conformer generation
+        self.sampling_statistics = None
+        if ensemble is not None:
+            elements, conformer_coordinates, connectivity_matrix, charges = ensemble
+        elif engine == 'rdkit' and adaptive is not None:
+            elements, \
+            conformer_coordinates, \
+            connectivity_matrix, \
+            charges, \
+            self.sampling_statistics = rdkit_utils.generate_conformations_adaptively(smiles=smiles,
+                                                                                     max_conf=num_conf,
+                                                                                     rdkit_ff=rdkit_ff,
+                                                                                     n_threads=n_threads,
+                                                                                     random_seed=random_seed,
+                                                                                     **adaptive)
+        elif engine == 'rdkit':
+            elements, \
+            conformer_coordinates, \
+            connectivity_matrix, \
+            charges = rdkit_utils.generate_conformations_from_rdkit(smiles=smiles,
                                                                          num_conf=num_conf,
                                                                          rdkit_ff=rdkit_ff,
-                                                                         n_threads=n_threads)
+                                                                         n_threads=n_threads,
+                                                                         random_seed=random_seed)
         elif engine == 'openbabel':
-            self.elements, \
-            self.conformer_coordinates, \
-            self.connectivity_matrix, \
-            self.charges = ob_utils.generate_conformations_from_openbabel(smiles=smiles,
+            elements, \
+            conformer_coordinates, \
+            connectivity_matrix, \
+            charges = ob_utils.generate_conformations_from_openbabel(smiles=smiles,
                                                                           num_conf=num_conf,
                                                                           ob_gen3d_option=ob_gen3d_option)
         else:
-            logger.error('Engine error for molecule')
-
-        # make an internal rdkit mol from the conformational ensemble
-        self.mol = rdkit_utils.get_rdkit_mol(self.elements, self.conformer_coordinates, self.connectivity_matrix, self.charges)
+            message = f"Not supported engine {engine}. Allowed engines are: rdkit, openbabel."
+            logger.error(message)
+            raise ValueError(message)
+
+        if conformer_cache is not None:
+            if ensemble is None:
+                cache.put(key, smiles, elements, conformer_coordinates, connectivity_matrix, charges)
+            cache.close()
+
+        periodic_table = Chem.GetPeriodicTable()
+        self.atomic_numbers = np.array([periodic_table.GetAtomicNumber(str(e)) for e in elements], dtype=np.int16)
+        self.formal_charges = np.asarray(charges, dtype=np.int16)
+        self.bonds, self.bond_orders = rdkit_utils.bonds_from_connectivity(connectivity_matrix)
+        self.conformer_coordinates = np.ascontiguousarray(conformer_coordinates, dtype=np.float32)
+        for slot in self._lazy_slots:
+            setattr(self, slot, None)
+        self._energies = None
 
-        # fetch identification variables
         self.can = smiles
-        self.inchi = Chem.MolToInchi(self.mol)
-        self.inchikey = Chem.MolToInchiKey(self.mol)
 
         # add configuration info
         self.max_num_conformers = num_conf
         self.conformer_engine = engine
+        # force field of the conformer energies, open babel conformers are scored with MMFF94 as well
+        self.force_field = rdkit_ff if engine == 'rdkit' else 'MMFF94'
+
+    def __getstate__(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__ if slot not in self._lazy_slots}
+
+    def __setstate__(self, state):
+        for slot in self._lazy_slots:
+            setattr(self, slot, None)
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+    @property
+    def n_atoms(self) -> int:
+        return len(self.atomic_numbers)
+
+    @property
+    def elements(self) -> list:
+        """Element symbols of the atoms."""
+
+        return [GetSymbol(int(n)) for n in self.atomic_numbers]
+
+    @property
+    def charges(self) -> np.ndarray:
+        """Formal charges of the atoms."""
+
+        return self.formal_charges
+
+    @property
+    def charge(self) -> int:
+        """Total charge of the molecule."""
+
+        return int(self.formal_charges.sum())
+
+    @property
+    def connectivity_matrix(self) -> np.ndarray:
+        """Dense bond order matrix, created from the bond list on first access. The returned array is read-only."""
+
+        if self._connectivity_matrix is None:
+            self._connectivity_matrix = rdkit_utils.connectivity_from_bonds(self.n_atoms, self.bonds,
+                                                                            self.bond_orders)
+            self._connectivity_matrix.flags.writeable = False
+        return self._connectivity_matrix
+
+    @property
+    def mol(self) -> Chem.Mol:
+        """RDKit Mol object with all the conformers."""
+
+        if self._mol is None:
+            self._mol = rdkit_utils.rdmol_from_bonds(self.atomic_numbers, self.formal_charges, self.bonds,
+                                                     self.bond_orders, self.conformer_coordinates)
+        return self._mol
+
+    @property
+    def obmol(self):
+        """Open Babel OBMol object of the first conformer."""
+
+        if self._obmol is None:
+            self._obmol = ob_utils.input_to_OBMol(Chem.MolToMolBlock(self.mol), "string", "mol")
+        return self._obmol
+
+    @property
+    def inchi(self) -> str:
+        if self._inchi is None:
+            self._inchi = Chem.MolToInchi(self.mol)
+        return self._inchi
+
+    @property
+    def inchikey(self) -> str:
+        if self._inchikey is None:
+            self._inchikey = Chem.MolToInchiKey(self.mol)
+        return self._inchikey
+
+    @property
+    def energies(self) -> np.ndarray:
+        """Force field energies (kcal/mol) of the conformers, see rdkit_utils.force_field_energies."""
+
+        if self._energies is None:
+            self._energies, force_field = rdkit_utils.force_field_energies(self.mol, self.force_field)
+            if force_field != self.force_field:
+                logger.warning(f"No {self.force_field} parameters for {self.can}, conformer energies from "
+                               f"{force_field}.")
+                self.force_field = force_field
+        return self._energies
+
+    def screen_conformers(self, energy_window=10., min_population=0.01, rmsd_threshold=0.35,
+                          temperature=helper_classes.T) -> dict:
+        """Keep only the conformers worth a DFT job: conformers that are not duplicates of a lower energy conformer \
+        (heavy atom RMSD to it of at most rmsd_threshold, see rdkit_utils.prune_rmsds), within energy_window of the \
+        lowest force field energy, and with a Boltzmann population of at least min_population. Populations are \
+        computed over the unique conformers, duplicates have a population of 0. The other conformers are removed \
+        from the molecule, the kept conformers are ordered by energy.
+
+        :param energy_window: energy window (kcal/mol) above the lowest energy
+        :param min_population: minimum Boltzmann population (fraction), 0 to keep all populations
+        :param rmsd_threshold: RMSD threshold (Angstroms) of the duplicates, None to keep duplicates
+        :param temperature: temperature (K) of the Boltzmann populations
+        :return: dictionary report of the screen, energies and populations are given for all the conformers
+        """
 
-        # add charge and spin
-        self.charge = sum(self.charges)
-        self.spin = Descriptors.NumRadicalElectrons(self.mol) + 1
+        energies = self.energies
+        n_conformers = len(energies)
+        report = {'name': self.name, 'can': self.can, 'force_field': self.force_field, 'n_conformers': n_conformers}
+        if n_conformers == 0 or np.isnan(energies).any():
+            logger.warning(f"No force field energies for {self.can}, all {n_conformers} conformers are kept.")
+            report.update(kept=list(range(n_conformers)),
+                          relative_energies=[None] * n_conformers,
+                          relative_energies_hartree=[None] * n_conformers,
+                          populations=[None] * n_conformers,
+                          dropped_energy=[], dropped_population=[], dropped_duplicate=[])
+            return report
+
+        relative = energies - energies.min()
+        candidates = np.argsort(relative, kind='stable')
+
+        # duplicates first, otherwise each copy of a minimum takes a share of the populations
+        dropped_duplicate = []
+        if rmsd_threshold is not None and len(candidates) > 1:
+            keep = rdkit_utils.prune_rmsds(self.mol, rmsd_threshold, energies=relative)
+            dropped_duplicate = sorted(int(i) for i in set(candidates) - set(keep))
+            candidates = np.array(keep, dtype=int)
+
+        weights = np.zeros(n_conformers)
+        weights[candidates] = np.exp(-relative[candidates] / (helper_classes.k_in_kcal_per_mol_K * temperature))
+        populations = weights / weights.sum()
+
+        dropped_energy = [int(i) for i in candidates if relative[i] > energy_window]
+        candidates = candidates[relative[candidates] <= energy_window]
+        dropped_population = [int(i) for i in candidates if populations[i] < min_population]
+        candidates = candidates[populations[candidates] >= min_population]
+
+        report.update(kept=[int(i) for i in candidates],
+                      relative_energies=relative.tolist(),
+                      relative_energies_hartree=(relative / helper_classes.Hartree_in_kcal_per_mol).tolist(),
+                      populations=populations.tolist(),
+                      dropped_energy=dropped_energy,
+                      dropped_population=dropped_population,
+                      dropped_duplicate=dropped_duplicate)
+        logger.info(f"Screened {self.can}: kept {len(candidates)} of {n_conformers} conformers, dropped "
+                    f"{len(dropped_duplicate)} duplicates, {len(dropped_energy)} by energy and "
+                    f"{len(dropped_population)} by population.")
+
+        self.conformer_coordinates = np.ascontiguousarray(self.conformer_coordinates[candidates])
+        self._energies = energies[candidates]
+        self._mol = self._obmol = None
+        return report
+
+    @property
+    def spin(self) -> int:
+        """Spin multiplicity of the molecule."""
+
+        if self._spin is None:
+            self._spin = Descriptors.NumRadicalElectrons(self.mol) + 1
+        return self._spin
+
+
+def molecule_cost(smiles) -> float:
+    """Expected relative cost of the conformer generation of a molecule: number of heavy atoms times one plus the \
+    number of rotatable bonds, 1 if the smiles cannot be parsed.
+
+    :param smiles: smiles string
+    :return: float
+    """
+
+    mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        return 1.
+    return float(mol.GetNumHeavyAtoms() * (1 + rdMolDescriptors.CalcNumRotatableBonds(mol)))
+
+
+def _build_molecule(smiles, name, options, n_threads) -> tuple:
+    """Create a Molecule, failures are returned as an error record instead of raised.
+
+    :return: tuple (name, Molecule or None, error record dictionary or None)
+    """
+
+    try:
+        return name, Molecule(smiles, name=name, n_threads=n_threads, **options), None
+    except Exception as e:
+        return name, None, {'name': name, 'smiles': smiles, 'error': type(e).__name__, 'message': str(e),
+                            'traceback': traceback.format_exc()}
+
+
+def generate_molecules(molecules, n_cores=None, cost_per_thread=200., lookahead=64, **options):
+    """Create Molecules for many smiles over a process pool, yielding them as they finish.
+
+    Each molecule gets a number of threads for the conformer generation that grows with its expected cost (see \
+    molecule_cost), one thread per cost_per_thread, and molecules run concurrently as long as the threads of the \
+    running molecules fit in n_cores. Among the next lookahead molecules, the most expensive that fits is started \
+    first, so that long molecules do not finish last.
+
+    :param molecules: iterable of smiles strings or of (smiles, name) tuples
+    :param n_cores: number of cores shared by the molecules, all cores if None
+    :param cost_per_thread: expected cost of a molecule per thread of its conformer generation
+    :param lookahead: number of pending molecules considered for scheduling, the iterable is consumed lazily
+    :param options: keyword arguments of Molecule, e.g. num_conf, engine
+    :return: generator of tuples (name, Molecule or None, error record or None)
+    """
+
+    n_cores = n_cores or os.cpu_count()
+    # only the rdkit conformer generation is multi-threaded
+    max_threads = n_cores if options.get('engine', 'rdkit') == 'rdkit' else 1
+
+    molecules = iter(molecules)
+    pending, running = [], {}
+    free_cores = n_cores
+    with ProcessPoolExecutor(max_workers=n_cores, initializer=limit_blas_threads) as executor:
+        while True:
+            # fill the lookahead buffer
+            for item in molecules:
+                smiles, name = (item, None) if isinstance(item, str) else item
+                cost = molecule_cost(smiles)
+                pending.append((cost, smiles, name, int(np.clip(cost // cost_per_thread + 1, 1, max_threads))))
+                if len(pending) >= lookahead:
+                    break
+            if not pending and not running:
+                break
+
+            # start the most expensive molecules that fit, a molecule always starts on an idle pool
+            pending.sort(key=lambda job: job[0], reverse=True)
+            for job in list(pending):
+                cost, smiles, name, n_threads = job
+                if n_threads <= free_cores or not running:
+                    n_threads = min(n_threads, max(free_cores, 1))
+                    future = executor.submit(_build_molecule, smiles, name, options, n_threads)
+                    running[future] = n_threads
+                    free_cores -= n_threads
+                    pending.remove(job)
+                if free_cores <= 0:
+                    break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                free_cores += running.pop(future)
+                name, molecule, error = future.result()
+                if error is not None:
+                    logger.warning(f"Cannot create molecule {name} from {error['smiles']}: {error['error']} "
+                                   f"{error['message']}")
+                yield name, molecule, error
 
 
 class OldMolecule(object):
@@ -59,9 +59,7 @@ def OBMol_from_done_slurm_job(slurm_job) -> pybel.ob.OBMol:
     """
 
     assert slurm_job.status.value == helper_classes.slurm_status.done.value
-    le = gaussian_log_extractor(f"{slurm_job.directory}/{slurm_job.base_name}.log")
-    le.get_atom_labels()
-    le.get_geometry()
+    le = GaussianLogExtractor(f"{slurm_job.directory}/{slurm_job.base_name}.log")
     # create OBMol from can
     mol = input_to_OBMol(slurm_job.can, input_type="string", input_format="can")
     mol.AddHydrogens()
@@ -74,13 +72,43 @@ def OBMol_from_done_slurm_job(slurm_job) -> pybel.ob.OBMol:
     return mol
 
 
+def OBMol_coordinates(mol) -> np.ndarray:
+    """Coordinates of the atoms of an OBMol object, np.ndarray of shape (n_atoms, 3)."""
+
+    # parsing the xyz block is much faster than iterating the atoms through the bindings
+    lines = OBMol_to_string(mol, "xyz").splitlines()[2:]
+    return np.array([line.split()[1:4] for line in lines], dtype=float).reshape(-1, 3)
+
+
+def _rmsd_invariants(conformer_coordinates) -> tuple:
+    """Singular values of the centered coordinates and sorted interatomic distances of conformers. Both are \
+    invariant under rotations and permutations of the atoms, and give lower bounds of the RMSD of two conformers \
+    after optimal superposition under any permutation:
+    RMSD^2 >= sum((s_a - s_b)^2) / n_atoms and RMSD^2 >= sum((d_a - d_b)^2) / n_atoms^2.
+
+    :param conformer_coordinates: np.ndarray of shape (n_conformers, n_atoms, 3)
+    :return: tuple (np.ndarray of shape (n_conformers, 3), np.ndarray of shape (n_conformers, n_atom_pairs))
+    """
+
+    coords = conformer_coordinates - conformer_coordinates.mean(axis=1, keepdims=True)
+    singular_values = np.linalg.svd(coords, compute_uv=False)
+    i, j = np.triu_indices(coords.shape[1], k=1)
+    sorted_distances = np.sort(np.linalg.norm(coords[:, i] - coords[:, j], axis=-1), axis=1)
+    return singular_values, sorted_distances
+
+
 def deduplicate_list_of_OBMols(mols, RMSD_threshold, symmetry) -> list:
-    """Filter conformers based on their mutual RMSD, until all molecules have RMSD > threshold.
+    """Filter conformers based on their mutual RMSD, until all molecules have RMSD > threshold. Molecules are \
+    visited in order and a molecule is a duplicate if its RMSD to a previous molecule that is not a duplicate is \
+    below the threshold.
+
+    Molecules are only aligned with the previous non-duplicates whose RMSD lower bound (see _rmsd_invariants) is \
+    below the threshold, other pairs cannot be duplicates.
 
     :param mols: list of OBMol objects
     :param RMSD_threshold: RMSD threshold
     :param symmetry: boolean, if True symmetry is taken into account when comparing molecules in OBAlign(symmetry=True)
-    :return: list of indices in the mols list that are duplicates
+    :return: sorted list of indices in the mols list that are duplicates
     """
 
     # safety check, assert all mols convert to the same canonical smiles
@@ -92,16 +120,31 @@ def deduplicate_list_of_OBMols(mols, RMSD_threshold, symmetry) -> list:
 
     alignment = pybel.ob.OBAlign(True, symmetry)  # alignment class from OB
 
-    duplicate_indices = []
-    for i in range(len(mols) - 1):
-        alignment.SetRefMol(mols[i])
-        for j in range(i + 1, len(mols)):
-            alignment.SetTargetMol(mols[j])
+    singular_values, sorted_distances = _rmsd_invariants(np.array([OBMol_coordinates(mol) for mol in mols]))
+    n_atoms = mols[0].NumAtoms()
+
+    kept = [0]
+    duplicate_indices = set()
+    for j in range(1, len(mols)):
+        others = np.array(kept)
+        lower_bounds = np.maximum(
+            np.square(singular_values[others] - singular_values[j]).sum(axis=1) / n_atoms,
+            np.square(sorted_distances[others] - sorted_distances[j]).sum(axis=1) / n_atoms ** 2)
+        candidates = others[lower_bounds < RMSD_threshold ** 2]
+
+        # the RMSD is symmetric, the reference is set once per molecule (symmetry classes are computed for it)
+        if len(candidates):
+            alignment.SetRefMol(mols[j])
+        for i in candidates:
+            alignment.SetTargetMol(mols[i])
             alignment.Align()
-            if alignment.GetRMSD() < RMSD_threshold and i not in duplicate_indices:
-                duplicate_indices.append(j)
+            if alignment.GetRMSD() < RMSD_threshold:
+                duplicate_indices.add(j)
+                break
+        if j not in duplicate_indices:
+            kept.append(j)
 
-    return duplicate_indices
+    return sorted(duplicate_indices)
 
 
 def extract_from_obmol(mol, ) -> tuple([list, np.ndarray, np.ndarray, np.ndarray]):
@@ -131,14 +174,14 @@ def extract_from_obmol(mol, ) -> tuple([list, np.ndarray, np.ndarray, np.ndarray
     return elements, conformer_coordinates, connectivity_matrix, charges
 
 
-def generate_conformations_from_openbabel(smiles, num_conf, ob_gen3D_option='best'):
+def generate_conformations_from_openbabel(smiles, num_conf, ob_gen3d_option='best'):
     # initialize obmol
     obmol = pybel.readstring('smi', smiles).OBMol
     obmol.AddHydrogens()
 
     # initial geometry
     gen3D = pybel.ob.OBOp.FindType("gen3D")
-    gen3D.Do(obmol, ob_gen3D_option)
+    gen3D.Do(obmol, ob_gen3d_option)
 
     # conf search
     confSearch = pybel.ob.OBConformerSearch()
@@ -1,6 +1,9 @@
 import os
-import numpy as np
 import re
+import time
+import logging
+
+import numpy as np
 
 from rdkit import Chem, Geometry
 from rdkit.Chem import AllChem
@@ -20,6 +23,8 @@ except ImportError:
     GetSymbol = table.GetSymbol
     # GetVdwRad = table.GetVdwRad
 
+logger = logging.getLogger(__name__)
+
 
 def extract_from_rdmol(mol: Chem.Mol) -> tuple([list, np.ndarray, np.ndarray, np.ndarray]):
     """Extract information from RDKit Mol object with conformers."""
@@ -39,33 +44,61 @@ def extract_from_rdmol(mol: Chem.Mol) -> tuple([list, np.ndarray, np.ndarray, np
     return elements, conformer_coordinates, connectivity_matrix, charges
 
 
-def get_rdkit_mol(elements: list, conformer_coordinates: np.ndarray,
-                  connectivity_matrix: np.ndarray, charges: np.ndarray) -> Chem.Mol:
-    _RDKIT_BOND_TYPES = {
-        1.0: Chem.BondType.SINGLE,
-        1.5: Chem.BondType.AROMATIC,
-        2.0: Chem.BondType.DOUBLE,
-        3.0: Chem.BondType.TRIPLE,
-        4.0: Chem.BondType.QUADRUPLE,
-        5.0: Chem.BondType.QUINTUPLE,
-        6.0: Chem.BondType.HEXTUPLE,
-    }
+_RDKIT_BOND_TYPES = {
+    1.0: Chem.BondType.SINGLE,
+    1.5: Chem.BondType.AROMATIC,
+    2.0: Chem.BondType.DOUBLE,
+    3.0: Chem.BondType.TRIPLE,
+    4.0: Chem.BondType.QUADRUPLE,
+    5.0: Chem.BondType.QUINTUPLE,
+    6.0: Chem.BondType.HEXTUPLE,
+}
+
+
+def bonds_from_connectivity(connectivity_matrix: np.ndarray) -> tuple:
+    """Sparse bond list of a connectivity matrix, in the order of its lower triangle.
+
+    :param connectivity_matrix: bond orders, np.ndarray of shape (n_atoms, n_atoms)
+    :return: tuple (atom index pairs, np.ndarray of shape (n_bonds, 2), bond orders, np.ndarray of shape (n_bonds,))
+    """
+
+    connectivity_matrix = np.asarray(connectivity_matrix)
+    i, j = np.nonzero(np.tril(connectivity_matrix, -1))
+    return np.stack([i, j], axis=1).astype(np.int32), connectivity_matrix[i, j].astype(np.float32)
+
+
+def connectivity_from_bonds(n_atoms, bonds: np.ndarray, bond_orders: np.ndarray) -> np.ndarray:
+    """Dense connectivity matrix of a sparse bond list, see bonds_from_connectivity."""
+
+    connectivity_matrix = np.zeros((n_atoms, n_atoms))
+    connectivity_matrix[bonds[:, 0], bonds[:, 1]] = bond_orders
+    connectivity_matrix[bonds[:, 1], bonds[:, 0]] = bond_orders
+    return connectivity_matrix
+
+
+def rdmol_from_bonds(atomic_numbers, charges, bonds: np.ndarray, bond_orders: np.ndarray,
+                     conformer_coordinates: np.ndarray) -> Chem.Mol:
+    """Create an RDKit Mol object from atoms, a sparse bond list and conformer coordinates.
+
+    :param atomic_numbers: atomic numbers of the atoms
+    :param charges: formal charges of the atoms
+    :param bonds: atom index pairs, np.ndarray of shape (n_bonds, 2)
+    :param bond_orders: bond orders, np.ndarray of shape (n_bonds,)
+    :param conformer_coordinates: conformer coordinates (Å), np.ndarray of shape (n_conformers, n_atoms, 3)
+    :return: RDKit Mol object
+    """
 
     mol = Chem.RWMol()
 
     # Add atoms
-    for element, charge in zip(elements, charges):
-        atom = Chem.Atom(element)
+    for atomic_number, charge in zip(atomic_numbers, charges):
+        atom = Chem.Atom(int(atomic_number))
         atom.SetFormalCharge(int(charge))
         mol.AddAtom(atom)
 
     # Add bonds
-    for i, j in zip(*np.tril_indices_from(connectivity_matrix)):
-        if i != j:
-            bo = connectivity_matrix[i, j]
-            if bo != 0:
-                bond_type = _RDKIT_BOND_TYPES[float(bo)]
-                mol.AddBond(int(i), int(j), bond_type)
+    for (i, j), bo in zip(bonds, bond_orders):
+        mol.AddBond(int(i), int(j), _RDKIT_BOND_TYPES[float(bo)])
 
     # Add conformers
     add_conformers_to_rdmol(mol, conformer_coordinates)
@@ -76,40 +109,58 @@ def get_rdkit_mol(elements: list, conformer_coordinates: np.ndarray,
     return mol
 
 
+def get_rdkit_mol(elements: list, conformer_coordinates: np.ndarray,
+                  connectivity_matrix: np.ndarray, charges: np.ndarray) -> Chem.Mol:
+
+    atomic_numbers = [Chem.GetPeriodicTable().GetAtomicNumber(element) for element in elements]
+    bonds, bond_orders = bonds_from_connectivity(connectivity_matrix)
+    return rdmol_from_bonds(atomic_numbers, charges, bonds, bond_orders, conformer_coordinates)
+
+
 def add_conformers_to_rdmol(mol: Chem.Mol, conformer_coordinates: np.ndarray) -> None:
     """Add conformers to RDKit Mol object.
     Args:
         mol: RDKit mol object
         conformer_coordinates: Conformer coordinates (Å)
     """
-    conformer_coordinates = np.array(conformer_coordinates)
+    conformer_coordinates = np.array(conformer_coordinates, dtype=float)
     if len(conformer_coordinates.shape) == 2:
-        conformer_coordinates.reshape(-1, conformer_coordinates.shape[0], 3)
+        conformer_coordinates = conformer_coordinates.reshape(-1, conformer_coordinates.shape[0], 3)
 
     for coordinates in conformer_coordinates:
-        conformer = Chem.Conformer()
-        for i, coord in enumerate(coordinates):
-            point = Geometry.Point3D(*coord)
-            conformer.SetAtomPosition(i, point)
+        conformer = Chem.Conformer(len(coordinates))
+        if hasattr(conformer, 'SetPositions'):
+            # set all positions at once, available in recent RDKit versions
+            conformer.SetPositions(coordinates)
+        else:
+            for i, coord in enumerate(coordinates):
+                conformer.SetAtomPosition(i, Geometry.Point3D(*coord))
         mol.AddConformer(conformer, assignId=True)
 
 
-def generate_conformations_from_rdkit(smiles, num_conf, rdkit_ff='MMFF94', n_threads=os.cpu_count() - 1):
-    """Generate conformational ensemble using a method of choice"""
+# embedding parameters of the conformer generation, they are part of the conformer cache keys
+embed_parameters = {'useSymmetryForPruning': True,
+                    'useSmallRingTorsions': True,
+                    'useMacrocycleTorsions': True,
+                    'ETversion': 2,
+                    'pruneRmsThresh': 0.35}
 
-    # initialize rdmol
-    rdmol = Chem.AddHs(Chem.MolFromSmiles(smiles))
+
+def _embed_parameters(n_threads, random_seed=None) -> AllChem.EmbedParameters:
+    """RDKit embedding parameters, see embed_parameters."""
 
     params = AllChem.EmbedParameters()
-    params.useSymmetryForPruning = True
-    params.useSmallRingTorsions = True
-    params.useMacrocycleTorsions = True
-    params.ETversion = 2
-    params.pruneRmsThresh = 0.35
+    for name, value in embed_parameters.items():
+        setattr(params, name, value)
     params.numThreads = n_threads
+    if random_seed is not None:
+        params.randomSeed = random_seed
+    return params
+
+
+def _optimize_conformers(rdmol, rdkit_ff, n_threads) -> None:
+    """Optimize all the conformers of a molecule with a force field."""
 
-    # embed and optimized conformers
-    AllChem.EmbedMultipleConfs(rdmol, num_conf, params)
     if rdkit_ff == "MMFF94":
         AllChem.MMFFOptimizeMoleculeConfs(rdmol, mmffVariant="MMFF94", numThreads=n_threads)
     elif rdkit_ff == "MMFF94s":
@@ -117,11 +168,161 @@ def generate_conformations_from_rdkit(smiles, num_conf, rdkit_ff='MMFF94', n_thr
     elif rdkit_ff == "UFF":
         AllChem.UFFOptimizeMoleculeConfs(rdmol, numThreads=n_threads)
 
+
+def generate_conformations_from_rdkit(smiles, num_conf, rdkit_ff='MMFF94', n_threads=os.cpu_count() - 1,
+                                      random_seed=None):
+    """Generate conformational ensemble using a method of choice
+
+    :param random_seed: seed of the embedding, the conformers are reproducible for a given seed and any n_threads
+    """
+
+    # initialize rdmol
+    rdmol = Chem.AddHs(Chem.MolFromSmiles(smiles))
+
+    # embed and optimized conformers
+    AllChem.EmbedMultipleConfs(rdmol, num_conf, _embed_parameters(n_threads, random_seed))
+    _optimize_conformers(rdmol, rdkit_ff, n_threads)
+
     elements, conformer_coordinates, connectivity_matrix, charges = extract_from_rdmol(rdmol)
 
     return elements, conformer_coordinates, connectivity_matrix, charges
 
 
+def generate_conformations_adaptively(smiles, max_conf=300, rdkit_ff='MMFF94', n_threads=os.cpu_count() - 1,
+                                      random_seed=None, round_size=20, min_discovery_rate=0.05, max_time=None,
+                                      energy_window=10., energy_tolerance=0.05, rmsd_threshold=0.35,
+                                      use_symmetry=True, max_matches=1000) -> tuple:
+    """Generate a conformational ensemble in rounds of embedding and optimization, until the ensemble converges.
+
+    After each round, the optimized conformers are compared with the unique conformers found so far: a conformer is \
+    a duplicate if its energy is within energy_tolerance and its heavy atom RMSD (see _rmsd_atom_ids) within \
+    rmsd_threshold of a unique conformer. The discovery rate of the round is its number of new unique conformers \
+    within energy_window of the lowest energy, per embedding attempted. Sampling stops when the discovery rate falls \
+    below min_discovery_rate, when max_conf embeddings were attempted or when max_time is exceeded. Rounds in which \
+    no conformer could be embedded do not count as converged, and a ValueError is raised if no conformer could be \
+    embedded at all.
+
+    :param smiles: smiles string
+    :param max_conf: maximum number of embeddings
+    :param rdkit_ff: force field of the optimization and of the energies, 'MMFF94', 'MMFF94s' or 'UFF'
+    :param n_threads: number of threads of the embedding and of the optimization
+    :param random_seed: seed of the embedding, the rounds are reproducible for a given seed
+    :param round_size: number of embeddings per round
+    :param min_discovery_rate: minimum discovery rate to start another round
+    :param max_time: maximum time (seconds) to start another round, no limit if None
+    :param energy_window: window (kcal/mol) above the lowest energy of the conformers counted as discoveries
+    :param energy_tolerance: energy difference (kcal/mol) below which two conformers may be duplicates
+    :param rmsd_threshold: heavy atom RMSD (Angstroms) below which two conformers may be duplicates
+    :param use_symmetry: take the RMSD over the best symmetry permutation of the atoms, see symmetry_permutations
+    :param max_matches: maximum number of symmetry permutations
+    :return: tuple (elements, conformer_coordinates, connectivity_matrix, charges, statistics), the unique \
+    conformers in order of energy, and a list of dictionaries with the statistics of each round
+    """
+
+    rdmol = Chem.AddHs(Chem.MolFromSmiles(smiles))
+    atom_ids = _rmsd_atom_ids(rdmol)
+    n_atoms = len(atom_ids)
+    if use_symmetry:
+        permutations = symmetry_permutations(rdmol, True, max_matches)
+    else:
+        permutations = np.arange(n_atoms)[np.newaxis]
+
+    # unique conformers come first, the candidate of the dedup is written after them
+    coordinates = np.empty((max_conf, rdmol.GetNumAtoms(), 3))
+    rows = np.empty((max_conf, 3, n_atoms))
+    norms = np.empty(max_conf)
+    singular_values = np.empty((max_conf, 3))
+    energies = np.empty(max_conf)
+    n_unique = 0
+
+    statistics = []
+    n_embedded = 0
+    start_time = time.perf_counter()
+    while True:
+        n = min(round_size, max_conf - n_embedded)
+        # embeddings of a round are pruned by RMSD (see embed_parameters) before their optimization
+        round_mol = Chem.Mol(rdmol)
+        seed = random_seed + n_embedded if random_seed is not None else None
+        AllChem.EmbedMultipleConfs(round_mol, n, _embed_parameters(n_threads, seed))
+        n_embedded += n
+        if round_mol.GetNumConformers():
+            _optimize_conformers(round_mol, rdkit_ff, n_threads)
+            round_energies = force_field_energies(round_mol, rdkit_ff)[0]
+        else:
+            round_energies = np.empty(0)
+        round_coordinates = np.array([conformer.GetPositions() for conformer in round_mol.GetConformers()])
+        n_new = n_new_low_energy = 0
+        for i in np.argsort(round_energies, kind='stable'):
+            coordinates[n_unique] = round_coordinates[i]
+            rows[n_unique:n_unique + 1], norms[n_unique:n_unique + 1] = _centered_rows(
+                round_coordinates[i:i + 1, atom_ids])
+            singular_values[n_unique] = np.linalg.svd(rows[n_unique], compute_uv=False)
+            energies[n_unique] = round_energies[i]
+
+            # conformers without energies (no force field applies) are compared by RMSD only
+            close = np.flatnonzero(~(np.abs(energies[:n_unique] - round_energies[i]) > energy_tolerance))
+            if _rmsd_duplicate(n_unique, close, rows, norms, singular_values, permutations, rmsd_threshold):
+                continue
+            n_unique += 1
+            n_new += 1
+            if not round_energies[i] - np.min(energies[:n_unique]) > energy_window:
+                n_new_low_energy += 1
+
+        elapsed = time.perf_counter() - start_time
+        discovery_rate = n_new_low_energy / n if n else 0.
+        # a round without any embedded conformer says nothing about the convergence, the next round has a new seed
+        if len(round_coordinates) and discovery_rate < min_discovery_rate:
+            stop = 'converged'
+        elif n_embedded >= max_conf:
+            stop = 'max_conf'
+        elif max_time is not None and elapsed >= max_time:
+            stop = 'max_time'
+        else:
+            stop = None
+        statistics.append({'round': len(statistics), 'n_embedded': n, 'n_optimized': len(round_coordinates),
+                           'n_new': n_new, 'n_new_low_energy': n_new_low_energy, 'discovery_rate': discovery_rate,
+                           'n_unique': n_unique, 'min_energy': float(np.min(energies[:n_unique], initial=np.inf)),
+                           'elapsed': elapsed, 'stop': stop})
+        logger.debug(f"Sampling round {statistics[-1]}")
+        if stop is not None:
+            break
+
+    if not n_unique:
+        raise ValueError(f"Cannot embed any conformer of {smiles} in {n_embedded} attempts.")
+
+    logger.info(f"Sampled {n_unique} unique conformers of {smiles} from {n_embedded} embeddings in "
+                f"{len(statistics)} rounds ({stop}).")
+
+    order = np.argsort(energies[:n_unique], kind='stable')
+    add_conformers_to_rdmol(rdmol, coordinates[order])
+    elements, conformer_coordinates, connectivity_matrix, charges = extract_from_rdmol(rdmol)
+
+    return elements, conformer_coordinates, connectivity_matrix, charges, statistics
+
+
+def force_field_energies(rdmol, rdkit_ff='MMFF94') -> tuple:
+    """Force field energies (kcal/mol) of the conformers of a molecule. MMFF variants fall back to UFF for molecules \
+    without MMFF parameters (e.g. some salts).
+
+    :param rdmol: RDKit Mol object with conformers
+    :param rdkit_ff: 'MMFF94', 'MMFF94s' or 'UFF'
+    :return: tuple (np.ndarray of energies, name of the force field used), energies are nan if no force field applies
+    """
+
+    conf_ids = [conformer.GetId() for conformer in rdmol.GetConformers()]
+    if rdkit_ff in ('MMFF94', 'MMFF94s'):
+        props = AllChem.MMFFGetMoleculeProperties(rdmol, mmffVariant=rdkit_ff)
+        if props is not None:
+            return np.array([AllChem.MMFFGetMoleculeForceField(rdmol, props, confId=i).CalcEnergy()
+                             for i in conf_ids]), rdkit_ff
+    elif rdkit_ff != 'UFF':
+        raise ValueError(f"Not supported force field {rdkit_ff}. Allowed force fields are: MMFF94, MMFF94s, UFF.")
+
+    if AllChem.UFFHasAllMoleculeParams(rdmol):
+        return np.array([AllChem.UFFGetMoleculeForceField(rdmol, confId=i).CalcEnergy() for i in conf_ids]), 'UFF'
+    return np.full(len(conf_ids), np.nan), None
+
+
 def get_light_and_heavy_elements(mol: Chem.Mol, max_light_atomic_number: int) -> tuple:
     """Group molecule elements into light and heavy."""
 
@@ -146,18 +347,14 @@ def rdmol_from_slurm_jobs(jobs, postDFT=True, ordered=False):
     for j in jobs:
         if postDFT == True:
 
-            le = gaussian_log_extractor(f"{j.directory}/{j.base_name}.log")
+            le = GaussianLogExtractor(f"{j.directory}/{j.base_name}.log")
             le.check_for_exceptions()
-            le.get_atom_labels()
 
             # verify that the labels are in the same order in gaussian after running it
             assert tuple(le.labels) == tuple(elements)
 
-            le.get_geometry()
             conformer_coordinates.append(le.geom[list('XYZ')].values)
-
-            le._get_freq_part_descriptors()
-            energies.append(le.descriptors['G'])
+            energies.append(le.freq_descriptors['G'])
 
         else:
             with open(f"{j.directory}/{j.base_name}.gjf") as f:
@@ -180,46 +377,226 @@ def rdmol_from_slurm_jobs(jobs, postDFT=True, ordered=False):
     return rdmol, energies
 
 
-def get_rmsd_rdkit(rdmol):
-    """Calculate RMSD row-wise with RDKit."""
+def _qcp_coefficients(h) -> tuple:
+    """Coefficients C2, C1, C0 of the characteristic polynomial x^4 + C2 x^2 + C1 x + C0 of the quaternion key \
+    matrix of covariance matrices (Theobald, Acta Cryst. A61, 478 (2005)).
 
-    # Construct atom list for rmsd: do not include hydrogen
-    atom_ids = [atom.GetIdx() for atom in rdmol.GetAtoms() if atom.GetAtomicNum() != 1]
+    :param h: covariance matrices, np.ndarray of shape (3, 3, ...)
+    :return: tuple of np.ndarray
+    """
+
+    (sxx, sxy, sxz), (syx, syy, syz), (szx, szy, szz) = h
+    sxx2, syy2, szz2, sxy2, syz2, sxz2, syx2, szy2, szx2 = (x * x for x in (sxx, syy, szz, sxy, syz, sxz, syx, szy,
+                                                                             szx))
+
+    c2 = -2. * (sxx2 + syy2 + szz2 + sxy2 + syx2 + sxz2 + szx2 + syz2 + szy2)
+    c1 = 8. * (sxx * syz * szy + syy * szx * sxz + szz * sxy * syx - sxx * syy * szz - syz * szx * sxy
+               - szy * syx * sxz)
+
+    d2 = 2. * (syz * szy - syy * szz)
+    e2 = syy2 + szz2 - sxx2 + syz2 + szy2
+    f2 = sxy2 + sxz2 - syx2 - szx2
+    sxz_p, syz_p, sxy_p = sxz + szx, syz + szy, sxy + syx
+    sxz_m, syz_m, sxy_m = sxz - szx, syz - szy, sxy - syx
+    sxx_p, sxx_m = sxx + syy, sxx - syy
+    c0 = f2 * f2 + (e2 + d2) * (e2 - d2) \
+        + (-sxz_p * syz_m + sxy_m * (sxx_m - szz)) * (-sxz_m * syz_p + sxy_m * (sxx_m + szz)) \
+        + (-sxz_p * syz_p - sxy_p * (sxx_p - szz)) * (-sxz_m * syz_m - sxy_p * (sxx_p + szz)) \
+        + (sxy_p * syz_p + sxz_p * (sxx_m + szz)) * (-sxy_m * syz_m + sxz_p * (sxx_p + szz)) \
+        + (sxy_p * syz_m + sxz_m * (sxx_m - szz)) * (-sxy_m * syz_p + sxz_m * (sxx_p - szz))
+
+    return c2, c1, c0
+
+
+def _qcp_rmsds(a, b, norms_a, norms_b, max_iterations=50) -> np.ndarray:
+    """RMSDs after optimal superposition of all pairs of two sets of centered conformers, see rmsd_matrix.
+
+    :param a: centered conformer coordinates as rows, np.ndarray of shape (n_a * 3, n_atoms)
+    :param b: centered conformer coordinates as rows, np.ndarray of shape (n_b * 3, n_atoms)
+    :param norms_a: squared norms of the conformers of a, np.ndarray of shape (n_a,)
+    :param norms_b: squared norms of the conformers of b, np.ndarray of shape (n_b,)
+    :param max_iterations: maximum number of Newton iterations for the largest eigenvalue of the key matrix
+    :return: np.ndarray of shape (n_a, n_b)
+    """
+
+    # covariance matrices of all pairs, as (3, 3, n_a, n_b) with contiguous components
+    h = (a @ b.T).reshape(len(a) // 3, 3, len(b) // 3, 3).transpose(1, 3, 0, 2).copy()
+    c2, c1, c0 = _qcp_coefficients(h)
+
+    # the largest eigenvalue of the key matrix, by Newton iterations from its upper bound
+    e0 = (norms_a[:, np.newaxis] + norms_b[np.newaxis, :]) / 2.
+    eigenvalue = e0.copy()
+    for _ in range(max_iterations):
+        x2 = eigenvalue * eigenvalue
+        f = (x2 + c2) * x2 + c1 * eigenvalue + c0
+        df = 4. * x2 * eigenvalue + 2. * c2 * eigenvalue + c1
+        # the derivative vanishes for conformers without extent (e.g. a single heavy atom)
+        step = np.divide(f, df, out=np.zeros_like(f), where=df != 0)
+        eigenvalue -= step
+        if np.all(np.abs(step) <= 1e-11 * np.abs(eigenvalue)):
+            break
+
+    return np.sqrt(np.maximum(2. * (e0 - eigenvalue), 0.) / a.shape[1])
+
+
+def _centered_rows(conformer_coordinates: np.ndarray) -> tuple:
+    """Center conformers and lay out their coordinates as rows.
+
+    :param conformer_coordinates: conformer coordinates, np.ndarray of shape (n_conformers, n_atoms, 3)
+    :return: tuple (np.ndarray of shape (n_conformers, 3, n_atoms), np.ndarray of the squared norms)
+    """
 
-    # Calculated RMSD row-wise with RDKit
-    rmsds = []
-    conformers = list(rdmol.GetConformers())
-    for i in range(len(conformers)):
-        ref_mol = Chem.Mol(rdmol)
-        ref_conformer = conformers[i]
-        ref_mol.RemoveAllConformers()
-        ref_mol.AddConformer(ref_conformer)
-        for j in range(len(conformers)):
-            conformer = conformers[j]
-            ref_mol.AddConformer(conformer)
-        rmsds_row = []
-        AllChem.AlignMolConformers(ref_mol, atomIds=atom_ids, RMSlist=rmsds_row)
-        rmsds.append(rmsds_row)
-    rmsds = np.array(rmsds)
+    coords = np.asarray(conformer_coordinates, dtype=float)
+    coords = coords - coords.mean(axis=1, keepdims=True)
+    norms = np.einsum('kai,kai->k', coords, coords)
+    return np.ascontiguousarray(coords.transpose(0, 2, 1)), norms
 
+
+def rmsd_matrix(conformer_coordinates: np.ndarray, block_size=512) -> np.ndarray:
+    """Calculate the RMSDs of all pairs of conformers after optimal superposition (rotations only), with the \
+    quaternion characteristic polynomial method (QCP), the RMSDs of RDKit AlignMolConformers.
+
+    Only the upper triangle is computed, in blocks of block_size x block_size pairs so that the memory stays bounded.
+
+    :param conformer_coordinates: conformer coordinates, np.ndarray of shape (n_conformers, n_atoms, 3)
+    :param block_size: number of conformers per block
+    :return: np.ndarray of shape (n_conformers, n_conformers), symmetric with zeros on the diagonal
+    """
+
+    rows, norms = _centered_rows(conformer_coordinates)
+    n_conf, n_atoms = rows.shape[0], rows.shape[2]
+    rows = rows.reshape(n_conf * 3, n_atoms)
+
+    rmsds = np.zeros((n_conf, n_conf))
+    for i in range(0, n_conf, block_size):
+        for j in range(i, n_conf, block_size):
+            block = _qcp_rmsds(rows[3 * i:3 * (i + block_size)], rows[3 * j:3 * (j + block_size)],
+                               norms[i:i + block_size], norms[j:j + block_size])
+            rmsds[i:i + block_size, j:j + block_size] = block
+            rmsds[j:j + block_size, i:i + block_size] = block.T
+
+    np.fill_diagonal(rmsds, 0.)
     return rmsds
 
 
-def prune_rmsds(rdmol, thres):
-    """Get a list of conformer indices to keep"""
+def get_rmsd_rdkit(rdmol, block_size=512):
+    """Calculate the heavy atom RMSDs (see _rmsd_atom_ids) of all pairs of conformers after alignment, see \
+    rmsd_matrix."""
+
+    atom_ids = _rmsd_atom_ids(rdmol)
+    conformer_coordinates = np.array([conformer.GetPositions()[atom_ids] for conformer in rdmol.GetConformers()])
+
+    return rmsd_matrix(conformer_coordinates, block_size)
+
+
+def _rmsd_atom_ids(rdmol, heavy_atoms_only=True) -> list:
+    """Indices of the atoms of the RMSDs: the atoms other than hydrogen (including isotopes, e.g. deuterium) if \
+    heavy_atoms_only, all the atoms if heavy_atoms_only is False or the molecule has no heavy atoms (e.g. H2)."""
+
+    atom_ids = [atom.GetIdx() for atom in rdmol.GetAtoms() if atom.GetAtomicNum() != 1]
+    if not heavy_atoms_only or not atom_ids:
+        atom_ids = list(range(rdmol.GetNumAtoms()))
+    return atom_ids
+
+
+def symmetry_permutations(rdmol, heavy_atoms_only=True, max_matches=1000) -> np.ndarray:
+    """Permutations of the atoms of a molecule that map its graph onto itself (e.g. the two oxygens of a \
+    carboxylate), from the substructure matches of the molecule on itself.
+
+    :param rdmol: RDKit Mol object
+    :param heavy_atoms_only: permute the atoms of the RMSDs only (see _rmsd_atom_ids), positions are then those of \
+    these atoms in order
+    :param max_matches: maximum number of permutations
+    :return: np.ndarray of shape (n_permutations, n_atoms), the first permutation is the identity
+    """
+
+    atom_ids = _rmsd_atom_ids(rdmol, heavy_atoms_only)
+    identity = tuple(range(len(atom_ids)))
+    if len(atom_ids) < 2:
+        return np.array([identity], dtype=int)
+
+    # the query holds the atoms of the RMSDs only, its matches on the molecule are remapped to their positions
+    query = Chem.RWMol(rdmol)
+    for i in sorted(set(range(rdmol.GetNumAtoms())) - set(atom_ids), reverse=True):
+        query.RemoveAtom(i)
+    positions = {atom_id: k for k, atom_id in enumerate(atom_ids)}
+    matches = rdmol.GetSubstructMatches(query, uniquify=False, useChirality=False, maxMatches=max_matches)
+    permutations = [tuple(positions[i] for i in match) for match in matches if all(i in positions for i in match)]
+    return np.array([identity] + [p for p in permutations if p != identity], dtype=int)
+
+
+def _rmsd_duplicate(candidate, others, rows, norms, singular_values, permutations, thres, block_size=512) -> bool:
+    """Whether the RMSD of a conformer to any of the others is at most thres.
+
+    The singular values of the centered coordinates are invariant under rotations and permutations of the atoms, \
+    the distance between those of two conformers is a lower bound of their RMSD: the RMSDs are computed only for \
+    the others whose lower bound is at most thres.
+
+    :param candidate: index of the conformer
+    :param others: indices of the other conformers
+    :param rows: centered conformer coordinates as rows, see _centered_rows
+    :param norms: squared norms of the conformers
+    :param singular_values: singular values of the centered conformer coordinates
+    :param permutations: permutations of the atoms of the conformer, see symmetry_permutations
+    :param thres: RMSD threshold in Angstroms
+    :param block_size: number of other conformers compared at once
+    :return: bool
+    """
+
+    n_atoms = rows.shape[2]
+    lower_bounds = np.sqrt(np.square(singular_values[others] - singular_values[candidate]).sum(axis=1) / n_atoms)
+    close = others[lower_bounds <= thres]
+
+    # coordinates of the candidate under each permutation, as rows
+    a = rows[candidate][:, permutations].transpose(1, 0, 2).reshape(-1, n_atoms)
+    norms_a = np.full(len(permutations), norms[candidate])
+    for start in range(0, len(close), block_size):
+        others_block = close[start:start + block_size]
+        rmsds = _qcp_rmsds(a, rows[others_block].reshape(-1, n_atoms), norms_a, norms[others_block])
+        if (rmsds.min(axis=0) <= thres).any():
+            return True
+    return False
+
+
+def prune_rmsds(rdmol, thres, energies=None, heavy_atoms_only=True, use_symmetry=False, max_matches=1000,
+                block_size=512):
+    """Get a list of conformer indices to keep: conformers are visited in order and a conformer is kept if its \
+    RMSD to every kept conformer is larger than thres.
+
+    RMSDs are computed lazily between each conformer and the kept conformers only, and not for the kept \
+    conformers whose principal axes lower bound of the RMSD is already larger than thres. The full RMSD matrix is \
+    never built.
+
+    :param rdmol: RDKit Mol object with conformers
+    :param thres: RMSD threshold in Angstroms
+    :param energies: energies of the conformers, conformers are visited from the lowest energy if given, \
+    in index order otherwise
+    :param heavy_atoms_only: compute the RMSDs over the heavy atoms only, see _rmsd_atom_ids
+    :param use_symmetry: take the RMSD over the best symmetry permutation of the atoms, see symmetry_permutations
+    :param max_matches: maximum number of symmetry permutations
+    :param block_size: number of kept conformers compared at once
+    :return: list of conformer indices to keep, in visiting order
+    """
+
+    atom_ids = _rmsd_atom_ids(rdmol, heavy_atoms_only)
+    conformer_coordinates = np.array([conformer.GetPositions()[atom_ids] for conformer in rdmol.GetConformers()])
+    if not len(conformer_coordinates):
+        return []
 
-    rmsds = get_rmsd_rdkit(rdmol)
+    rows, norms = _centered_rows(conformer_coordinates)
+    n_atoms = len(atom_ids)
+    if use_symmetry:
+        permutations = symmetry_permutations(rdmol, heavy_atoms_only, max_matches)
+    else:
+        permutations = np.arange(n_atoms)[np.newaxis]
 
-    working_array = rmsds
-    candidates = np.array(range(rdmol.GetNumConformers()))
+    singular_values = np.linalg.svd(rows, compute_uv=False)
 
+    order = np.argsort(energies, kind='stable') if energies is not None else np.arange(len(rows))
     keep_list = []
-    while len(working_array) > 0:
-        keeper = candidates[0]
-        keep_list.append(keeper)
-        rmsd = working_array[0]
-        mask = rmsd > thres
-        candidates = candidates[mask]
-        working_array = working_array[mask, :][:, mask]
+    for candidate in order:
+        if not _rmsd_duplicate(candidate, np.array(keep_list, dtype=int), rows, norms, singular_values, permutations,
+                               thres, block_size):
+            keep_list.append(int(candidate))
 
     return keep_list
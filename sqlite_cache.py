@@ -0,0 +1,138 @@
+import os
+import time
+import sqlite3
+import argparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteCache(object):
+    """Persistent least recently used cache in a SQLite database, the base of ExtractionCache and ConformerCache.
+
+    Entries are blobs stored in a table with their key, a group (the entries dropped together by invalidate, e.g.
+    all the entries of a molecule), their size and their last access time. When the stored blobs exceed max_size
+    bytes, the least recently used entries are evicted. Subclasses define the keys, the groups and the serialization
+    of the values."""
+
+    # names of the table of the entries and of its group column
+    table = 'entries'
+    group_column = 'item'
+
+    def __init__(self, db_path, max_size=1 << 30, timeout=5.):
+        """Open or create the cache.
+
+        :param db_path: path of the SQLite database
+        :param max_size: maximum total size (bytes) of the stored blobs
+        :param timeout: time (seconds) to wait for the database lock of another process
+        """
+
+        self.db_path = db_path
+        self.max_size = max_size
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.connection = sqlite3.connect(db_path, timeout=timeout)
+        with self.connection:
+            self._create_tables()
+
+    def _create_tables(self) -> None:
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS {self.table} "
+                                f"(key TEXT PRIMARY KEY, {self.group_column} TEXT, value BLOB, size INTEGER, "
+                                f"last_access REAL)")
+        self.connection.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_last_access ON {self.table} (last_access)")
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _get(self, key):
+        """Get the blob of a key and update its last access time.
+
+        :param key: cache key
+        :return: bytes, None if not cached
+        """
+
+        row = self.connection.execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        with self.connection:
+            self.connection.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def _put(self, key, group, blob) -> None:
+        """Store the blob of a key and evict the least recently used entries beyond max_size.
+
+        :param key: cache key
+        :param group: group of the entry, see invalidate
+        :param blob: bytes
+        """
+
+        with self.connection:
+            self.connection.execute(f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?, ?)",
+                                    (key, group, blob, len(blob), time.time()))
+            self._evict()
+
+    def _evict(self) -> None:
+        """Delete the least recently used entries until the stored blobs fit in max_size."""
+
+        total = self.connection.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+        if total <= self.max_size:
+            return
+        for key, size in self.connection.execute(f"SELECT key, size FROM {self.table} ORDER BY last_access").fetchall():
+            self.connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_size:
+                break
+        logger.info(f"Evicted entries of {self.db_path}, {total} bytes left.")
+
+    def _drop_group(self, group) -> int:
+        """Delete the entries of a group, within a transaction of the caller.
+
+        :return: number of entries dropped
+        """
+
+        return self.connection.execute(f"DELETE FROM {self.table} WHERE {self.group_column} = ?", (group,)).rowcount
+
+    def clear(self) -> None:
+        """Drop all the entries."""
+
+        with self.connection:
+            self.connection.execute(f"DELETE FROM {self.table}")
+        self.connection.execute("VACUUM")
+
+    def stats(self) -> dict:
+        """Number of entries and groups, and total size of the stored blobs."""
+
+        n_entries, n_groups, size = self.connection.execute(
+            f"SELECT COUNT(*), COUNT(DISTINCT {self.group_column}), COALESCE(SUM(size), 0) "
+            f"FROM {self.table}").fetchone()
+        return {'entries': n_entries, 'groups': n_groups, 'size': size}
+
+
+def main(cache_class, description, metavar, invalidate_help, args=None) -> None:
+    """Command line to inspect or invalidate a cache.
+
+    :param cache_class: SQLiteCache subclass, its invalidate method takes the items given on the command line
+    :param description: description of the command
+    :param metavar: name of the items of --invalidate
+    :param invalidate_help: help of --invalidate
+    :param args: command line arguments, sys.argv if None
+    """
+
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("db_path", help="path of the cache database")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--clear", action="store_true", help="drop all cached entries")
+    group.add_argument("--invalidate", nargs="+", metavar=metavar, help=invalidate_help)
+    args = parser.parse_args(args)
+
+    with cache_class(args.db_path) as cache:
+        if args.clear:
+            cache.clear()
+        elif args.invalidate:
+            print(f"Dropped {cache.invalidate(args.invalidate)} entries.")
+        print(cache.stats())
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+import autobot
+from autobot import AutoBot
+
+
+def test_extract_features_cache_is_opt_in(tmp_path, write_gaussian_log, monkeypatch):
+    write_gaussian_log(tmp_path / "water" / "water_conf_0.out")
+    write_gaussian_log(tmp_path / "water" / "water_conf_1.out.gz", seed=1)
+    bot = AutoBot(str(tmp_path))
+
+    features = bot.extract_features()
+    assert sorted(features) == ['water_conf_0', 'water_conf_1']
+    assert not os.path.exists(tmp_path / "cache")
+
+    cache_path = str(tmp_path / "extraction.sqlite")
+    assert bot.extract_features(extraction_cache=cache_path).keys() == features.keys()
+    # the descriptors come from the cache, nothing is extracted again
+    monkeypatch.setattr(autobot, '_extract_log_features', lambda path, options=None: 1 / 0)
+    cached = list(bot.iter_features(extraction_cache=cache_path))
+    assert sorted(conf_name for conf_name, _, _ in cached) == ['water_conf_0', 'water_conf_1']
+    assert [f['descriptors'] for _, f, _ in sorted(cached, key=lambda c: c[0])] == \
+        [features[conf_name]['descriptors'] for conf_name in sorted(features)]
+
+
+@pytest.mark.parametrize("duplicate", ["water/water_conf_0.out.gz", "other/water_conf_0.out"])
+def test_extract_features_conformer_name_collision(tmp_path, write_gaussian_log, duplicate):
+    write_gaussian_log(tmp_path / "water" / "water_conf_0.out")
+    write_gaussian_log(tmp_path / duplicate, seed=1)
+    write_gaussian_log(tmp_path / "water" / "water_conf_1.out", seed=2)
+    bot = AutoBot(str(tmp_path))
+    features = bot.extract_features()
+    assert list(features) == ['water_conf_1']
+    assert len(bot.extraction_errors) == 1
+    error = bot.extraction_errors[0]
+    assert error['conf_name'] == 'water_conf_0' and error['error'] == 'ValueError'
+    assert str(tmp_path / duplicate) in error['path'] and str(tmp_path / duplicate) in error['message']
+
+
+def test_extract_features_out_files_only(tmp_path, write_gaussian_log):
+    # Gaussian .log files are not picked up, the generated jobs write .out files
+    write_gaussian_log(tmp_path / "water" / "water_conf_0.out")
+    write_gaussian_log(tmp_path / "water" / "water_conf_0.log", seed=1)
+    bot = AutoBot(str(tmp_path))
+    assert list(bot.extract_features()) == ['water_conf_0'] and bot.extraction_errors == []
+
+
+def test_extract_features_workers(tmp_path, write_gaussian_log):
+    for i in range(3):
+        write_gaussian_log(tmp_path / "water" / f"water_conf_{i}.out", seed=i)
+    bot = AutoBot(str(tmp_path))
+    features = bot.extract_features(n_workers=2, chunksize=1)
+    assert sorted(features) == ['water_conf_0', 'water_conf_1', 'water_conf_2']
+    assert {conf_name: f['descriptors'] for conf_name, f in features.items()} == \
+        {conf_name: f['descriptors'] for conf_name, f in bot.extract_features().items()}
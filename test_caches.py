@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+import pytest
+
+from extraction_cache import ExtractionCache
+from conformer_cache import ConformerCache, canonical_smiles
+import extraction_cache
+import conformer_cache
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "water_conf_0.out"
+    path.write_text(" Entering Gaussian System\n Normal termination of Gaussian 16\n")
+    return str(path)
+
+
+def test_extraction_cache_round_trip(tmp_path, log_file):
+    descriptors = {'descriptors': {'E': -76.4}, 'labels': ['O', 'H', 'H']}
+    with ExtractionCache(str(tmp_path / "cache" / "features.sqlite")) as cache:
+        key = cache.key(log_file, {'occupied_volume_radius': 3})
+        assert cache.get(key) is None
+        cache.put(key, descriptors)
+        assert cache.get(key) == descriptors
+        assert cache.key(log_file, {'occupied_volume_radius': 3}) == key
+        assert cache.key(log_file, {'occupied_volume_radius': 4}) != key
+        assert cache.stats()['entries'] == 1
+
+    # the cache persists, and the key changes with the content of the file
+    with ExtractionCache(str(tmp_path / "cache" / "features.sqlite")) as cache:
+        assert cache.get(key) == descriptors
+        with open(log_file, 'a') as f:
+            f.write(" appended\n")
+        assert cache.key(log_file, {'occupied_volume_radius': 3}) != key
+
+
+def test_extraction_cache_invalidate_and_clear(tmp_path, log_file):
+    with ExtractionCache(str(tmp_path / "features.sqlite")) as cache:
+        for radius in (3, 4):
+            cache.put(cache.key(log_file, {'occupied_volume_radius': radius}), {'radius': radius})
+        assert cache.stats() == {'entries': 2, 'size': cache.stats()['size'], 'files': 1}
+        assert cache.invalidate([log_file]) == 2
+        assert cache.stats()['entries'] == 0 and cache.stats()['files'] == 0
+
+        cache.put(cache.key(log_file), {})
+        cache.clear()
+        assert cache.stats()['entries'] == 0
+
+
+def test_extraction_cache_eviction(tmp_path):
+    paths = []
+    for i in range(3):
+        paths.append(str(tmp_path / f"mol_conf_{i}.out"))
+        with open(paths[-1], 'w') as f:
+            f.write(f"log {i}\n")
+    with ExtractionCache(str(tmp_path / "features.sqlite"), max_size=2500) as cache:
+        keys = [cache.key(path) for path in paths]
+        for key in keys:
+            cache.put(key, os.urandom(1000))
+        # the least recently used entry is evicted
+        assert cache.get(keys[0]) is None
+        assert cache.get(keys[2]) is not None
+
+
+def _ensemble(n_conformers=4, n_atoms=3):
+    rng = np.random.default_rng(0)
+    return (['O', 'H', 'H'], rng.normal(size=(n_conformers, n_atoms, 3)),
+            np.array([[0, 1, 1], [1, 0, 0], [1, 0, 0]]), np.zeros(n_atoms, dtype=int))
+
+
+def test_conformer_cache_round_trip(tmp_path):
+    elements, conformer_coordinates, connectivity_matrix, charges = _ensemble()
+    with ConformerCache(str(tmp_path / "conformers.sqlite")) as cache:
+        key = cache.key('O', {'num_conf': 4})
+        assert cache.get(key) is None
+        cache.put(key, 'O', elements, conformer_coordinates, connectivity_matrix, charges)
+        cached = cache.get(key)
+        assert cached[0] == elements
+        np.testing.assert_array_equal(cached[1], conformer_coordinates)
+        np.testing.assert_array_equal(cached[2], connectivity_matrix)
+        np.testing.assert_array_equal(cached[3], charges)
+        assert cache.key('[OH2]', {'num_conf': 4}) == key
+        assert cache.key('O', {'num_conf': 5}) != key
+
+
+@pytest.mark.parametrize("smiles", ['CCO', '[CH3:1][CH2:2]O', 'c1ccccc1-c1ccccc1'])
+def test_conformer_cache_invalidate(tmp_path, smiles):
+    ensemble = _ensemble()
+    with ConformerCache(str(tmp_path / "conformers.sqlite")) as cache:
+        for num_conf in (4, 8):
+            cache.put(cache.key(smiles, {'num_conf': num_conf}), smiles, *ensemble)
+        cache.put(cache.key('CC', {'num_conf': 4}), 'CC', *ensemble)
+        assert cache.stats()['molecules'] == 2
+        assert cache.invalidate([canonical_smiles(smiles)]) == 2
+        assert cache.stats()['entries'] == 1
+
+
+def test_cache_command_line(tmp_path, log_file, capsys, monkeypatch):
+    db_path = str(tmp_path / "features.sqlite")
+    with ExtractionCache(db_path) as cache:
+        cache.put(cache.key(log_file), {})
+    monkeypatch.setattr('sys.argv', ['extraction_cache.py', db_path, '--invalidate', log_file])
+    extraction_cache.main()
+    assert "Dropped 1 entries." in capsys.readouterr().out
+
+    db_path = str(tmp_path / "conformers.sqlite")
+    with ConformerCache(db_path) as cache:
+        cache.put(cache.key('CCO', {}), 'CCO', *_ensemble())
+    monkeypatch.setattr('sys.argv', ['conformer_cache.py', db_path, '--clear'])
+    conformer_cache.main()
+    assert "'entries': 0" in capsys.readouterr().out
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+from rdkit import Chem
+from rdkit.Chem import AllChem
+from scipy.spatial.distance import cdist
+
+import descriptor_functions
+
+
+@pytest.fixture(scope="module")
+def geometry_df():
+    rdmol = Chem.AddHs(Chem.MolFromSmiles('CCCCOC(=O)c1ccccc1CCN(C)CC'))
+    AllChem.EmbedMolecule(rdmol, randomSeed=42)
+    df = pd.DataFrame(rdmol.GetConformer().GetPositions(), columns=list('XYZ'))
+    df['AN'] = [atom.GetAtomicNum() for atom in rdmol.GetAtoms()]
+    return df
+
+
+def _reference_occupied_volume(geometry_df, atom_idx, r, mesh_density=30) -> float:
+    """Occupied volume fraction over the full distance matrix, the original implementation."""
+
+    atom_r = geometry_df['AN'].map(descriptor_functions.GetVdwRad)
+    coords = geometry_df[list('XYZ')]
+    ticks = np.linspace(-r, r, mesh_density)
+    x, y, z = np.meshgrid(ticks, ticks, ticks)
+    mesh = np.vstack((x.ravel(), y.ravel(), z.ravel())).T
+    mesh = mesh[cdist(mesh, np.array([[0., 0., 0.]]), metric='sqeuclidean').ravel() < r ** 2]
+    mesh = mesh + coords.iloc[atom_idx].values
+    distances_sq = cdist(coords, mesh, metric='sqeuclidean')
+    return (distances_sq < atom_r.to_numpy()[:, np.newaxis] ** 2).any(axis=0).sum() / mesh.shape[0]
+
+
+def test_occupied_volumes_match_reference(geometry_df):
+    volumes = descriptor_functions.occupied_volumes(geometry_df, 3., mesh_density=20)
+    reference = [_reference_occupied_volume(geometry_df, i, 3., mesh_density=20) for i in range(len(geometry_df))]
+    np.testing.assert_allclose(volumes, reference, atol=1e-12)
+
+
+def test_occupied_volumes_blocks(geometry_df):
+    # a budget smaller than one block of 1024 points, and float32 distances
+    np.testing.assert_allclose(descriptor_functions.occupied_volumes(geometry_df, 3., memory_budget=1),
+                               descriptor_functions.occupied_volumes(geometry_df, 3.), atol=1e-12)
+    np.testing.assert_allclose(descriptor_functions.occupied_volumes(geometry_df, 3., dtype=np.float32),
+                               descriptor_functions.occupied_volumes(geometry_df, 3.), atol=1e-3)
+
+
+@pytest.mark.filterwarnings("ignore:invalid value encountered:RuntimeWarning")
+def test_occupied_volumes_empty_mesh(geometry_df):
+    # a single tick per axis lies outside the sphere, the original implementation gave NaN
+    assert len(descriptor_functions.sphere_mesh(3., 1)) == 0
+    assert np.isnan(descriptor_functions.occupied_volumes(geometry_df, 3., mesh_density=1)).all()
+    coordinates = geometry_df[list('XYZ')].to_numpy()[np.newaxis]
+    assert np.isnan(descriptor_functions.ensemble_occupied_volumes(coordinates, geometry_df['AN'], radii=(2., 3.),
+                                                                   mesh_density=1)).all()
+
+
+@pytest.mark.parametrize("max_points", [1, 2, 1 << 12])
+def test_occupied_volumes_qmc(geometry_df, max_points):
+    volumes, errors = descriptor_functions.occupied_volumes_qmc(geometry_df, 3., atom_indices=[0, 10],
+                                                                min_points=min(1 << 9, max_points),
+                                                                max_points=max_points)
+    assert ((volumes >= 0) & (volumes <= 1)).all()
+    if max_points == 1 << 12:
+        reference = descriptor_functions.occupied_volumes(geometry_df, 3., mesh_density=60, atom_indices=[0, 10])
+        assert (np.abs(volumes - reference) < 5 * errors + 0.01).all()
+
+
+@pytest.mark.parametrize("max_points", [0, -2, 3])
+def test_occupied_volumes_qmc_max_points(geometry_df, max_points):
+    with pytest.raises(ValueError):
+        descriptor_functions.occupied_volumes_qmc(geometry_df, 3., max_points=max_points)
+
+
+def test_ensemble_occupied_volumes(geometry_df):
+    rdmol = Chem.AddHs(Chem.MolFromSmiles('CCCCOC(=O)c1ccccc1CCN(C)CC'))
+    AllChem.EmbedMultipleConfs(rdmol, 3, randomSeed=1)
+    coordinates = np.array([conformer.GetPositions() for conformer in rdmol.GetConformers()])
+    radii = (3., 2., 4.)
+    volumes = descriptor_functions.ensemble_occupied_volumes(coordinates, geometry_df['AN'], radii=radii)
+    assert volumes.shape == (3, len(geometry_df), 3)
+
+    for conformer, coords in enumerate(coordinates):
+        df = pd.DataFrame(coords, columns=list('XYZ'))
+        df['AN'] = geometry_df['AN']
+        for k, r in enumerate(radii):
+            deviation = np.abs(volumes[conformer, :, k] - descriptor_functions.occupied_volumes(df, r)).max()
+            # the largest radius is exact, the smaller ones within the tolerance of the docstring
+            assert deviation < (1e-12 if r == max(radii) else 0.015)
@@ -0,0 +1,39 @@
+import logging
+
+import numpy as np
+import pytest
+
+from gaussian_log_extractor import GaussianLogExtractor
+from feature_store import features_to_tables, write_feature_store, read_feature_table
+
+
+@pytest.fixture
+def features(tmp_path, write_gaussian_log):
+    return {f"water_conf_{i}": GaussianLogExtractor(write_gaussian_log(tmp_path / f"water_conf_{i}.out", seed=i))
+            .get_descriptors() for i in range(2)}
+
+
+def test_feature_store_round_trip(tmp_path, features):
+    write_feature_store(features, str(tmp_path / "store"))
+    molecules = read_feature_table(str(tmp_path / "store"), 'molecules').to_pandas()
+    assert sorted(molecules['conformer']) == ['water_conf_0', 'water_conf_1']
+    assert molecules['stoichiometry'].tolist() == ['H2O', 'H2O']
+    assert molecules['E_scf'].dtype == np.float64
+
+    atoms = read_feature_table(str(tmp_path / "store"), 'atoms', molecules=['water'],
+                               columns=['conformer', 'atom_index', 'label', 'Mulliken_charge'])
+    atoms = atoms.to_pandas().sort_values(['conformer', 'atom_index'])
+    assert atoms['label'].tolist() == ['O', 'H', 'H'] * 2
+    np.testing.assert_allclose(atoms['Mulliken_charge'][:3],
+                               [float(q) for q in features['water_conf_0']['atom_descriptors']['Mulliken_charge']])
+
+    modes = read_feature_table(str(tmp_path / "store"), 'modes').to_pandas()
+    assert len(modes['displacements'][0]) == 9
+
+
+def test_feature_store_values_that_are_not_numbers(features, caplog):
+    features['water_conf_0']['atom_descriptors']['NPA_charge'][1] = '*****'
+    with caplog.at_level(logging.WARNING, logger='feature_store'):
+        atoms = features_to_tables(features)['atoms'].to_pandas()
+    assert np.isnan(atoms['NPA_charge'][1]) and not np.isnan(atoms['NPA_charge'][[0, 2]]).any()
+    assert "1 values of column NPA_charge of the atoms table" in caplog.text
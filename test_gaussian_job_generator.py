@@ -0,0 +1,79 @@
+import json
+import os
+import tarfile
+
+import pytest
+
+from molecule import Molecule
+from gaussian_job_generator import JobGenerator, BatchJobGenerator
+
+
+@pytest.fixture(scope="module")
+def molecules():
+    return [Molecule('CCOC', name='ether', num_conf=4, n_threads=1, random_seed=1),
+            Molecule('[Cs]Br', name='CsBr', num_conf=1, n_threads=1, random_seed=1)]
+
+
+def _read_directory(directory) -> dict:
+    files = {}
+    for file_name in os.listdir(directory):
+        with open(os.path.join(directory, file_name)) as f:
+            files[file_name] = f.read()
+    return files
+
+
+def _reference_files(molecule, directory) -> dict:
+    """Files written by the generator of a single molecule."""
+
+    generator = JobGenerator(molecule, 'equilibrium', os.path.join(directory, molecule.name), 'APFD', '6-31G(d,p)',
+                             'LANL2DZ', 'genecp', 36, '23:59:00')
+    generator.create_gaussian_files()
+    return _read_directory(os.path.join(directory, molecule.name))
+
+
+def test_batch_plain_files(tmp_path, molecules):
+    directory = str(tmp_path / "batch")
+    names = BatchJobGenerator(directory).create_gaussian_files(molecules, {'gaussian_config.json': '{}'})
+    assert names == ['ether', 'CsBr']
+
+    for molecule in molecules:
+        files = _read_directory(os.path.join(directory, molecule.name))
+        assert files.pop('gaussian_config.json') == '{}'
+        assert files == _reference_files(molecule, str(tmp_path / "single"))
+        assert len(files) == 2 * len(molecule.conformer_coordinates)
+    assert 'genecp' in files['CsBr_conf_0.gjf']
+
+    with open(os.path.join(directory, 'submit.sh')) as f, open(tmp_path / "single" / "submit.sh") as g:
+        assert f.read() == g.read()
+
+
+@pytest.mark.parametrize("archive", ['tar', 'tar.gz', 'tar.xz'])
+def test_batch_archives(tmp_path, molecules, archive):
+    BatchJobGenerator(str(tmp_path / "plain")).create_gaussian_files(molecules)
+    BatchJobGenerator(str(tmp_path / "archives"), archive=archive).create_gaussian_files(molecules)
+
+    assert sorted(os.listdir(tmp_path / "archives")) == sorted([f"ether.{archive}", f"CsBr.{archive}", 'submit.sh'])
+    for molecule in molecules:
+        with tarfile.open(tmp_path / "archives" / f"{molecule.name}.{archive}") as f:
+            members = {member.name: member for member in f.getmembers()}
+            files = {name: f.extractfile(member).read().decode() for name, member in members.items()}
+        assert files == {f"{molecule.name}/{file_name}": content for file_name, content in
+                         _read_directory(tmp_path / "plain" / molecule.name).items()}
+        assert all((member.mode == 0o755) == name.endswith('.sh') for name, member in members.items())
+    assert (tmp_path / "archives" / "submit.sh").read_text() == (tmp_path / "plain" / "submit.sh").read_text()
+
+
+def test_batch_screen(tmp_path, molecules):
+    molecule = Molecule('CCCCOC(=O)c1ccccc1', name='ester', num_conf=10, n_threads=1, random_seed=1)
+    BatchJobGenerator(str(tmp_path)).create_gaussian_files([molecule], screen={'energy_window': 1.})
+
+    files = _read_directory(tmp_path / "ester")
+    report = json.loads(files['conformer_screen.json'])
+    assert len(report['kept']) == len(molecule.conformer_coordinates)
+    assert sorted(file_name for file_name in files if file_name.endswith('.gjf')) == \
+        sorted(f"ester_conf_{i}.gjf" for i in range(len(report['kept'])))
+
+
+def test_batch_not_supported_archive(tmp_path):
+    with pytest.raises(ValueError):
+        BatchJobGenerator(str(tmp_path), archive='zip')
@@ -0,0 +1,197 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import gaussian_log_extractor
+from gaussian_log_extractor import GaussianLogExtractor, GaussianLogFollower, register_scalar_descriptor
+from gaussian_log_parser import LogIndex
+
+
+def _assert_equal(a, b, path=''):
+    """Deep equality of descriptors, nan equal to nan, same types."""
+
+    assert type(a) is type(b), (path, type(a), type(b))
+    if isinstance(a, dict):
+        assert a.keys() == b.keys(), (path, a.keys() ^ b.keys())
+        for key in a:
+            _assert_equal(a[key], b[key], f"{path}/{key}")
+    elif isinstance(a, (list, tuple)):
+        assert len(a) == len(b), (path, len(a), len(b))
+        for i, (x, y) in enumerate(zip(a, b)):
+            _assert_equal(x, y, f"{path}[{i}]")
+    elif isinstance(a, pd.DataFrame):
+        pd.testing.assert_frame_equal(a, b)
+    elif isinstance(a, np.ndarray):
+        np.testing.assert_array_equal(a, b)
+    elif isinstance(a, float) and np.isnan(a):
+        assert np.isnan(b), path
+    else:
+        assert a == b, (path, a, b)
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+@pytest.mark.parametrize("n_waters,n_steps", [(1, 3), (4, 7)])
+@pytest.mark.parametrize("engine,persist_index", [('stream', False), ('mmap', False), ('mmap', True)])
+def test_engines_match_regex(tmp_path, write_gaussian_log, n_waters, n_steps, engine, persist_index, newline):
+    # the reference is the regex engine on the log with LF line endings
+    reference = GaussianLogExtractor(write_gaussian_log(tmp_path / "lf" / "water_conf_0.out", n_waters,
+                                                        n_steps)).get_descriptors()
+    path = write_gaussian_log(tmp_path / "water_conf_0.out", n_waters, n_steps, newline=newline)
+    _assert_equal(GaussianLogExtractor(path).get_descriptors(), reference)
+    for _ in range(2 if persist_index else 1):
+        # the second extraction reads the persisted index
+        extractor = GaussianLogExtractor(path, engine=engine, persist_index=persist_index)
+        _assert_equal(extractor.get_descriptors(), reference)
+        extractor.close()
+    assert os.path.exists(LogIndex.path(path)) == persist_index
+
+
+@pytest.mark.parametrize("engine", ['regex', 'stream', 'mmap'])
+def test_engines_read_compressed_logs(tmp_path, write_gaussian_log, engine):
+    reference = GaussianLogExtractor(write_gaussian_log(tmp_path / "a" / "water_conf_0.out")).get_descriptors()
+    extractor = GaussianLogExtractor(write_gaussian_log(tmp_path / "b" / "water_conf_0.out.gz"), engine=engine)
+    assert extractor.engine == ('stream' if engine == 'mmap' else engine)
+    _assert_equal(extractor.get_descriptors(), reference)
+
+
+@pytest.mark.parametrize("engine", ['regex', 'stream', 'mmap'])
+def test_engines_trajectory_and_frames(tmp_path, write_gaussian_log, engine):
+    path = write_gaussian_log(tmp_path / "water_conf_0.out", 2, 5)
+    reference = GaussianLogExtractor(path)
+    extractor = GaussianLogExtractor(path, engine=engine)
+    _assert_equal(extractor.get_descriptors(as_frames=True), reference.get_descriptors(as_frames=True))
+    assert extractor.trajectory.coordinates.shape == (5, 6, 3)
+    np.testing.assert_array_equal(extractor.trajectory.coordinates, reference.trajectory.coordinates)
+    np.testing.assert_array_equal(extractor.trajectory.energies, reference.trajectory.energies)
+
+
+def test_not_supported_engine(tmp_path, write_gaussian_log):
+    with pytest.raises(ValueError):
+        GaussianLogExtractor(write_gaussian_log(tmp_path / "water_conf_0.out"), engine='sax')
+
+
+@pytest.fixture
+def registered_descriptors():
+    """Drop the descriptors registered by a test from the module level registry."""
+
+    scanners = [gaussian_log_extractor.freq_scalar_scanner, gaussian_log_extractor.td_scalar_scanner]
+    sizes = [len(scanner.desc_list) for scanner in scanners]
+    n_specs = len(gaussian_log_extractor.block_specs)
+    yield
+    for scanner, size in zip(scanners, sizes):
+        del scanner.desc_list[size:]
+        scanner._compile()
+    del gaussian_log_extractor.block_specs[n_specs:]
+
+
+@pytest.mark.parametrize("engine", ['regex', 'stream', 'mmap'])
+def test_register_scalar_descriptor(tmp_path, write_gaussian_log, registered_descriptors, engine):
+    register_scalar_descriptor('temperature', r"Temperature\s*")
+    register_scalar_descriptor('ES_root_charge', r"Charge=\s*", section='TD')
+    register_scalar_descriptor('pressure', r"Pressure in bar\s*")
+    register_scalar_descriptor('ES_root_pressure', r"Pressure in bar\s*", section='TD')
+    with pytest.raises(ValueError):
+        register_scalar_descriptor('temperature', r"Temperature\s*")
+
+    descriptors = GaussianLogExtractor(write_gaussian_log(tmp_path / "water_conf_0.out"),
+                                       engine=engine).get_descriptors()['descriptors']
+    assert descriptors['temperature'] == 298.15
+    assert descriptors['ES_root_charge'] == 0.
+    # values that are not in the log are None
+    assert descriptors['pressure'] is None and descriptors['ES_root_pressure'] is None
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+def test_follower(tmp_path, write_gaussian_log, newline):
+    with open(write_gaussian_log(tmp_path / "complete" / "water_conf_0.out", newline=newline), 'rb') as f:
+        text = f.read()
+    path = tmp_path / "water_conf_0.out"
+    follower = GaussianLogFollower(str(path))
+    assert follower.poll() == 0 and follower.task is None
+
+    def write_until(end):
+        with open(path, 'ab') as f:
+            f.write(text[path.stat().st_size if path.exists() else 0:end])
+        return follower.poll()
+
+    # a partial opt step: the orientation block and the last line are incomplete
+    cut = text.index(b"Rotational constants") + 5
+    write_until(cut)
+    assert follower.offset == text.rindex(b"\n", 0, cut) + 1
+    assert follower.task == 'opt' and follower.tracker.n_steps == 0
+
+    # a complete step, its lines are parsed once
+    write_until(text.index(b"\n", text.index(b"Predicted change")) + 1)
+    assert (follower.tracker.n_steps, len(follower.tracker.energies), len(follower.tracker.convergence)) == (1, 1, 1)
+    assert follower.poll() == 0
+    assert follower.tracker.n_steps == 1 and follower.tracker.converged == 0.5
+
+    # end of the opt task
+    write_until(text.index(b"\n", text.index(b"Normal termination")) + 1)
+    assert follower.tracker.n_steps == 3 and follower.n_tasks == 1 and follower.tracker.converged == 1.
+
+    # freq and TD tasks up to the termination
+    write_until(len(text))
+    assert follower.offset == len(text) and follower.n_tasks == 3 and follower.task == 'TD'
+    assert [task for task, _ in follower.tracker.tasks] == ['opt', 'freq', 'TD']
+    assert follower.tracker.n_steps == len(follower.tracker.energies) == 5
+    assert not follower.stalled(60)
+
+    trajectory = follower.extractor(engine='stream').trajectory
+    np.testing.assert_allclose(np.array(follower.tracker.geometries[:3]), trajectory.coordinates)
+    np.testing.assert_allclose(follower.tracker.energies[:3], trajectory.energies)
+
+    # a truncated log is followed again from its beginning
+    path.write_bytes(text[:cut])
+    follower.poll()
+    assert follower.n_tasks == 0 and follower.tracker.n_steps == 0
+
+
+@pytest.mark.parametrize("engine", ['regex', 'stream', 'mmap'])
+def test_get_descriptors_only(tmp_path, write_gaussian_log, engine):
+    extractor = GaussianLogExtractor(write_gaussian_log(tmp_path / "water_conf_0.out"), engine=engine)
+    reference = GaussianLogExtractor(write_gaussian_log(tmp_path / "reference.out")).get_descriptors()
+
+    descriptors = extractor.get_descriptors(only=['descriptors'])
+    assert list(descriptors) == ['descriptors']
+    _assert_equal(descriptors['descriptors'], reference['descriptors'])
+    # neither the buried volumes nor the vibrations are computed
+    assert 'vbur' not in extractor.__dict__ and 'vibrations' not in extractor.__dict__
+
+    modes = extractor.get_descriptors(only=['modes', 'labels'])
+    assert list(modes) == ['modes', 'labels']
+    _assert_equal(modes['modes'], reference['modes'])
+    assert 'vbur' not in extractor.__dict__
+
+    with pytest.raises(ValueError):
+        extractor.get_descriptors(only=['descriptors', 'energies'])
+
+
+@pytest.mark.parametrize("engine", ['regex', 'stream', 'mmap'])
+def test_invalidate(tmp_path, write_gaussian_log, engine):
+    path = tmp_path / "water_conf_0.out"
+    with open(write_gaussian_log(path), 'rb') as f:
+        text = f.read()
+    # the log of a job still running its TD task
+    separator = text.rindex(b"\n", 0, text.index(b" # TD"))
+    path.write_bytes(text[:text.rindex(b"\n", 0, separator) + 1])
+
+    extractor = GaussianLogExtractor(str(path), engine=engine)
+    assert extractor.n_tasks == 2 and extractor.transitions is None
+    geom = extractor.geom
+    extractor.vbur
+    extractor.invalidate('geom')
+    assert 'vbur' not in extractor.__dict__ and '_td_part' in extractor.__dict__
+    assert extractor.geom is not geom
+    pd.testing.assert_frame_equal(extractor.geom, geom)
+    with pytest.raises(ValueError):
+        extractor.invalidate('energies')
+
+    # the job finishes, invalidating all the attributes reads the log again
+    path.write_bytes(text)
+    extractor.invalidate()
+    assert extractor.n_tasks == 3
+    _assert_equal(extractor.get_descriptors(), GaussianLogExtractor(str(path)).get_descriptors())
+    extractor.close()
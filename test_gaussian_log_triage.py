@@ -0,0 +1,94 @@
+import gzip
+
+import pytest
+
+from helper_classes import slurm_status
+from gaussian_log_triage import triage_log, triage_directory
+
+
+def _task(route, body="", frequency=None, termination=" Normal termination of Gaussian 16 at Mon Jan  1.\n"):
+    text = " ----------------------------------------------------------------------\n"
+    text += f" # {route}\n"
+    text += " ----------------------------------------------------------------------\n"
+    text += body
+    if frequency is not None:
+        text += " Harmonic frequencies (cm**-1), IR intensities (KM/Mole), Raman scattering\n"
+        text += "                      1                      2                      3\n"
+        text += f" Frequencies --   {frequency:.4f}              1650.0000              3800.0000\n"
+    return text + termination
+
+
+def _log(tasks, padding=0):
+    return " Entering Gaussian System, Link 0=g16\n" + "".join(
+        _task(route, body=" SCF Done:  E(RAPFD) =  -76.3\n" * padding, **kwargs) for route, kwargs in tasks)
+
+
+equilibrium = [("opt=CalcFc APFD/6-31G(d,p)", {}), ("freq APFD/6-31G(d,p)", {'frequency': 1600.}),
+               ("TD(NStates=10, Root=1) APFD/6-31G(d,p)", {})]
+
+
+def _write(path, text, newline="\n", compress=False):
+    data = text.replace("\n", newline).encode()
+    if compress:
+        data = gzip.compress(data)
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+@pytest.mark.parametrize("compress", [False, True])
+def test_triage_done(tmp_path, newline, compress):
+    path = _write(tmp_path / "water_conf_0.out", _log(equilibrium), newline, compress)
+    record = triage_log(path, last_task='TD')
+    assert record['status'] == slurm_status.done
+    assert record['termination'] == 'normal'
+    assert record['last_task'] == 'TD'
+    assert record['lowest_frequency'] == 1600.
+
+
+def test_triage_imaginary_frequency(tmp_path):
+    tasks = equilibrium[:1] + [("freq APFD/6-31G(d,p)", {'frequency': -123.4567})] + equilibrium[2:]
+    record = triage_log(_write(tmp_path / "a.out", _log(tasks)))
+    assert record['status'] == slurm_status.incomplete
+    assert record['lowest_frequency'] == -123.4567
+
+
+def test_triage_missing_task(tmp_path):
+    record = triage_log(_write(tmp_path / "a.out", _log(equilibrium[:2])), last_task='TD')
+    assert record['status'] == slurm_status.incomplete
+    assert record['last_task'] == 'freq'
+
+
+@pytest.mark.parametrize("termination,status,link", [
+    (" Error termination via Lnk1e in /opt/g16/l9999.exe at Mon Jan  1.\n", slurm_status.incomplete, 9999),
+    (" Error termination via Lnk1e in /opt/g16/l502.exe at Mon Jan  1.\n", slurm_status.failed, 502),
+    (" SCF Done:  E(RAPFD) =  -76.3\n", slurm_status.incomplete, None)])
+def test_triage_unfinished(tmp_path, termination, status, link):
+    text = _log(equilibrium[:1]) + _task("freq APFD/6-31G(d,p)", termination=termination)
+    record = triage_log(_write(tmp_path / "a.out", text))
+    assert record['status'] == status
+    assert record['error_link'] == link
+
+
+def test_triage_search_budget(tmp_path):
+    # the frequency block is far from the end of the log, the route of the last task is not
+    text = _log(equilibrium[:2]) + " Leave Link  202\n" * 2000 + _task("TD(NStates=10, Root=1) APFD/6-31G(d,p)")
+    path = _write(tmp_path / "a.out", text)
+    assert triage_log(path, last_task='TD')['lowest_frequency'] == 1600.
+
+    record = triage_log(path, last_task='TD', tail_size=1 << 10, search_size=1 << 12, chunk_size=1 << 10)
+    assert record['last_task'] == 'TD'
+    assert record['lowest_frequency'] == 'unknown'
+    assert record['status'] == slurm_status.done
+
+    record = triage_log(path, last_task='TD', tail_size=1 << 7, search_size=1 << 7, chunk_size=1 << 6)
+    assert record['last_task'] == 'unknown'
+
+
+def test_triage_directory(tmp_path):
+    (tmp_path / "water").mkdir()
+    _write(tmp_path / "water" / "water_conf_0.out.gz", _log(equilibrium), compress=True)
+    _write(tmp_path / "water" / "water_conf_1.log", _log(equilibrium[:2]))
+    _write(tmp_path / "water" / "water_conf_1.gjf", "# opt\n\n--Link1--\n# freq\n\n--Link1--\n# TD\n")
+    table = triage_directory(str(tmp_path), n_workers=2)
+    assert table['status'].tolist() == ['done', 'incomplete']
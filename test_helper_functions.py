@@ -0,0 +1,12 @@
+import os
+
+import helper_functions
+
+
+def test_single_threaded_blas_environment(monkeypatch):
+    monkeypatch.setenv('OMP_NUM_THREADS', '4')
+    monkeypatch.delenv('MKL_NUM_THREADS', raising=False)
+    with helper_functions.single_threaded_blas_environment():
+        assert all(os.environ[variable] == '1' for variable in helper_functions.blas_thread_variables)
+    assert os.environ['OMP_NUM_THREADS'] == '4'
+    assert 'MKL_NUM_THREADS' not in os.environ
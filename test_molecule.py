@@ -0,0 +1,91 @@
+import pickle
+
+import numpy as np
+import pytest
+
+import helper_classes
+from conformer_cache import ConformerCache
+from molecule import Molecule
+
+
+@pytest.fixture(scope="module")
+def ester():
+    return Molecule('CCCCOC(=O)c1ccccc1CCN(C)CC', num_conf=30, n_threads=1, random_seed=3)
+
+
+def _with_conformers(molecule, conformer_coordinates) -> Molecule:
+    """Copy of a molecule with other conformers."""
+
+    molecule = pickle.loads(pickle.dumps(molecule))
+    molecule.conformer_coordinates = np.ascontiguousarray(conformer_coordinates, dtype=np.float32)
+    molecule._energies = None
+    return molecule
+
+
+def test_screen_conformers(ester):
+    molecule = _with_conformers(ester, ester.conformer_coordinates)
+    energies = molecule.energies.copy()
+    report = molecule.screen_conformers(energy_window=3., min_population=0.)
+
+    kept = report['kept']
+    assert len(molecule.conformer_coordinates) == len(kept) == molecule.mol.GetNumConformers()
+    assert all(energies[i] - energies.min() <= 3. for i in kept)
+    assert np.all(np.diff(molecule.energies) >= 0)
+    assert sorted(kept + report['dropped_energy'] + report['dropped_population'] + report['dropped_duplicate']) == \
+        list(range(len(energies)))
+    assert abs(sum(report['populations']) - 1.) < 1e-9
+
+
+def test_screen_conformers_populations_of_unique_conformers(ester):
+    # the lowest conformer repeated many times must not push the others below the population threshold
+    order = np.argsort(ester.energies)
+    lowest, other = order[0], order[1]
+    coordinates = np.concatenate([np.repeat(ester.conformer_coordinates[[lowest]], 20, axis=0),
+                                  ester.conformer_coordinates[[other]]])
+    molecule = _with_conformers(ester, coordinates)
+
+    relative = molecule.energies[-1] - molecule.energies.min()
+    weight = np.exp(-relative / (helper_classes.k_in_kcal_per_mol_K * helper_classes.T))
+    population_unique, population_copies = weight / (1 + weight), weight / (20 + weight)
+    min_population = (population_unique + population_copies) / 2
+    report = molecule.screen_conformers(energy_window=np.inf, min_population=min_population)
+
+    assert report['kept'][0] in range(20) and 20 in report['kept']
+    assert len(report['dropped_duplicate']) == 19
+    assert report['dropped_population'] == []
+    assert abs(report['populations'][20] - population_unique) < 1e-3
+
+
+def test_screen_conformers_report_without_energies(ester):
+    molecule = _with_conformers(ester, ester.conformer_coordinates[:3])
+    report = molecule.screen_conformers()
+    molecule = _with_conformers(ester, ester.conformer_coordinates[:3])
+    molecule._energies = np.full(3, np.nan)
+    report_without_energies = molecule.screen_conformers()
+
+    assert report_without_energies.keys() == report.keys()
+    assert report_without_energies['kept'] == [0, 1, 2]
+    assert len(molecule.conformer_coordinates) == 3
+
+
+def test_connectivity_matrix_is_cached(ester):
+    molecule = pickle.loads(pickle.dumps(ester))
+    connectivity_matrix = molecule.connectivity_matrix
+    assert molecule.connectivity_matrix is connectivity_matrix
+    assert not connectivity_matrix.flags.writeable
+    assert (connectivity_matrix > 0).sum() == 2 * len(molecule.bonds)
+    np.testing.assert_array_equal(pickle.loads(pickle.dumps(molecule)).connectivity_matrix, connectivity_matrix)
+    assert molecule.__getstate__().keys().isdisjoint(Molecule._lazy_slots)
+
+
+def test_conformer_cache_of_reproducible_ensembles(tmp_path):
+    db_path = str(tmp_path / "conformers.sqlite")
+    molecule = Molecule('CCO', num_conf=4, n_threads=1, random_seed=1, conformer_cache=db_path)
+    cached = Molecule('CCO', num_conf=4, n_threads=1, random_seed=1, conformer_cache=db_path)
+    np.testing.assert_array_equal(cached.conformer_coordinates, molecule.conformer_coordinates)
+
+    # without a seed, and with the open babel conformer search that cannot be seeded, nothing is cached
+    Molecule('CCO', num_conf=4, n_threads=1, conformer_cache=db_path)
+    Molecule('CCO', num_conf=2, engine='openbabel', conformer_cache=db_path)
+    with ConformerCache(db_path) as cache:
+        assert cache.stats()['entries'] == 1
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from rdkit import Chem
+from rdkit.Chem import AllChem
+
+import openbabel_utils
+from molecule import pybel
+
+
+def _conformers(smiles, num_conf=8, random_seed=7) -> list:
+    """OBMols of RDKit conformers, each followed by a copy of it perturbed by random displacements of increasing \
+    size, which lie on both sides of typical RMSD thresholds."""
+
+    rdmol = Chem.AddHs(Chem.MolFromSmiles(smiles))
+    AllChem.EmbedMultipleConfs(rdmol, num_conf, randomSeed=random_seed)
+    rng = np.random.default_rng(random_seed)
+    mols = []
+    for k, conformer in enumerate(rdmol.GetConformers()):
+        mol = openbabel_utils.input_to_OBMol(Chem.MolToMolBlock(rdmol, confId=conformer.GetId()), "string", "mol")
+        perturbed = pybel.ob.OBMol(mol)
+        for atom in pybel.ob.OBMolAtomIter(perturbed):
+            dx, dy, dz = rng.normal(scale=0.02 * (k + 1), size=3)
+            atom.SetVector(atom.GetX() + dx, atom.GetY() + dy, atom.GetZ() + dz)
+        mols += [mol, perturbed]
+    return mols
+
+
+def _reference_duplicates(mols, RMSD_threshold, symmetry) -> list:
+    """Alignment of all pairs of molecules with OBAlign, the original implementation."""
+
+    alignment = pybel.ob.OBAlign(True, symmetry)
+    duplicate_indices = []
+    for i in range(len(mols) - 1):
+        alignment.SetRefMol(mols[i])
+        for j in range(i + 1, len(mols)):
+            alignment.SetTargetMol(mols[j])
+            alignment.Align()
+            if alignment.GetRMSD() < RMSD_threshold and i not in duplicate_indices:
+                duplicate_indices.append(j)
+    return sorted(set(duplicate_indices))
+
+
+@pytest.fixture(scope="module")
+def conformers():
+    return _conformers('CCOC(=O)c1ccccc1N')
+
+
+@pytest.mark.parametrize("symmetry", [True, False])
+@pytest.mark.parametrize("RMSD_threshold", [0.05, 0.1, 0.2, 0.5, 1.])
+def test_deduplicate_list_of_OBMols_matches_reference(conformers, RMSD_threshold, symmetry):
+    duplicates = openbabel_utils.deduplicate_list_of_OBMols(conformers, RMSD_threshold, symmetry)
+    assert duplicates == _reference_duplicates(conformers, RMSD_threshold, symmetry)
+
+
+def test_deduplicate_list_of_OBMols_near_threshold(conformers):
+    alignment = pybel.ob.OBAlign(True, True)
+    rmsds = []
+    for i in range(0, len(conformers), 2):
+        alignment.SetRefMol(conformers[i])
+        alignment.SetTargetMol(conformers[i + 1])
+        alignment.Align()
+        rmsds.append(alignment.GetRMSD())
+
+    # thresholds just above and just below the RMSD of each perturbed copy to its conformer
+    for i, rmsd in enumerate(rmsds):
+        for RMSD_threshold in (rmsd * (1 + 1e-6), rmsd * (1 - 1e-6)):
+            duplicates = openbabel_utils.deduplicate_list_of_OBMols(conformers, RMSD_threshold, True)
+            assert duplicates == _reference_duplicates(conformers, RMSD_threshold, True)
+            assert (2 * i + 1 in duplicates) == (RMSD_threshold > rmsd) or 2 * i in duplicates
+
+
+def test_deduplicate_list_of_OBMols_trivial(conformers):
+    assert openbabel_utils.deduplicate_list_of_OBMols(conformers[:1], 0.5, True) == []
@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+from rdkit import Chem
+from rdkit.Chem import AllChem
+
+import rdkit_utils
+
+
+def _embed(smiles, num_conf=20, random_seed=42) -> Chem.Mol:
+    rdmol = Chem.AddHs(Chem.MolFromSmiles(smiles))
+    AllChem.EmbedMultipleConfs(rdmol, num_conf, randomSeed=random_seed)
+    return rdmol
+
+
+def _reference_rmsd_matrix(rdmol) -> np.ndarray:
+    """Heavy atom RMSDs of all pairs of conformers with RDKit AlignMolConformers, the original implementation."""
+
+    atom_ids = [atom.GetIdx() for atom in rdmol.GetAtoms() if atom.GetAtomicNum() != 1]
+    rmsds = []
+    conformers = list(rdmol.GetConformers())
+    for ref_conformer in conformers:
+        ref_mol = Chem.Mol(rdmol)
+        ref_mol.RemoveAllConformers()
+        ref_mol.AddConformer(ref_conformer, assignId=True)
+        for conformer in conformers:
+            ref_mol.AddConformer(conformer, assignId=True)
+        rmsds_row = []
+        AllChem.AlignMolConformers(ref_mol, atomIds=atom_ids, RMSlist=rmsds_row)
+        rmsds.append(rmsds_row)
+    return np.array(rmsds)
+
+
+def _reference_prune(rmsds, thres) -> list:
+    """Greedy pruning over the full RMSD matrix, the original implementation."""
+
+    candidates = np.arange(len(rmsds))
+    keep_list = []
+    while len(rmsds) > 0:
+        keep_list.append(int(candidates[0]))
+        mask = rmsds[0] > thres
+        candidates = candidates[mask]
+        rmsds = rmsds[mask, :][:, mask]
+    return keep_list
+
+
+@pytest.fixture(scope="module")
+def flexible_mol():
+    return _embed('CCCCOC(=O)c1ccccc1CCN(C)CC')
+
+
+def test_rmsd_matrix_matches_align_mol_conformers(flexible_mol):
+    np.testing.assert_allclose(rdkit_utils.get_rmsd_rdkit(flexible_mol), _reference_rmsd_matrix(flexible_mol),
+                               atol=1e-6)
+
+
+def test_rmsd_matrix_blocks(flexible_mol):
+    np.testing.assert_allclose(rdkit_utils.get_rmsd_rdkit(flexible_mol, block_size=3),
+                               rdkit_utils.get_rmsd_rdkit(flexible_mol), atol=1e-10)
+
+
+@pytest.mark.parametrize("thres", [0.3, 0.8, 1.5])
+def test_prune_rmsds_matches_full_matrix(flexible_mol, thres):
+    assert rdkit_utils.prune_rmsds(flexible_mol, thres) == _reference_prune(_reference_rmsd_matrix(flexible_mol),
+                                                                              thres)
+
+
+def test_prune_rmsds_energy_order(flexible_mol):
+    energies = np.arange(flexible_mol.GetNumConformers())[::-1]
+    keep_list = rdkit_utils.prune_rmsds(flexible_mol, 0.8, energies=energies)
+    assert keep_list[0] == flexible_mol.GetNumConformers() - 1
+    assert len(keep_list) == len(rdkit_utils.prune_rmsds(flexible_mol, 0.8, energies=energies, block_size=2))
+
+
+def test_prune_rmsds_symmetry():
+    # the conformers of neopentane differ by the permutation of the methyls only
+    rdmol = _embed('CC(C)(C)C')
+    assert rdkit_utils.prune_rmsds(rdmol, 0.1, use_symmetry=True) == [0]
+    assert len(rdkit_utils.symmetry_permutations(rdmol)) == 24
+
+
+@pytest.mark.parametrize("smiles", ['[2H]OC(=O)CC', '[2H]C([2H])([2H])C(=O)O', '[H][H]', 'O', '[Li]Br'])
+def test_symmetry_permutations_atoms_of_the_rmsds(smiles):
+    rdmol = _embed(smiles, num_conf=5)
+    permutations = rdkit_utils.symmetry_permutations(rdmol)
+    assert permutations.shape[1] == len(rdkit_utils._rmsd_atom_ids(rdmol))
+    keep_list = rdkit_utils.prune_rmsds(rdmol, 0.1, use_symmetry=True)
+    assert keep_list and keep_list[0] == 0
+
+
+def test_generate_conformations_adaptively_deuterated():
+    elements, conformer_coordinates, _, _, statistics = rdkit_utils.generate_conformations_adaptively(
+        '[2H]OC(=O)CCC', max_conf=20, n_threads=1, random_seed=7, round_size=10)
+    assert len(conformer_coordinates) >= 1
+    assert statistics[-1]['stop'] is not None
+
+
+def test_generate_conformations_adaptively_rigid_converges():
+    *_, statistics = rdkit_utils.generate_conformations_adaptively('C12CCN(CC2)CC1', max_conf=200, n_threads=1,
+                                                                   random_seed=7, round_size=20)
+    assert statistics[-1]['stop'] == 'converged'
+    assert statistics[-1]['n_unique'] == 1
+    assert sum(s['n_embedded'] for s in statistics) < 200
+
+
+def test_generate_conformations_adaptively_empty_rounds(monkeypatch):
+    embed = AllChem.EmbedMultipleConfs
+    calls = []
+
+    def fail_first_round(mol, num_conf, params):
+        calls.append(num_conf)
+        return [] if len(calls) == 1 else embed(mol, num_conf, params)
+
+    monkeypatch.setattr(AllChem, 'EmbedMultipleConfs', fail_first_round)
+    *_, statistics = rdkit_utils.generate_conformations_adaptively('C12CCN(CC2)CC1', max_conf=100, n_threads=1,
+                                                                   random_seed=7, round_size=20)
+    assert statistics[0]['stop'] is None
+    assert statistics[-1]['n_unique'] == 1
+
+    monkeypatch.setattr(AllChem, 'EmbedMultipleConfs', lambda mol, num_conf, params: [])
+    with pytest.raises(ValueError):
+        rdkit_utils.generate_conformations_adaptively('C12CCN(CC2)CC1', max_conf=40, n_threads=1, round_size=20)